@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,6 +81,32 @@ DATABASES = {
     }
 }
 
+# Opt-in SQLite tuning for heavy scraping (set SQLITE_TUNING=1 in the environment/.env).
+# WAL lets readers carry on while a batch is written, synchronous=NORMAL is safe
+# with WAL, busy_timeout/timeout make writers wait for the lock instead of failing
+# and mmap serves reads straight from the page cache. Note WAL mode sticks to the
+# database file once set.
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', '0') == '1'
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+# Per process: run_shards gives each bot process a longer wait, several of them write
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+# scrape_worker processes always use these, see prices/worker.py
+SQLITE_TUNING_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};'
+        f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+    ),
+    'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+    # Take the write lock when a transaction starts, not halfway through it
+    'transaction_mode': 'IMMEDIATE',
+}
+
+if SQLITE_TUNING:
+    DATABASES['default']['OPTIONS'] = dict(SQLITE_TUNING_OPTIONS)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,3 +148,182 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Scraper
+
+# Number of pooled browser contexts/pages shared by all scrapes
+SCRAPER_BROWSER_POOL_SIZE = 4
+
+# A pooled page is thrown away and recreated after this many navigations
+SCRAPER_PAGE_MAX_USES = 50
+
+# Default number of listings scraped at once by scrape_bulk; anything above the
+# browser pool size just waits for a free page
+SCRAPER_BULK_CONCURRENCY = 4
+
+# Max requests per second sent to any single domain during bulk scrapes
+SCRAPER_BULK_DOMAIN_RATE = 2.0
+
+# Try a plain HTTP fetch + HTML parse before falling back to a browser page
+SCRAPER_HTTP_FAST_PATH = True
+
+# Abort images, fonts, media and third-party scripts on pooled browser pages
+SCRAPER_BLOCK_RESOURCES = True
+
+# Search results scraping (prices/search.py): results pages followed per search
+# (also the most !scrape_search accepts), and results requested per page (eBay
+# serves at most 240)
+SCRAPER_SEARCH_MAX_PAGES = 5
+SCRAPER_SEARCH_PAGE_SIZE = 240
+
+# Fail-fast scraping (prices/resilience.py). Browser/HTTP waits get
+# SCRAPER_TIMEOUT_MULTIPLIER x the p95 of recently observed durations, kept
+# within these bounds in seconds
+SCRAPER_TIMEOUT_MIN = 2.0
+SCRAPER_TIMEOUT_MAX = 30.0
+SCRAPER_TIMEOUT_MULTIPLIER = 3.0
+# Network errors and timeouts are retried this many times, with jittered
+# exponential backoff starting around SCRAPER_RETRY_BASE_DELAY seconds
+SCRAPER_RETRIES = 2
+SCRAPER_RETRY_BASE_DELAY = 1.0
+SCRAPER_RETRY_MAX_DELAY = 30.0
+# After this many blocked/timed-out/network failures in a row a domain's scrapes
+# fail immediately for SCRAPER_BREAKER_COOLDOWN seconds (doubling while it
+# keeps failing, up to the max)
+SCRAPER_BREAKER_FAILURES = 5
+SCRAPER_BREAKER_COOLDOWN = 30.0
+SCRAPER_BREAKER_MAX_COOLDOWN = 600.0
+
+# Out-of-process scraping (set SCRAPE_WORKERS=1 in the environment/.env): the
+# bot queues !scrape and !scrape_bulk as ScrapeJob rows for `manage.py
+# scrape_worker` processes, each with its own browser, and posts the results
+SCRAPE_WORKERS_ENABLED = os.getenv('SCRAPE_WORKERS', '0') == '1'
+# Worker processes started by scrape_worker (None: one per CPU core) and jobs
+# each one scrapes at the same time (None: SCRAPER_BROWSER_POOL_SIZE)
+SCRAPE_WORKER_PROCESSES = None
+SCRAPE_WORKER_CONCURRENCY = None
+SCRAPE_WORKER_POLL_INTERVAL = 1.0
+# A worker that can't get at the database (locked for longer than the busy
+# timeout) waits this long before leasing again, doubling up to the maximum
+SCRAPE_WORKER_DB_RETRY_DELAY = 1.0
+SCRAPE_WORKER_DB_MAX_RETRY_DELAY = 30.0
+# A job a worker hasn't finished within the lease goes back to the queue (the
+# worker probably died); after SCRAPE_JOB_MAX_ATTEMPTS pickups it fails for good
+SCRAPE_JOB_LEASE_SECONDS = 300
+SCRAPE_JOB_MAX_ATTEMPTS = 3
+# Base delay before a job that failed with a network error/timeout is retried
+SCRAPE_JOB_RETRY_DELAY = 30
+# How often the bot looks for finished jobs, and how long reported ones are kept
+SCRAPE_JOB_POLL_INTERVAL = 1.0
+SCRAPE_JOB_KEEP_DAYS = 7
+
+# Scraped (name, price) per eBay item ID is reused for this many seconds, so
+# several users scraping the same listing cost one scrape
+SCRAPER_RESULT_CACHE_TTL = 120
+SCRAPER_RESULT_CACHE_SIZE = 2048
+
+# Scraper stage metrics (prices/metrics.py): every process publishes its
+# snapshot here every METRICS_PUBLISH_INTERVAL seconds, /metrics merges them.
+# Snapshots not rewritten for METRICS_MAX_AGE seconds are from processes that
+# have exited and get deleted
+METRICS_DIR = os.getenv('POKEVIN_METRICS_DIR', BASE_DIR / 'metrics')
+METRICS_PUBLISH_INTERVAL = 15
+METRICS_MAX_AGE = 3600
+
+# /metrics and the per-user /api/wishlists/<id> are private: they need staff
+# logged in to the admin, or "Authorization: Bearer <API_TOKEN>". Unset: staff only
+API_TOKEN = os.getenv('POKEVIN_API_TOKEN', '')
+
+# Listing titles resolved to a catalog card with at least this confidence
+# (prices/resolver.py) match only that card's wishlist entries
+CARD_RESOLVER_MIN_CONFIDENCE = 0.6
+
+# The bot's warm state (resolver and matcher indexes, card API cache, DM
+# channel IDs) is written here on shutdown and reused on the next start
+# (prices/snapshot.py). Set to '' to always start cold
+BOT_SNAPSHOT_PATH = os.getenv('POKEVIN_SNAPSHOT_PATH', BASE_DIR / 'warm-state.pickle')
+
+# Sharded bot (prices/shards.py). BOT_SHARD_COUNT alone runs every shard in
+# one AutoShardedBot ('auto': as many as Discord recommends); `manage.py
+# run_shards` also sets BOT_SHARD_IDS, this process's share, for each of the
+# bot processes it starts. Unset: a plain single-connection bot
+BOT_SHARD_COUNT = os.getenv('BOT_SHARD_COUNT', '')
+BOT_SHARD_IDS = os.getenv('BOT_SHARD_IDS', '')
+# The launcher's IPC hub the bot processes relay notifications and wishlist
+# changes through
+BOT_IPC_HOST = '127.0.0.1'
+BOT_IPC_PORT = int(os.getenv('BOT_IPC_PORT', '8790'))
+# Bot processes run_shards starts by default, and the busy timeout each one's
+# database connection waits for the write lock
+BOT_SHARD_PROCESSES = 2
+BOT_SHARD_BUSY_TIMEOUT_MS = 15000
+# Where the bot finds Discord's API and gateway, e.g. http://127.0.0.1:8780
+# for `manage.py fake_gateway` (prices/fake_gateway.py). Unset: Discord
+DISCORD_API_BASE = os.getenv('DISCORD_API_BASE', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # JSON price API responses and their version stamps (prices/price_cache.py).
+    # File-based so the bot's price writes expire what the web process serves.
+    # Entries are pickles, so the directory must only be writable by the project
+    'prices': {
+        'BACKEND': 'prices.price_cache.PriceCache',
+        'LOCATION': os.getenv('POKEVIN_CACHE_DIR', BASE_DIR / 'cache'),
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+PRICE_API_CACHE = 'prices'
+
+# Seconds the admin price dashboard's aggregates are cached (prices/dashboard.py)
+DASHBOARD_CACHE_SECONDS = 600
+
+# Shared aiohttp connection pool
+HTTP_POOL_SIZE = 20
+HTTP_POOL_SIZE_PER_HOST = 8
+HTTP_TIMEOUT = 15
+
+# Cached JSON API responses (pokemontcg.io lookups), entries expire after HTTP_CACHE_TTL seconds
+HTTP_CACHE_SIZE = 1024
+HTTP_CACHE_TTL = 600
+
+# Watched listings (prices/watcher.py): global scrape budget shared by every watch
+SCRAPER_WATCH_BUDGET_PER_MINUTE = 30
+SCRAPER_WATCH_CONCURRENCY = 2
+# Adaptive re-check interval bounds in seconds, new watches start at the default
+SCRAPER_WATCH_MIN_INTERVAL = 300
+SCRAPER_WATCH_MAX_INTERVAL = 6 * 3600
+SCRAPER_WATCH_DEFAULT_INTERVAL = 3600
+# Relative price move that counts as "the price changed" (halves the interval)
+SCRAPER_WATCH_CHANGE_THRESHOLD = 0.01
+# +/- fraction of random jitter applied to every interval
+SCRAPER_WATCH_JITTER = 0.1
+
+
+# Write-behind price saves (prices/writer.py): flush when this many are waiting...
+PRICE_WRITE_BATCH_SIZE = 200
+# ...or after this many seconds, whichever comes first
+PRICE_WRITE_FLUSH_INTERVAL = 1.0
+
+
+# Price history retention (manage.py compact_prices)
+
+# Raw observations older than this are dropped, their hourly/daily rollups stay
+PRICE_RAW_RETENTION_DAYS = 30
+
+# Hourly rollups older than this are dropped, daily rollups are kept forever
+PRICE_HOURLY_RETENTION_DAYS = 365
+
+
+# Outbound DM notifications (prices/notifications.py)
+NOTIFY_WORKERS = 4
+# Matches for the same user within this many seconds are sent as one digest
+NOTIFY_COALESCE_SECONDS = 2.0
+NOTIFY_MAX_RETRIES = 5
+# Token buckets: messages/second across the bot, and per DM channel (with a small burst)
+NOTIFY_GLOBAL_RATE = 40
+NOTIFY_PER_USER_RATE = 1.0
+NOTIFY_PER_USER_BURST = 5
@@ -1,17 +1,24 @@
+import time
+STARTED_AT = time.monotonic()  # on_ready reports the time to ready from here
+
 from dotenv import load_dotenv
 import os
 import django
 from asgiref.sync import sync_to_async
-import aiohttp
 import asyncio
+import io
 import random
-import urllib.parse
-import requests
 import re
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
 
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 
+POKEMONTCG_API_URL = "https://api.pokemontcg.io/v2"
+# Optional, raises the pokemontcg.io rate limit
+POKEMONTCG_HEADERS = {'X-Api-Key': os.getenv('POKEMONTCG_API_KEY')} if os.getenv('POKEMONTCG_API_KEY') else {}
+
 # Set the default settings module for the 'django' program
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PokeVin_Backend.settings')
 
@@ -20,49 +27,295 @@ django.setup()
 
 import discord
 from discord.ext import commands
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from prices.models import PokemonPrice, WishlistItem
-from prices.scraper import scrape_and_update_cards, normalize_scraped_data, scrape_and_get_name_price
+from django.utils import timezone
+from prices.models import PokemonPrice, WishlistItem, ScrapeJob
+from prices.scraper import scrape_and_update_cards, scrape_and_get_name_price, clean_price, scrape_cache_stats
+from prices.listing_parser import canonical_listing_url
+from prices.browser_pool import browser_pool
+from prices.http_client import http_client
+from prices.writer import price_writer
+from prices.bulk import scrape_bulk, read_urls
+from prices.search import scrape_search
+from prices.catalog import find_cards_by_name, find_card_by_id
+from prices.matcher import wishlist_matcher
+from prices.resolver import card_resolver
+from prices.price_cache import invalidate_wishlist
+from prices.alerts import alert_engine
+from prices.watcher import watch_scheduler, add_watch, remove_watch
+from prices.cache import TTLCache
+from prices.notifications import NotificationDispatcher, NotificationError
+from prices.metrics import metrics, publish, publish_periodically
+from prices.resilience import breakers
+from prices.jobs import enqueue_jobs, take_finished_jobs, queue_stats
+from prices.transfer import export_rows, format_for, import_wishlist
+from prices.snapshot import read_snapshot, write_snapshot, warm_resolver, warm_matcher, restore_cache
+from prices.shards import ShardConfig, ShardLink, PRIMARY, use_discord_api
+IMPORTED_AT = time.monotonic()
+
+# One process connecting every shard, or this process's share of them when
+# started by `manage.py run_shards` (see prices/shards.py)
+shard_config = ShardConfig()
+if getattr(settings, 'DISCORD_API_BASE', ''):
+    # e.g. `manage.py fake_gateway`, to run the bot locally
+    use_discord_api(settings.DISCORD_API_BASE)
 
 intents = discord.Intents.default()
 intents.message_content = True  # Required to read message text
 intents.members = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+
+
+class PokeVinBot(commands.AutoShardedBot if shard_config.sharded else commands.Bot):
+    watch_task = None
+    metrics_task = None
+    jobs_task = None
+    browser_task = None
+    catalog_fingerprint = None  # Of the catalog the resolver was built from, None until it is
+    warm_seconds = None
+    warm_from_snapshot = False
+    ready_seconds = None
+    shard_link = None  # To the sibling bot processes, when there are any
+
+    async def setup_hook(self):
+        if getattr(settings, 'SCRAPE_WORKERS_ENABLED', False):
+            # !scrape runs in `manage.py scrape_worker` processes, this reports their
+            # results (from the primary only, any process can post to any channel)
+            if shard_config.primary:
+                self.jobs_task = asyncio.create_task(deliver_job_results())
+        else:
+            # Launch the shared browser once, every !scrape reuses its pages. In
+            # the background: the bot can go online meanwhile, a !scrape arriving
+            # before it's up waits for it
+            self.browser_task = asyncio.create_task(start_browser())
+        if shard_config.multi_process:
+            # Connected before warming up, so no wishlist change falls in between
+            self.shard_link = ShardLink(shard_config)
+            self.shard_link.on('notify', on_forwarded_notification)
+            self.shard_link.on('undeliverable', lambda message: on_forwarded_notification(message['message']))
+            self.shard_link.on('wishlist', on_wishlist_changed)
+            self.shard_link.on('reconnected', on_shard_link_reconnected)
+            self.shard_link.start()
+        await self.warm_up()
+        # Re-scrapes watched listings in the background for as long as the bot
+        # runs (in every bot process: they lease due listings from the database)
+        watch_scheduler.on_result = notify_watched_listing
+        self.watch_task = asyncio.create_task(watch_scheduler.run())
+        await notifications.start()
+        # Scraper timings for the /metrics endpoint
+        self.metrics_task = asyncio.create_task(publish_periodically(shard_config.process_name))
+
+    async def warm_up(self):
+        # In-memory state, from the last shutdown's snapshot where it's still valid
+        started = time.monotonic()
+        snapshot = await sync_to_async(read_snapshot)()
+        # Titles are resolved to catalog cards first, matched by substring only as a fallback
+        self.catalog_fingerprint, reused = await sync_to_async(warm_resolver)(card_resolver, snapshot)
+        print(f"Card resolver indexed {len(card_resolver)} catalog cards{' (from snapshot)' if reused else ''}")
+        # Build the all-users matcher once, add/remove/clear keep it up to date
+        items = await get_all_wishlist_items()
+        indexed = warm_matcher(wishlist_matcher, snapshot, items)
+        alert_engine.load(items)
+        print(f"Wishlist matcher loaded with {len(wishlist_matcher)} items ({indexed} indexed)")
+        restore_cache(http_client.cache, snapshot, 'card_api_cache')
+        restore_cache(dm_channel_ids, snapshot, 'dm_channel_ids')
+        self.warm_seconds = time.monotonic() - started
+        self.warm_from_snapshot = snapshot is not None
+
+    def warm_state(self):
+        return {
+            'catalog': self.catalog_fingerprint,
+            'resolver': card_resolver.dump_state(),
+            'matcher': wishlist_matcher.dump_state(),
+            'card_api_cache': http_client.cache.dump(),
+            'dm_channel_ids': dm_channel_ids.dump(),
+        }
+
+    async def close(self):
+        if self.jobs_task is not None:
+            self.jobs_task.cancel()
+        if self.shard_link is not None:
+            await self.shard_link.close()
+        await notifications.stop()
+        watch_scheduler.stop()
+        if self.watch_task is not None:
+            await self.watch_task
+        if self.browser_task is not None:
+            await self.browser_task
+        await browser_pool.stop()
+        await http_client.close()
+        # Write out any prices still buffered
+        await price_writer.close()
+        if self.metrics_task is not None:
+            self.metrics_task.cancel()
+        publish(shard_config.process_name)
+        if self.catalog_fingerprint is not None and wishlist_matcher.loaded:
+            await sync_to_async(write_snapshot)(self.warm_state())
+        await super().close()
+
+
+async def start_browser():
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        # BrowserPool.page() launches it when a scrape needs it
+        print(f"Couldn't launch the browser, retrying on the first scrape: {e}")
+
+
+bot = PokeVinBot(command_prefix='!', intents=intents, **shard_config.bot_options())
 
 @bot.event
 async def on_ready():
-    print(f'Bot is online as {bot.user}')
+    if bot.ready_seconds is None:  # on_ready fires again after reconnects
+        bot.ready_seconds = time.monotonic() - STARTED_AT
+        metrics.observe('pokevin_bot_time_to_ready_seconds', bot.ready_seconds)
+        print(
+            f"Bot is online as {bot.user}, ready in {bot.ready_seconds:.2f}s (imports {IMPORTED_AT - STARTED_AT:.2f}s, "
+            f"warm-up {bot.warm_seconds:.2f}s {'from snapshot' if bot.warm_from_snapshot else 'cold'})"
+            + (f", shards {sorted(bot.shards)} of {bot.shard_count}" if shard_config.sharded else "")
+        )
+    else:
+        print(f'Bot is online as {bot.user}')
+
+WISHLIST_FIELDS = ('id', 'discord_user_id', 'pokemon_name', 'set_name', 'card_id', 'max_price')
 
 @sync_to_async
 def get_all_wishlist_items():
-    return list(WishlistItem.objects.all())
+    return list(WishlistItem.objects.values(*WISHLIST_FIELDS))
+
+@sync_to_async
+def get_wishlist_items_of(user_id):
+    return list(WishlistItem.objects.filter(discord_user_id=user_id).values(*WISHLIST_FIELDS))
 
-async def check_against_wishlist(scraped_name, user_id):
-    wishlist = await get_user_wishlist(user_id)
 
-    normalized_title = normalize_scraped_data(scraped_name)
+def wishlist_changed(user_id):
+    # The other bot processes re-read this user's wishlist into their matcher
+    if bot.shard_link is not None:
+        bot.shard_link.send('wishlist', user_id=user_id)
 
-    matches = []
-    for item in wishlist:
-        name_match = normalize_scraped_data(item['pokemon_name']) in normalized_title
-        set_keywords = [normalize_scraped_data(word) for word in item['set_name'].split()]
-        set_match = all(kw in normalized_title for kw in set_keywords if len(kw) > 3)
+async def on_wishlist_changed(message):
+    user_id = message['user_id']
+    items = await get_wishlist_items_of(user_id)
+    wishlist_matcher.clear_user(user_id)
+    alert_engine.clear_user(user_id)
+    for item in items:
+        wishlist_matcher.add(item['id'], user_id, item['pokemon_name'], item['set_name'], item['card_id'])
+        alert_engine.set_threshold(user_id, item['card_id'], item['max_price'])
 
-        # Try to match the numeric part of the card_id, e.g. SM96
-        id_match = re.search(r'(\d+)$', item['card_id'])
-        id_part = id_match.group(1) if id_match else ''
-        id_match_found = id_part and id_part.lower() in normalized_title
+async def on_shard_link_reconnected(message):
+    # Wishlist changes broadcast while the link was down never arrived
+    items = await get_all_wishlist_items()
+    wishlist_matcher.sync(items)
+    alert_engine.load(items)
 
-        if name_match and (set_match or id_match_found):
-            matches.append(item)
+async def check_against_wishlist(scraped_name, user_id=None):
+    # Every user's matching entries, or just `user_id`'s
+    return wishlist_matcher.match(scraped_name, user_id)
 
-    return matches
+
+# DM channel IDs by user, so repeat notifications skip fetch_user/create_dm
+dm_channel_ids = TTLCache(maxsize=50000, ttl=24 * 3600)
+
+
+async def send_dm(user_id, content):
+    channel_id = dm_channel_ids.get(user_id)
+    try:
+        if channel_id is None:
+            user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+            channel_id = (await user.create_dm()).id
+            dm_channel_ids.set(user_id, channel_id)
+        await bot.get_partial_messageable(channel_id, type=discord.ChannelType.private).send(content)
+    except (discord.Forbidden, discord.NotFound) as e:
+        # DMs closed or user gone, retrying won't help
+        dm_channel_ids.pop(user_id)
+        raise NotificationError(str(e))
+    except discord.HTTPException as e:
+        raise NotificationError(str(e), retryable=e.status == 429 or e.status >= 500)
+
+
+notifications = NotificationDispatcher(send_dm)
+
+
+def queue_notification(user_id, text):
+    # The primary process sends every DM, so rate limits and per-user batching
+    # see all of them; the others hand theirs over, or send them themselves
+    # while it's unreachable
+    if bot.shard_link is None or not bot.shard_link.send('notify', to=PRIMARY, user_id=user_id, text=text):
+        notifications.notify(user_id, text)
+
+
+async def on_forwarded_notification(message):
+    notifications.notify(message['user_id'], message['text'])
+
+
+def format_wishlist_match(name, price, url, matched_items):
+    return (
+        f"📢 This eBay listing matches one or more cards in your wishlist!\n"
+        f"**Title:** {name}\n"
+        f"**Price:** ${price:.2f}\n"
+        f"**Link:** {url}\n"
+        f"\n**Matched Wishlist Entries:**\n" +
+        "\n".join(
+            f"- {m['pokemon_name']} (Set: {m['set_name']}, ID: {m['card_id']})"
+            + (f", at or below your max of ${m['max_price']:.2f}" if m.get('max_price') is not None else "")
+            for m in matched_items
+        )
+    )
+
+
+async def notify_wishlist_matches(name, price, url):
+    # Queues a DM for every user whose wishlist matches within their max price
+    # and who hasn't been alerted about this listing yet, returns how many
+    alerts = await alert_engine.evaluate(name, price, url)
+    for user_id, matched_items in alerts.items():
+        queue_notification(user_id, format_wishlist_match(name, price, url, matched_items))
+    return len(alerts)
+
+
+async def notify_watched_listing(listing, name, price, old_price):
+    await notify_wishlist_matches(name, price, listing.url)
+
+
+async def deliver_job_results():
+    # Results of queued scrapes, whichever worker ran them and even if the bot restarted meanwhile
+    interval = getattr(settings, 'SCRAPE_JOB_POLL_INTERVAL', 1.0)
+    while True:
+        try:
+            for job in await take_finished_jobs():
+                await report_job(job)
+        except Exception as e:
+            print(f"Error delivering scrape job results: {e}")
+        await asyncio.sleep(interval)
+
+
+async def report_job(job):
+    # The channel may be in a guild another process's shards have
+    channel = (bot.get_channel(job.channel_id) or bot.get_partial_messageable(job.channel_id)) if job.channel_id else None
+    if job.status != ScrapeJob.DONE:
+        if channel is not None:
+            await channel.send(f"Failed to scrape {job.url}: {job.error or job.error_kind}")
+        return
+
+    name, price = job.result['name'], Decimal(job.result['price'])
+    notified = await notify_wishlist_matches(name, price, job.url)
+    if channel is None:
+        return
+    if notified:
+        await channel.send(f"**{name}** - ${price}\n📬 This listing matched the wishlists of {notified} user(s), they'll be notified by DM.")
+    else:
+        await channel.send(f"**{name}** - ${price}\nNo wishlist matches found for this listing.")
 
 
 # Scrape and notify users
 @bot.command(name='scrape')
 async def scrape(ctx, url: str):
+    if getattr(settings, 'SCRAPE_WORKERS_ENABLED', False):
+        # Ahead of bulk jobs, someone is waiting on this one
+        jobs = await enqueue_jobs([url], ScrapeJob.HIGH, ctx.author.id, ctx.channel.id)
+        await ctx.send(f"Queued eBay listing for scraping (job #{jobs[0].pk}), I'll post the result here.")
+        return
+
     await ctx.send(f"Scraping eBay listing: {url}")
 
     name, price = await scrape_and_get_name_price(url)  # return name, price from your scraper
@@ -70,89 +323,213 @@ async def scrape(ctx, url: str):
         await ctx.send("Failed to scrape a title.")
         return
 
-    matched_items = await check_against_wishlist(name, ctx.author.id)
+    # DMs go out in the background, rate-limited and batched per user. Alerts
+    # are deduped per listing, so however the link was written it's one URL
+    notified = await notify_wishlist_matches(name, price, canonical_listing_url(url))
 
-    if matched_items:
-        try:
-            dm_channel = await ctx.author.create_dm()
-            await dm_channel.send(
-                f"📢 This eBay listing matches one or more cards in your wishlist!\n"
-                f"**Title:** {name}\n"
-                f"**Price:** ${price:.2f}\n"
-                f"**Link:** {url}\n"
-                f"\n**Matched Wishlist Entries:**\n" +
-                "\n".join(f"- {m['pokemon_name']} (Set: {m['set_name']}, ID: {m['card_id']})" for m in matched_items)
-            )
-        except discord.Forbidden:
-            await ctx.send("I couldn't DM you. Please check your privacy settings.")
+    if notified:
+        await ctx.send(f"📬 This listing matched the wishlists of {notified} user(s), they'll be notified by DM.")
     else:
         await ctx.send("No wishlist matches found for this listing.")
 
 
-async def get_matching_cards(card_name):
-    url = f"https://api.pokemontcg.io/v2/cards?q=name:{card_name}"
+@bot.command(name='notify_stats')
+async def notify_stats(ctx):
+    stats = notifications.stats()
+    await ctx.send(
+        f"📬 Notifications: {stats['queued_messages']} queued for {stats['queued_users']} user(s), "
+        f"{stats['sent']} sent, {stats['failed']} failed, {stats['retries']} retries, "
+        f"latency p50 {stats['latency_p50_ms']} ms / p95 {stats['latency_p95_ms']} ms"
+    )
+
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                return None
-            data = await resp.json()
-            cards = data.get("data", [])
-            return cards
+# Scrape many listings at once, from the message and/or attached .txt files
+@bot.command(name='scrape_bulk')
+async def scrape_bulk_command(ctx, *, urls: str = ''):
+    lines = urls.split()
+    for attachment in ctx.message.attachments:
+        data = await attachment.read()
+        lines.extend(data.decode('utf-8', errors='ignore').splitlines())
+
+    urls = read_urls(lines)
+    if not urls:
+        await ctx.send("Please give me some URLs: `!scrape_bulk <url> <url> ...` or attach a file with one URL per line.")
+        return
 
-# Create a sync function to check if the item exists
+    if getattr(settings, 'SCRAPE_WORKERS_ENABLED', False):
+        jobs = await enqueue_jobs(urls, ScrapeJob.LOW, ctx.author.id)
+        await ctx.send(f"Queued {len(jobs)} eBay listings for the scrape workers, wishlist matches will be sent by DM.")
+        return
+
+    async def on_result(url, name, price):
+        await notify_wishlist_matches(name, price, canonical_listing_url(url))
+
+    await ctx.send(f"Scraping {len(urls)} eBay listings...")
+    stats = await scrape_bulk(urls, on_result=on_result)
+    await ctx.send(f"✅ {stats.format()}")
+
+
+# Scrape a whole eBay search results page (and the pages after it) at once
+@bot.command(name='scrape_search')
+async def scrape_search_command(ctx, url: str, pages: int = 1):
+    # Each page is a browser navigation, a user can't queue up an unbounded crawl
+    max_pages = getattr(settings, 'SCRAPER_SEARCH_MAX_PAGES', 5)
+    if pages > max_pages:
+        await ctx.send(f"Only scraping the first {max_pages} pages (the most a search can follow).")
+    pages = min(max(pages, 1), max_pages)
+    await ctx.send(f"Scraping search results: {url}")
+    alerts = 0
+
+    async def on_result(result):
+        nonlocal alerts
+        alerts += await notify_wishlist_matches(result.title, result.price, canonical_listing_url(result.url))
+
+    try:
+        count = await scrape_search(url, pages, on_result)
+    except Exception as e:
+        await ctx.send(f"Failed to scrape search results: {e}")
+        return
+    await ctx.send(f"✅ Saved {count} prices, {alerts} wishlist alert(s) sent by DM.")
+
+
+# Local catalog lookups (see `manage.py sync_cards`), the API is only a fallback
 @sync_to_async
-def check_if_item_exists(user_id, pokemon_name, set_name, card_id):
-    # Check if the item already exists in the user's wishlist
-    return WishlistItem.objects.filter(
-        discord_user_id=user_id,
-        pokemon_name=pokemon_name,
-        set_name=set_name,
-        card_id=card_id
-    ).exists()
-
-# Create a sync function to add a new wishlist item
+def get_local_cards_by_name(pokemon_name):
+    return find_cards_by_name(pokemon_name)
+
+@sync_to_async
+def get_local_card_by_id(card_id):
+    return find_card_by_id(card_id)
+
+
+# Watched listings get re-scraped automatically, more often when their price moves
+@bot.command(name='watch')
+async def watch(ctx, url: str, hours_left: float = None):
+    ends_at = timezone.now() + timedelta(hours=hours_left) if hours_left else None
+    listing, created = await add_watch(url, ctx.author.id, ends_at)
+    watch_scheduler.wake()
+    if created:
+        await ctx.send(f"👀 Now watching {url}, I'll re-check it automatically.")
+    else:
+        await ctx.send(f"👀 {url} is already being watched, its schedule has been reset.")
+
+@bot.command(name='unwatch')
+async def unwatch(ctx, url: str):
+    if await remove_watch(url):
+        await ctx.send(f"Stopped watching {url}.")
+    else:
+        await ctx.send(f"{url} wasn't being watched.")
+
+
+async def get_matching_cards(card_name):
+    cards = await get_local_cards_by_name(card_name)
+    if cards:
+        return cards
+
+    status, data = await http_client.get_json(
+        f"{POKEMONTCG_API_URL}/cards", params={'q': f"name:{card_name}"}, headers=POKEMONTCG_HEADERS
+    )
+    if status != 200:
+        return None
+    return data.get("data", [])
+
+# Create a sync function to add new wishlist items
 @sync_to_async
-def add_wishlist_item(user_id, pokemon_name, set_name, card_id):
-    WishlistItem.objects.create(
-        discord_user_id=user_id,
-        pokemon_name=pokemon_name,
-        set_name=set_name,
-        card_id=card_id
+def upsert_wishlist_items(user_id, cards):
+    # One INSERT .. ON CONFLICT for any number of (pokemon_name, set_name, card_id),
+    # re-adding a card already on the wishlist just refreshes its name/set
+    items = WishlistItem.objects.bulk_create(
+        [
+            WishlistItem(discord_user_id=user_id, pokemon_name=pokemon_name, set_name=set_name, card_id=card_id)
+            for pokemon_name, set_name, card_id in cards
+        ],
+        update_conflicts=True,
+        unique_fields=['discord_user_id', 'card_id'],
+        update_fields=['pokemon_name', 'set_name'],
     )
+    invalidate_wishlist(user_id)
+    return [item.pk for item in items]
+
+async def add_wishlist_items(user_id, cards):
+    pks = await upsert_wishlist_items(user_id, cards)
+    for pk, (pokemon_name, set_name, card_id) in zip(pks, cards):
+        wishlist_matcher.add(pk, user_id, pokemon_name, set_name, card_id)
+        alert_engine.track(user_id, card_id)
+    wishlist_changed(user_id)
+
+async def add_wishlist_item(user_id, pokemon_name, set_name, card_id, max_price=None):
+    await add_wishlist_items(user_id, [(pokemon_name, set_name, card_id)])
+    if max_price is not None:
+        await set_wishlist_max_price(user_id, card_id, max_price)
+
+
+@sync_to_async
+def update_wishlist_max_price(user_id, card_id, max_price):
+    updated = WishlistItem.objects.filter(discord_user_id=user_id, card_id=card_id).update(max_price=max_price)
+    invalidate_wishlist(user_id)
+    return updated > 0
+
+async def set_wishlist_max_price(user_id, card_id, max_price):
+    updated = await update_wishlist_max_price(user_id, card_id, max_price)
+    if updated:
+        alert_engine.set_threshold(user_id, card_id, max_price)
+        wishlist_changed(user_id)
+    return updated
+
+
+def parse_max_price(text):
+    # "none" (or "any") clears the max price, otherwise a positive dollar amount
+    if text.lower() in ('none', 'any'):
+        return None
+    try:
+        price = clean_price(text)
+    except InvalidOperation:
+        price = None
+    if price is None or not 0 < price < 10 ** 8:
+        raise ValueError(f"'{text}' isn't a valid price")
+    return price.quantize(Decimal('0.01'))
 
 
 async def fetch_cards_by_name(pokemon_name: str):
-    # Encode the pokemon_name to safely use in URL
-    pokemon_name_encoded = urllib.parse.quote(pokemon_name)
+    cards = await get_local_cards_by_name(pokemon_name)
+    if cards:
+        return cards
 
-    url = f"https://api.pokemontcg.io/v2/cards?q=name:{pokemon_name_encoded}"
+    try:
+        # Shared pooled client: cached, and concurrent identical lookups share one request
+        status, data = await http_client.get_json(
+            f"{POKEMONTCG_API_URL}/cards", params={'q': f"name:{pokemon_name}"}, headers=POKEMONTCG_HEADERS
+        )
+    except Exception as e:
+        print(f"Error fetching data for {pokemon_name}: {e}")
+        return []
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                print(f"Fetched data for {pokemon_name}: {data}")  # Debugging line
-                return data.get("data", [])
-            else:
-                print(f"Error fetching data for {pokemon_name}: {response.status}")  # Debugging line
-                return []
+    if status == 200:
+        cards = data.get("data", [])
+        print(f"Fetched {len(cards)} cards for {pokemon_name}")  # Debugging line
+        return cards
+    else:
+        print(f"Error fetching data for {pokemon_name}: {status}")  # Debugging line
+        return []
 
 
 # Fetch cards from the external API based on the card ID
 async def fetch_cards_by_id(card_id):
-    url = f"https://api.pokemontcg.io/v2/cards/{card_id}"  # The endpoint to fetch card details by ID
+    card = await get_local_card_by_id(card_id)
+    if card:
+        return [card]
+
+    url = f"{POKEMONTCG_API_URL}/cards/{card_id}"  # The endpoint to fetch card details by ID
 
     try:
-        # Make the request to the API
-        response = requests.get(url)
+        # Make the request to the API without blocking the event loop
+        status, card_data = await http_client.get_json(url, headers=POKEMONTCG_HEADERS)
 
         # Check if the response is valid
-        if response.status_code == 200:
-            card_data = response.json()  # Parse the JSON response
+        if status == 200:
             return [card_data['data']]  # Return the card data (as a list for consistency with the other fetch function)
         else:
-            print(f"Error fetching card by ID {card_id}: {response.status_code}")
+            print(f"Error fetching card by ID {card_id}: {status}")
             return []  # Return an empty list if no data is found or if the API request fails
     except Exception as e:
         print(f"Error fetching card by ID {card_id}: {e}")
@@ -186,20 +563,28 @@ async def add_to_wishlist(ctx, *, card_info: str):
         await ctx.send(example_text)
         return
 
-    # Ensure there are exactly 3 parts (pokemon_name, set_name, card_id)
-    if len(parts) != 3:
-        await ctx.send("Invalid format! Please use the format: `!add_wishlist <pokemon_name>, <set_name>, <id>`.")
+    # Ensure there are 3 parts (pokemon_name, set_name, card_id), plus an optional max price
+    if len(parts) not in (3, 4):
+        await ctx.send("Invalid format! Please use the format: `!add_wishlist <pokemon_name>, <set_name>, <id>[, <max_price>]`.")
         return
 
     # Extract pokemon_name, set_name, and card_id from the input
-    pokemon_name, set_name, card_id = parts
+    pokemon_name, set_name, card_id = parts[:3]
+    max_price = None
+    if len(parts) == 4:
+        try:
+            max_price = parse_max_price(parts[3])
+        except ValueError as e:
+            await ctx.send(f"{e}. Please give the max price as a number, e.g. `25.00`.")
+            return
 
-    # First, try to fetch the card by name
-    cards = await fetch_cards_by_name(pokemon_name)
+    # The card ID names exactly one card, so look it up first; a name search
+    # for a common name may not even reach it
+    cards = await fetch_cards_by_id(card_id)
 
     if not cards:
-        # If no cards are found by name, try fetching by card ID
-        cards = await fetch_cards_by_id(card_id)
+        # Not a known ID, the name search may still turn up the card
+        cards = await fetch_cards_by_name(pokemon_name)
 
     # If no cards are found by name or ID, let the user know
     if not cards:
@@ -216,12 +601,15 @@ async def add_to_wishlist(ctx, *, card_info: str):
 
     if matched_card:
         # If a matching card is found, add it to the wishlist
-        await add_wishlist_item(user.id, matched_card["name"], set_name, card_id)
+        await add_wishlist_item(user.id, matched_card["name"], set_name, card_id, max_price)
 
         # Create an embed with the card image and information
+        description = f"Set: {set_name}\nCard ID: {card_id}"
+        if max_price is not None:
+            description += f"\nAlerts at or below: ${max_price:.2f}"
         embed = discord.Embed(
             title=f"{matched_card['name']} Added to Wishlist",
-            description=f"Set: {set_name}\nCard ID: {card_id}",
+            description=description,
             color=discord.Color.blue()
         )
         embed.set_image(url=matched_card['images']['large'])  # Assuming the image URL is in 'large' field
@@ -239,7 +627,7 @@ async def add_to_wishlist(ctx, *, card_info: str):
 # Sync function to fetch the user's wishlist from the database
 @sync_to_async
 def get_user_wishlist(user_id):
-    wishlist_items = WishlistItem.objects.filter(discord_user_id=user_id)
+    wishlist_items = WishlistItem.objects.filter(discord_user_id=user_id).order_by('id')
     return [
         {
             "pokemon_name": item.pokemon_name,
@@ -250,7 +638,101 @@ def get_user_wishlist(user_id):
     ]
 
 
-user_wishlist_cache = {}  # {message_id: {user_id, pokemon_name, set_name, card_id}}
+WISHLIST_PAGE_SIZE = 10
+WISHLIST_VIEW_TIMEOUT = 300  # Seconds a wishlist view's buttons keep working
+
+# One live view per user; bounded, and entries go away when their view expires
+wishlist_views = TTLCache(maxsize=1000, ttl=WISHLIST_VIEW_TIMEOUT)  # {user_id: WishlistView}
+
+
+class WishlistView(discord.ui.View):
+    # A single message showing one page of the wishlist at a time
+
+    def __init__(self, user, items):
+        super().__init__(timeout=WISHLIST_VIEW_TIMEOUT)
+        self.user = user
+        self.items = items
+        self.page = 0
+        self.message = None
+        self.update_components()
+
+    @property
+    def page_count(self):
+        return max(1, -(-len(self.items) // WISHLIST_PAGE_SIZE))
+
+    def page_items(self):
+        start = self.page * WISHLIST_PAGE_SIZE
+        return self.items[start:start + WISHLIST_PAGE_SIZE]
+
+    def embed(self):
+        start = self.page * WISHLIST_PAGE_SIZE
+        lines = [
+            f"**{start + i + 1}.** {item['pokemon_name']} (Set: {item['set_name']}, ID: {item['card_id']})"
+            for i, item in enumerate(self.page_items())
+        ]
+        embed = discord.Embed(
+            title=f"{self.user.display_name}'s wishlist",
+            description="\n".join(lines) or "Your wishlist is now empty.",
+            color=discord.Color.blue()
+        )
+        embed.set_footer(text=f"Page {self.page + 1}/{self.page_count} · {len(self.items)} card(s)")
+        return embed
+
+    def update_components(self):
+        self.page = min(self.page, self.page_count - 1)
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.page_count - 1
+        self.remove_card.options = [
+            discord.SelectOption(label=f"{item['pokemon_name']} ({item['card_id']})"[:100], value=item['card_id'])
+            for item in self.page_items()
+        ] or [discord.SelectOption(label="Nothing to remove", value="-")]
+        self.remove_card.disabled = not self.items
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.user.id:
+            await interaction.response.send_message("This isn't your wishlist, use `!wishlist` to see yours.", ephemeral=True)
+            return False
+        return True
+
+    async def show(self, interaction):
+        self.update_components()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        self.page -= 1
+        await self.show(interaction)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        self.page += 1
+        await self.show(interaction)
+
+    @discord.ui.select(placeholder="❌ Remove a card on this page...")
+    async def remove_card(self, interaction, select):
+        card_id = select.values[0]
+        item = next((item for item in self.items if item['card_id'] == card_id), None)
+        if item is None:
+            await self.show(interaction)
+            return
+
+        await remove_from_user_wishlist(self.user.id, item['pokemon_name'], item['set_name'], card_id)
+        self.items.remove(item)
+        await self.show(interaction)
+
+    async def close(self):
+        self.stop()
+        if wishlist_views.get(self.user.id, count=False) is self:
+            wishlist_views.pop(self.user.id)
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    async def on_timeout(self):
+        await self.close()
+
 
 @bot.command(name='wishlist')
 async def view_wishlist(ctx):
@@ -261,59 +743,33 @@ async def view_wishlist(ctx):
         await ctx.send("Your wishlist is currently empty.")
         return
 
-    await ctx.send(f"{user.mention}, here’s your wishlist! React with ❌ on any to remove:")
+    # Opening a new view retires the user's previous one
+    previous = wishlist_views.get(user.id, count=False)
+    if previous is not None:
+        await previous.close()
 
-    for item in wishlist:
-        content = f"{item['pokemon_name']} (Set: {item['set_name']}, ID: {item['card_id']})"
-        msg = await ctx.send(content)
-        await msg.add_reaction("❌")
-
-        # Cache full card info per message
-        user_wishlist_cache[msg.id] = {
-            "user_id": user.id,
-            "pokemon_name": item['pokemon_name'],
-            "set_name": item['set_name'],
-            "card_id": item['card_id']
-        }
-
-@bot.event
-async def on_reaction_add(reaction, user):
-    if user.bot or str(reaction.emoji) != "❌":
-        return
+    view = WishlistView(user, wishlist)
+    view.message = await ctx.send(embed=view.embed(), view=view)
+    wishlist_views.set(user.id, view)
 
-    msg = reaction.message
-    data = user_wishlist_cache.get(msg.id)
 
-    if not data or user.id != data["user_id"]:
-        return
-
-    success = await remove_from_user_wishlist(
-        user.id,
-        data["pokemon_name"],
-        data["set_name"],
-        data["card_id"]
-    )
-
-    if success:
-        await msg.edit(content=f"✅ Removed: {data['pokemon_name']} (Set: {data['set_name']}, ID: {data['card_id']})")
-        del user_wishlist_cache[msg.id]
-    else:
-        await msg.channel.send("⚠️ Couldn’t remove that item. It may have already been deleted.", delete_after=5)
+@sync_to_async
+def delete_wishlist_items(user_id, card_ids):
+    # A card is on a wishlist at most once, so (user, card_id) is enough, in one DELETE
+    deleted, _ = WishlistItem.objects.filter(discord_user_id=user_id, card_id__in=card_ids).delete()
+    invalidate_wishlist(user_id)
+    return deleted
 
+async def remove_from_user_wishlist_bulk(user_id, card_ids):
+    deleted = await delete_wishlist_items(user_id, card_ids)
+    for card_id in card_ids:
+        wishlist_matcher.remove_card(user_id, card_id)
+        alert_engine.remove(user_id, card_id)
+    wishlist_changed(user_id)
+    return deleted
 
-@sync_to_async
-def remove_from_user_wishlist(user_id, pokemon_name, set_name, card_id):
-    try:
-        wishlist_item = WishlistItem.objects.get(
-            discord_user_id=user_id,
-            pokemon_name=pokemon_name,
-            set_name=set_name,
-            card_id=card_id
-        )
-        wishlist_item.delete()
-        return True
-    except WishlistItem.DoesNotExist:
-        return False
+async def remove_from_user_wishlist(user_id, pokemon_name, set_name, card_id):
+    return await remove_from_user_wishlist_bulk(user_id, [card_id]) > 0
 
 
 @bot.command(name='remove_wishlist')
@@ -335,9 +791,109 @@ async def remove_wishlist(ctx, *, card_info: str):
     else:
         await ctx.send(f"{pokemon_name} (Set: {set_name}, ID: {card_id}) was not found in your wishlist.")
 
+def parse_bulk_entries(text):
+    # One card per line (or separated by ';'): "<pokemon_name>, <set_name>, <card_id>" or just "<card_id>"
+    entries = []
+    for line in re.split(r'[\n;]', text):
+        parts = [part.strip() for part in line.split(',')]
+        if parts[-1]:
+            entries.append(parts)
+    return entries
+
+
+@bot.command(name='add_wishlist_bulk')
+async def add_wishlist_bulk(ctx, *, card_info: str):
+    entries = parse_bulk_entries(card_info)
+    card_ids = list(dict.fromkeys(parts[-1] for parts in entries))
+
+    # Every card is checked against the catalog concurrently, then saved in one query
+    results = await asyncio.gather(*(fetch_cards_by_id(card_id) for card_id in card_ids))
+    cards, missing = [], []
+    for card_id, found in zip(card_ids, results):
+        if found:
+            cards.append((found[0]['name'], found[0]['set']['name'], card_id))
+        else:
+            missing.append(card_id)
+
+    if cards:
+        await add_wishlist_items(ctx.author.id, cards)
+
+    message = f"✅ Added {len(cards)} card(s) to your wishlist."
+    if missing:
+        message += f"\n⚠️ No card found for: {', '.join(missing)}"
+    await ctx.send(message)
+
+
+@bot.command(name='remove_wishlist_bulk')
+async def remove_wishlist_bulk(ctx, *, card_info: str):
+    card_ids = list(dict.fromkeys(parts[-1] for parts in parse_bulk_entries(card_info)))
+    deleted = await remove_from_user_wishlist_bulk(ctx.author.id, card_ids)
+    await ctx.send(f"🗑️ Removed {deleted} of {len(card_ids)} card(s) from your wishlist.")
+
+
+MAX_IMPORT_BYTES = 1024 * 1024  # Wishlist files are a few hundred rows, not megabytes
+
+
 @sync_to_async
-def clear_user_wishlist(user_id):
+def export_user_wishlist(user_id, fmt):
+    out = io.StringIO()
+    count = export_rows(out, 'wishlist', fmt, user_id=user_id)
+    return count, out.getvalue()
+
+@bot.command(name='export_wishlist')
+async def export_wishlist(ctx, fmt: str = 'csv'):
+    fmt = format_for('.' + fmt.lower())
+    count, data = await export_user_wishlist(ctx.author.id, fmt)
+    if not count:
+        await ctx.send("Your wishlist is currently empty.")
+        return
+    await ctx.send(
+        f"📄 Your wishlist ({count} card(s)):",
+        file=discord.File(io.BytesIO(data.encode('utf-8')), filename=f"wishlist.{fmt}"),
+    )
+
+
+@sync_to_async
+def import_user_wishlist(user_id, data, fmt):
+    return import_wishlist(io.StringIO(data, newline=''), fmt, update=True, user_id=user_id)
+
+@bot.command(name='import_wishlist')
+async def import_wishlist_command(ctx):
+    attachments = ctx.message.attachments
+    if not attachments:
+        await ctx.send(
+            "Attach a CSV or JSONL file with a `card_id` column (`pokemon_name`, `set_name`, `max_price` optional), "
+            "e.g. one made by `!export_wishlist`."
+        )
+        return
+    if attachments[0].size > MAX_IMPORT_BYTES:
+        await ctx.send("That file is too big to be a wishlist (1 MB max).")
+        return
+
+    data = (await attachments[0].read()).decode('utf-8-sig', errors='replace')
+    stats, items = await import_user_wishlist(ctx.author.id, data, format_for(attachments[0].filename))
+    for item in items:
+        wishlist_matcher.add(item.pk, item.discord_user_id, item.pokemon_name, item.set_name, item.card_id)
+        alert_engine.set_threshold(item.discord_user_id, item.card_id, item.max_price)
+    wishlist_changed(ctx.author.id)
+
+    message = f"✅ Imported {stats.written} card(s) into your wishlist."
+    if stats.invalid_count:
+        problems = "\n".join(f"line {line}: {error}" for line, error in stats.invalid[:5])
+        message += f"\n⚠️ Skipped {stats.invalid_count} row(s):\n{problems}"
+    await ctx.send(message)
+
+
+@sync_to_async
+def delete_user_wishlist(user_id):
     WishlistItem.objects.filter(discord_user_id=user_id).delete()
+    invalidate_wishlist(user_id)
+
+async def clear_user_wishlist(user_id):
+    await delete_user_wishlist(user_id)
+    wishlist_matcher.clear_user(user_id)
+    alert_engine.clear_user(user_id)
+    wishlist_changed(user_id)
 
 @bot.command(name='clear_wishlist')
 async def clear_wishlist(ctx):
@@ -346,21 +902,122 @@ async def clear_wishlist(ctx):
     await clear_user_wishlist(user.id)
     await ctx.send(f"🧹 Your wishlist has been cleared, {user.mention}.")
 
+@bot.command(name='set_max_price')
+async def set_max_price(ctx, card_id: str, price: str):
+    try:
+        max_price = parse_max_price(price)
+    except ValueError as e:
+        await ctx.send(f"{e}. Use a number like `25.00`, or `none` to be alerted at any price.")
+        return
+
+    if not await set_wishlist_max_price(ctx.author.id, card_id, max_price):
+        await ctx.send(f"{card_id} isn't on your wishlist.")
+    elif max_price is None:
+        await ctx.send(f"🔔 You'll be alerted about {card_id} at any price.")
+    else:
+        await ctx.send(f"🔔 You'll be alerted about {card_id} at or below ${max_price:.2f}.")
+
+@bot.command(name='resolve')
+async def resolve(ctx, *, title: str):
+    # Which catalog card a listing title is about, as the wishlist matcher sees it
+    results = card_resolver.resolve(title)
+    if not results:
+        await ctx.send("Couldn't match that title to any card in the local catalog.")
+        return
+    lines = [f"🔎 Best matches for **{title}**:"]
+    for result in results:
+        lines.append(f"- {result.name} ({result.card_id}), confidence {result.confidence:.0%}")
+    if results[0].confidence < card_resolver.min_confidence:
+        lines.append("Not confident enough, wishlists are matched by name/set/number text instead.")
+    await ctx.send("\n".join(lines))
+
+@bot.command(name='cache_stats')
+async def cache_stats(ctx):
+    stats = http_client.stats()
+    await ctx.send(
+        f"🗂️ Card API cache: {stats['size']}/{stats['maxsize']} entries, "
+        f"{stats['hits']} hits / {stats['misses']} misses (hit rate {stats['hit_rate']:.0%}), "
+        f"{stats['coalesced']} coalesced requests, {stats['in_flight']} in flight"
+    )
+    stats = scrape_cache_stats()
+    await ctx.send(
+        f"🗂️ Listing scrape cache: {stats['size']}/{stats['maxsize']} listings, "
+        f"{stats['hits']} hits / {stats['misses']} misses (hit rate {stats['hit_rate']:.0%}), "
+        f"{stats['coalesced']} scrapes shared, {stats['in_flight']} in flight"
+    )
+
+@bot.command(name='scrape_queue')
+async def scrape_queue(ctx):
+    stats = await queue_stats()
+    await ctx.send(
+        f"🧾 Scrape queue: {stats['queued']} queued ({stats['due']} due), {stats['running']} running, "
+        f"{stats['failed_undelivered']} failed not yet reported"
+    )
+
+@bot.command(name='scrape_metrics')
+@commands.is_owner()
+async def scrape_metrics(ctx):
+    # Where scrape time goes, per stage, since the bot started
+    summary = metrics.stage_summary()
+    if not summary:
+        await ctx.send("No scrapes timed yet.")
+        return
+
+    lines = ["⏱️ **Scraper stages** (count, mean, p50/p95 bucket, outcomes):"]
+    for stage, stats in sorted(summary.items(), key=lambda item: -item[1].get('count', 0) * item[1].get('mean', 0)):
+        outcomes = ", ".join(f"{outcome} {count}" for outcome, count in sorted(stats.items())
+                             if outcome not in ('count', 'mean', 'p50', 'p95'))
+        lines.append(
+            f"`{stage}`: {stats.get('count', 0)}, {stats.get('mean', 0) * 1000:.0f} ms, "
+            f"≤{stats.get('p50', 0)}s / ≤{stats.get('p95', 0)}s ({outcomes})"
+        )
+    for domain, breaker in breakers.stats().items():
+        if breaker['state'] != 'closed':
+            lines.append(f"🚧 `{domain}` circuit {breaker['state']}, retry in {breaker['retry_after_s']}s")
+    await ctx.send("\n".join(lines))
+
 @bot.command(name='commands')
 async def show_commands(ctx):
     command_list = """
 📜 **Available Commands:**
 
-🔹 `!add_wishlist <pokemon_name>, <set_name>, <card_id>`  
-➤ Adds a specific Pokémon card to your wishlist.  
-Example: `!add_wishlist Charizard, Base, base1-4`
+🔹 `!add_wishlist <pokemon_name>, <set_name>, <card_id>[, <max_price>]`  
+➤ Adds a specific Pokémon card to your wishlist, optionally only alerting at or below a price.  
+Example: `!add_wishlist Charizard, Base, base1-4, 250`
+
+🔹 `!set_max_price <card_id> <price|none>`  
+➤ Only alert about a wishlist card at or below this price (`none` for any price).
 
 🔹 `!remove_wishlist <pokemon_name>, <set_name>, <card_id>`  
 ➤ Removes a specific card from your wishlist.  
 Example: `!remove_wishlist Charizard, Base, base1-4`
 
+🔹 `!add_wishlist_bulk` / `!remove_wishlist_bulk`  
+➤ Add or remove many cards at once, one per line: `<pokemon_name>, <set_name>, <card_id>` or just `<card_id>`.
+
 🔹 `!wishlist`  
-➤ View your current wishlist.
+➤ View your current wishlist, page through it and remove cards.
+
+🔹 `!export_wishlist [csv|jsonl]` / `!import_wishlist` (with the file attached)  
+➤ Download your wishlist as a file, or add/update cards from one (`card_id` column required, `max_price` optional).
+
+🔹 `!scrape_bulk <url> <url> ...`  
+➤ Scrapes many eBay listings at once (or attach a file with one URL per line).
+
+🔹 `!scrape_queue`  
+➤ Shows how many scrapes are waiting for the scrape workers.
+
+🔹 `!scrape_search <search_url> [pages]`  
+➤ Scrapes every listing on an eBay search results page (and up to `pages` pages after it).
+
+🔹 `!resolve <listing title>`  
+➤ Shows which card a listing title is about, with a confidence score.
+
+🔹 `!watch <url> [hours_until_auction_ends]`  
+➤ Keeps re-checking a listing's price automatically. `!unwatch <url>` stops it.
+
+🔹 `!notify_stats`  
+➤ Shows how many wishlist alert DMs are queued, sent and failed, and how long they took to go out.
 
 🔹 `!commands`  
 ➤ Show this list of commands.
@@ -1,5 +1,146 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from .dashboard import dashboard, price_sources
 from .models import PokemonPrice, WishlistItem
 
-admin.site.register(PokemonPrice)
-admin.site.register(WishlistItem)
+# The price table grows by every scrape, so its changelist avoids anything
+# that reads the whole table: no counts, keyset pagination down the
+# date_fetched index instead of OFFSET pages, filters and searches that hit an index, and no
+# sorting by arbitrary columns.
+
+CURSOR_VAR = 'before'
+NAME_PREFIX_END = '\U0010ffff'  # Sorts after anything a name can continue with
+
+
+class KeysetChangeList(ChangeList):
+    """Newest first, one page at a time: `?before=<pk>` shows the rows that
+    come after that one in (date_fetched, pk) order, which the date_fetched
+    index hands over already sorted (the pk is its implicit last column).
+    Fetches per_page + 1 rows to know whether there's a next page and never
+    counts."""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        queryset = self.queryset
+        try:
+            self.cursor = int(request.GET.get(CURSOR_VAR, ''))
+        except ValueError:
+            self.cursor = None
+        if self.cursor is not None:
+            fetched = self.root_queryset.filter(pk=self.cursor).values_list('date_fetched', flat=True).first()
+            if fetched is not None:
+                queryset = queryset.filter(date_fetched__lte=fetched).exclude(date_fetched=fetched, pk__gte=self.cursor)
+        rows = list(queryset.order_by('-date_fetched', '-pk')[:self.list_per_page + 1])
+        self.next_cursor = rows[self.list_per_page - 1].pk if len(rows) > self.list_per_page else None
+
+        self.result_list = rows[:self.list_per_page]
+        self.result_count = len(self.result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = None
+
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}) if self.next_cursor else None
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR]) if self.cursor is not None else None
+
+
+class SourceFilter(admin.SimpleListFilter):
+    # The stock filter on `source` would SELECT DISTINCT over the raw table
+    title = 'source'
+    parameter_name = 'source'
+
+    def lookups(self, request, model_admin):
+        return [(source, source) for source in price_sources()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(source=self.value())
+        return queryset
+
+
+class ResolvedFilter(admin.SimpleListFilter):
+    title = 'resolved to a card'
+    parameter_name = 'resolved'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Yes'), ('no', 'No')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.exclude(card_id='')
+        if self.value() == 'no':
+            return queryset.filter(card_id='')
+        return queryset
+
+
+@admin.register(PokemonPrice)
+class PokemonPriceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'price', 'source', 'card_id', 'date_fetched')
+    list_filter = (SourceFilter, ResolvedFilter)
+    date_hierarchy = 'date_fetched'
+    search_fields = ('card_id', 'name')
+    search_help_text = "An exact card ID (e.g. base1-4), or the start of a listing title"
+    ordering = ('-date_fetched', '-pk')
+    sortable_by = ()
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    list_per_page = 100
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # Only what an index answers: card_id exactly (card_id, date_fetched),
+        # or a title prefix as a range on (name, source, date_fetched). The
+        # stock search would be a LIKE '%term%' over every row.
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        by_card = queryset.filter(card_id=term)
+        by_name = queryset.filter(name__gte=term, name__lt=term + NAME_PREFIX_END)
+        return by_card | by_name, False
+
+    def get_urls(self):
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='prices_pokemonprice_dashboard'),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Price dashboard',
+            'data': dashboard(refresh='refresh' in request.GET),
+        }
+        return TemplateResponse(request, 'admin/prices/pokemonprice/dashboard.html', context)
+
+
+@admin.register(WishlistItem)
+class WishlistItemAdmin(admin.ModelAdmin):
+    list_display = ('discord_user_id', 'pokemon_name', 'set_name', 'card_id', 'max_price')
+    search_fields = ('discord_user_id',)
+    search_help_text = "A Discord user ID"
+    ordering = ('-pk',)
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def get_search_results(self, request, queryset, search_term):
+        # discord_user_id leads the (user, card) unique index
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if not term.isdigit():
+            return queryset.none(), False
+        return queryset.filter(discord_user_id=int(term)), False
@@ -0,0 +1,103 @@
+from bisect import bisect_left, insort
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+
+from .matcher import wishlist_matcher
+from .models import PriceAlert
+
+NO_LIMIT = Decimal('Infinity')  # Wishlist entries without a max price want every match
+
+
+@sync_to_async
+def record_alerts(url, price, triggered):
+    # Returns the users not yet alerted about this listing, and records them
+    already = set(
+        PriceAlert.objects.filter(url=url, discord_user_id__in=list(triggered))
+        .values_list('discord_user_id', flat=True)
+    )
+    fresh = [user_id for user_id in triggered if user_id not in already]
+    PriceAlert.objects.bulk_create(
+        [PriceAlert(discord_user_id=user_id, url=url, card_id=triggered[user_id][0]['card_id'], price=price)
+         for user_id in fresh],
+        ignore_conflicts=True,
+    )
+    return fresh
+
+
+class AlertEngine:
+    """Decides who gets alerted when a new price is seen.
+
+    Thresholds live per card in a list sorted by max price, so a price only
+    looks at the cards the title matches and, for each, bisects straight to
+    the thresholds it clears instead of scanning the wishlist table.
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self._by_card = {}  # card_id -> sorted [(max_price, user_id)]
+        self._by_user = {}  # user_id -> {card_id: max_price}
+
+    def load(self, items):
+        # `items` are dicts with discord_user_id, card_id, max_price
+        self._by_card.clear()
+        self._by_user.clear()
+        for item in items:
+            # (user, card) is unique, so no set_threshold(): append, then sort each card's list once
+            threshold = NO_LIMIT if item['max_price'] is None else Decimal(item['max_price'])
+            self._by_card.setdefault(item['card_id'], []).append((threshold, item['discord_user_id']))
+            self._by_user.setdefault(item['discord_user_id'], {})[item['card_id']] = threshold
+        for thresholds in self._by_card.values():
+            thresholds.sort()
+
+    def set_threshold(self, user_id, card_id, max_price):
+        self.remove(user_id, card_id)
+        threshold = NO_LIMIT if max_price is None else Decimal(max_price)
+        insort(self._by_card.setdefault(card_id, []), (threshold, user_id))
+        self._by_user.setdefault(user_id, {})[card_id] = threshold
+
+    def track(self, user_id, card_id):
+        # A newly added card alerts at any price until it's given a max
+        if card_id not in self._by_user.get(user_id, {}):
+            self.set_threshold(user_id, card_id, None)
+
+    def remove(self, user_id, card_id):
+        threshold = self._by_user.get(user_id, {}).pop(card_id, None)
+        if threshold is None:
+            return
+        thresholds = self._by_card[card_id]
+        thresholds.pop(bisect_left(thresholds, (threshold, user_id)))
+        if not thresholds:
+            del self._by_card[card_id]
+        if not self._by_user[user_id]:
+            del self._by_user[user_id]
+
+    def clear_user(self, user_id):
+        for card_id in list(self._by_user.get(user_id, {})):
+            self.remove(user_id, card_id)
+
+    def triggered(self, title, price):
+        """{user_id: [matched wishlist entries]} whose max price `price` is within."""
+        triggered = {}
+        if price is None:
+            return triggered
+        for card_id in self.matcher.matched_card_ids(title):
+            thresholds = self._by_card.get(card_id, [])
+            # Everything from here on has max_price >= price
+            for threshold, user_id in thresholds[bisect_left(thresholds, (price,)):]:
+                entry = self.matcher.get(user_id, card_id)
+                if entry is not None:
+                    entry['max_price'] = None if threshold is NO_LIMIT else threshold
+                    triggered.setdefault(user_id, []).append(entry)
+        return triggered
+
+    async def evaluate(self, title, price, url):
+        # Like triggered(), minus users already alerted about this listing
+        triggered = self.triggered(title, price)
+        if not triggered:
+            return {}
+        fresh = await record_alerts(url, price, triggered)
+        return {user_id: triggered[user_id] for user_id in fresh}
+
+
+alert_engine = AlertEngine(wishlist_matcher)
@@ -0,0 +1,302 @@
+import asyncio
+import gc
+import os
+import random
+import re
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from decimal import Decimal
+
+from aiohttp import web
+from asgiref.sync import sync_to_async
+
+from .bulk import BulkScrapeStats
+from .matcher import WishlistMatcher
+from .models import PokemonPrice, PriceRollup
+from .scraper import normalize_scraped_data, scrape_listing
+from .search import iter_search_results
+from .writer import PriceWriter
+
+# Offline benchmarks: recorded eBay pages are served from a local aiohttp
+# server so the scraper, matcher and DB save path can be measured at scale
+# without touching eBay. See `manage.py bench_offline`.
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'bench_fixtures')
+LISTING_FIXTURES = ('listing_ld_json.html', 'listing_markup.html')
+SEARCH_FIXTURE = 'search_results.html'
+BENCH_PREFIX = '__bench__'
+
+ITEM_HREF_RE = re.compile(r'/itm/(\d+)')
+PAGE_PARAM_RE = re.compile(r'_pgn=\d+')
+
+POKEMON = [
+    'Charizard', 'Pikachu', 'Umbreon', 'Mewtwo', 'Blastoise', 'Venusaur', 'Gengar', 'Lugia', 'Rayquaza',
+    'Eevee', 'Mew', 'Gyarados', 'Dragonite', 'Snorlax', 'Sylveon', 'Espeon', 'Greninja', 'Lucario',
+    'Giratina', 'Arceus', 'Bulbasaur', 'Squirtle', 'Jigglypuff', 'Alakazam', 'Machamp', 'Lapras',
+    'Articuno', 'Zapdos', 'Moltres', 'Ho-Oh', 'Celebi', 'Tyranitar', 'Blaziken', 'Gardevoir', 'Absol',
+    'Garchomp', 'Darkrai', 'Zoroark', 'Mimikyu', 'Pikachu VMAX', 'Charizard ex', 'Mew ex',
+]
+SETS = [
+    ('Base Set', 'base1', 102), ('Jungle', 'base2', 64), ('Fossil', 'base3', 62),
+    ('Evolving Skies', 'swsh7', 203), ('Hidden Fates', 'sm115', 68), ('Crown Zenith', 'swsh12pt5', 159),
+    ('Scarlet & Violet 151', 'sv3pt5', 165), ('Brilliant Stars', 'swsh9', 172), ('Lost Origin', 'swsh11', 196),
+    ('Celebrations', 'cel25', 25), ('Obsidian Flames', 'sv3', 230), ('Paldea Evolved', 'sv2', 279),
+]
+EXTRAS = ['Holo', 'PSA 10', 'NM', 'Full Art', 'Alt Art', 'Reverse Holo', '1st Edition', 'CGC 9', 'LP', 'Secret Rare']
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+
+    def pct(p):
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    return {
+        'p50_ms': round(pct(50) * 1000, 3),
+        'p95_ms': round(pct(95) * 1000, 3),
+        'p99_ms': round(pct(99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+@contextmanager
+def measure(result, operations, trace_memory=True):
+    """Fill `result` with elapsed time, throughput and peak traced memory for the block."""
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        result['operations'] = operations
+        result['elapsed_s'] = round(elapsed, 4)
+        result['throughput_per_s'] = round(operations / elapsed, 1) if elapsed else 0.0
+        if trace_memory:
+            result['peak_alloc_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+            tracemalloc.stop()
+
+
+def synthetic_title(rng):
+    name = rng.choice(POKEMON)
+    set_name, _, total = rng.choice(SETS)
+    return f"{name} {rng.randint(1, total)}/{total} {set_name} {rng.choice(EXTRAS)} Pokemon Card"
+
+
+def synthetic_wishlist(rows, users, rng):
+    # Wishlist rows shaped like WishlistItem.objects.values(), spread over `users`
+    for pk in range(1, rows + 1):
+        name = rng.choice(POKEMON)
+        set_name, set_id, total = rng.choice(SETS)
+        yield {
+            'id': pk,
+            'discord_user_id': rng.randrange(users),
+            'pokemon_name': name,
+            'set_name': set_name,
+            'card_id': f"{set_id}-{rng.randint(1, total)}",
+        }
+
+
+class FixtureServer:
+    """Local stand-in for www.ebay.com serving the recorded pages.
+
+    /itm/<id> cycles through the listing fixtures. /sch/i.html?_pgn=N serves
+    the search fixture with item IDs made unique per page and the "next page"
+    link pointing at page N+1, up to `search_pages`.
+    """
+
+    def __init__(self, search_pages=5):
+        self.search_pages = search_pages
+        self.listings = [load_fixture(name) for name in LISTING_FIXTURES]
+        self.search = load_fixture(SEARCH_FIXTURE)
+        self.requests = 0
+        self.base_url = None
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/itm/{item_id}', self.listing)
+        app.router.add_get('/sch/i.html', self.search_page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def listing(self, request):
+        self.requests += 1
+        html = self.listings[int(request.match_info['item_id']) % len(self.listings)]
+        return web.Response(text=html, content_type='text/html')
+
+    async def search_page(self, request):
+        self.requests += 1
+        page = int(request.query.get('_pgn', 1))
+        html = ITEM_HREF_RE.sub(lambda m: f"/itm/{int(m.group(1)) + page * 10 ** 6}", self.search)
+        html = html.replace('https://www.ebay.com', self.base_url)
+        if page >= self.search_pages:
+            html = re.sub(r'<a[^>]*pagination__next[^>]*>.*?</a>', '', html)
+        else:
+            html = PAGE_PARAM_RE.sub(f'_pgn={page + 1}', html)
+        return web.Response(text=html, content_type='text/html')
+
+    def listing_urls(self, count):
+        return [f"{self.base_url}/itm/{285000000000 + i}" for i in range(count)]
+
+    def search_url(self):
+        return f"{self.base_url}/sch/i.html?_nkw=pokemon+card"
+
+
+def bench_normalize(titles, trace_memory=True):
+    result = {}
+    with measure(result, len(titles), trace_memory):
+        for title in titles:
+            normalize_scraped_data(title)
+    return result
+
+
+def bench_matcher(rows, titles, users, rng, trace_memory=True):
+    """Load a synthetic wishlist of `rows` items, then match every title
+    against it (what check_against_wishlist does for each scrape)."""
+    result = {'wishlist_rows': rows}
+    matcher = WishlistMatcher()
+    load = {}
+    with measure(load, rows, trace_memory):
+        matcher.load(synthetic_wishlist(rows, users, rng))
+    result['load'] = load
+
+    latencies = []
+    matches = 0
+    match = {}
+    with measure(match, len(titles), trace_memory):
+        for title in titles:
+            start = time.perf_counter()
+            matches += len(matcher.match(title))
+            latencies.append(time.perf_counter() - start)
+    match.update(percentiles(latencies))
+    match['matches'] = matches
+    result['match'] = match
+    return result
+
+
+async def bench_scrape(server, count, concurrency):
+    # Item pages through scrape_listing (HTTP fast path against the local server).
+    # Prices aren't saved here, bench_db_writes covers that with throwaway names
+    queue = asyncio.Queue()
+    for url in server.listing_urls(count):
+        queue.put_nowait(url)
+    stats = BulkScrapeStats()
+
+    async def worker():
+        while not queue.empty():
+            url = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                await scrape_listing(url, fast_path=True, use_cache=False)
+            except Exception as e:
+                stats.record_failure(url, e)
+                continue
+            stats.record_success(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    stats.stop()
+    summary = stats.summary()
+    summary.update(percentiles(stats.latencies))
+    return summary
+
+
+async def bench_search(server):
+    latencies = []
+    results = 0
+    start = last = time.perf_counter()
+    async for _ in iter_search_results(server.search_url(), max_pages=server.search_pages, fast_path=True):
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+        results += 1
+    elapsed = time.perf_counter() - start
+    return {
+        'pages': server.search_pages,
+        'results': results,
+        'results_per_page': round(results / server.search_pages, 1),
+        'elapsed_s': round(elapsed, 4),
+        'throughput_per_s': round(results / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def bench_db_writes(rows, batch_size, rng):
+    # The write-behind save path: PriceWriter -> record_observations, bench rows deleted afterwards
+    writer = PriceWriter(batch_size=batch_size)
+    listings = [
+        (f"{BENCH_PREFIX} {synthetic_title(rng)}", f"{BENCH_PREFIX}-{n}") for n in range(max(1, rows // 20))
+    ]
+    result = {'batch_size': batch_size}
+    try:
+        with measure(result, rows, trace_memory=False):
+            for _ in range(rows):
+                name, card_id = rng.choice(listings)
+                writer.add(name, Decimal(rng.randint(100, 50000)) / 100, card_id=card_id)
+                await asyncio.sleep(0)
+            await writer.close()
+    finally:
+        await sync_to_async(cleanup_bench_rows)()
+    result['batches'] = writer.batches
+    return result
+
+
+def cleanup_bench_rows():
+    PokemonPrice.objects.filter(name__startswith=BENCH_PREFIX).delete()
+    PriceRollup.objects.filter(card_id__startswith=BENCH_PREFIX).delete()
+
+
+async def run_benchmarks(wishlist_rows=(10000,), titles=10000, users=1000, listings=500,
+                         concurrency=8, search_pages=5, db_rows=5000, batch_size=200,
+                         trace_memory=True, seed=0, skip=()):
+    """Run every benchmark and return one JSON-serializable report."""
+    rng = random.Random(seed)
+    report = {'seed': seed, 'benchmarks': {}}
+    benchmarks = report['benchmarks']
+    sample_titles = [synthetic_title(rng) for _ in range(titles)]
+
+    if 'normalize' not in skip:
+        benchmarks['normalize'] = bench_normalize(sample_titles, trace_memory)
+    if 'matcher' not in skip:
+        benchmarks['matcher'] = [
+            bench_matcher(rows, sample_titles, users, rng, trace_memory) for rows in wishlist_rows
+        ]
+
+    server = FixtureServer(search_pages)
+    await server.start()
+    try:
+        if 'scrape' not in skip:
+            benchmarks['scrape'] = await bench_scrape(server, listings, concurrency)
+        if 'search' not in skip:
+            benchmarks['search'] = await bench_search(server)
+    finally:
+        await server.stop()
+
+    if 'db' not in skip:
+        benchmarks['db_writes'] = await bench_db_writes(db_rows, batch_size, rng)
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
@@ -0,0 +1,168 @@
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .metrics import metrics
+
+# Nothing we extract depends on these, so don't spend bandwidth/CPU on them
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+
+
+def playwright_api():
+    # Imported on first launch rather than with this module: Playwright is the
+    # slowest import on the bot's startup path, and the bot in worker mode and
+    # the web process never open a browser
+    from playwright import async_api
+    return async_api
+
+
+def is_first_party(host):
+    # ebay.com, ebay.co.uk, ir.ebaystatic.com, i.ebayimg.com, ...
+    return any(label.startswith('ebay') for label in (host or '').split('.'))
+
+
+async def block_heavy_resources(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    elif request.resource_type == 'script' and not is_first_party(urlsplit(request.url).hostname):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class _PageSlot:
+    # One pooled browser context with its single page
+    def __init__(self):
+        self.browser = None  # The browser the context was opened in
+        self.context = None
+        self.page = None
+        self.uses = 0
+        self.crashed = False
+
+    def needs_recycle(self, max_uses, browser):
+        return (
+            self.page is None
+            or self.crashed
+            or self.browser is not browser  # Opened before a relaunch, its context died with the old browser
+            or self.page.is_closed()
+            or self.uses >= max_uses
+        )
+
+
+class BrowserPool:
+    """Long-lived Chromium instance handing out pooled contexts/pages.
+
+    Pages are recycled (fresh context + page) after `max_uses` navigations or
+    as soon as they crash, so a bad page never leaks into the next scrape.
+    """
+
+    def __init__(self, size=None, max_uses=None, headless=True, block_resources=None):
+        self.size = size or getattr(settings, 'SCRAPER_BROWSER_POOL_SIZE', 4)
+        self.max_uses = max_uses or getattr(settings, 'SCRAPER_PAGE_MAX_USES', 50)
+        self.headless = headless
+        if block_resources is None:
+            block_resources = getattr(settings, 'SCRAPER_BLOCK_RESOURCES', True)
+        self.block_resources = block_resources
+        self._playwright = None
+        self._browser = None
+        self._slots = None  # Queue of the idle slots
+        self._all_slots = []  # Idle or checked out, so stop() can close every context
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def started(self):
+        return self._browser is not None
+
+    async def start(self):
+        # Safe to call repeatedly, only the first call launches the browser
+        async with self._start_lock:
+            if self.started:
+                return
+            with metrics.stage('browser_launch'):
+                self._playwright = await playwright_api().async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            self._slots = asyncio.Queue()
+            self._all_slots = [_PageSlot() for _ in range(self.size)]
+            for slot in self._all_slots:
+                self._slots.put_nowait(slot)
+            print(f"Browser pool started ({self.size} pages, recycle after {self.max_uses} uses)")
+
+    async def stop(self):
+        async with self._start_lock:
+            if not self.started:
+                return
+            # Including the ones in use: their scrapes fail rather than leak a context
+            for slot in self._all_slots:
+                await self._close_slot(slot)
+            try:
+                await self._browser.close()
+            except playwright_api().Error:
+                pass
+            await self._playwright.stop()
+            self._browser = None
+            self._playwright = None
+            self._slots = None
+            self._all_slots = []
+            print("Browser pool stopped")
+
+    async def _relaunch_if_disconnected(self):
+        if not self.started or self._browser.is_connected():
+            return
+        async with self._start_lock:
+            # Another page() may have relaunched it while this one waited
+            if self.started and not self._browser.is_connected():
+                print("Browser disconnected, relaunching")
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+
+    async def _close_slot(self, slot):
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except playwright_api().Error:
+                pass
+        slot.browser = None
+        slot.context = None
+        slot.page = None
+        slot.uses = 0
+        slot.crashed = False
+
+    async def _open_slot(self, slot):
+        await self._close_slot(slot)
+        slot.browser = self._browser
+        slot.context = await self._browser.new_context()
+        if self.block_resources:
+            await slot.context.route('**/*', block_heavy_resources)
+        slot.page = await slot.context.new_page()
+        slot.page.on('crash', lambda _page: setattr(slot, 'crashed', True))
+
+    @asynccontextmanager
+    async def page(self):
+        if not self.started:
+            await self.start()
+
+        with metrics.stage('page_acquire'):
+            slot = await self._slots.get()
+        try:
+            await self._relaunch_if_disconnected()
+            if slot.needs_recycle(self.max_uses, self._browser):
+                with metrics.stage('page_open'):
+                    await self._open_slot(slot)
+            slot.uses += 1
+            yield slot.page
+        except playwright_api().Error:
+            # Don't hand a possibly broken page to the next caller
+            slot.crashed = True
+            raise
+        finally:
+            if slot.crashed and self.started:
+                await self._close_slot(slot)
+            if self._slots is not None:
+                self._slots.put_nowait(slot)
+
+
+# Shared by every scraper entry point; the bot starts and stops it explicitly,
+# anything else gets it started lazily on first use.
+browser_pool = BrowserPool()
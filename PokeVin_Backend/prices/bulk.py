@@ -0,0 +1,142 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .listing_parser import listing_key
+from .resilience import failure_kind
+from .scraper import scrape_listing, save_to_db
+
+
+class DomainRateLimiter:
+    # Spaces out requests so each domain sees at most `rate` requests per second
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url):
+        if not self.interval:
+            return
+        domain = urlsplit(url).hostname or ''
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(domain, now))
+            self._next_slot[domain] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class BulkScrapeStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.latencies = []
+        self.failures = []  # [(url, error)]
+        self.failure_kinds = {}  # blocked/removed/timeout/... -> count
+
+    def record_success(self, latency):
+        self.latencies.append(latency)
+
+    def record_failure(self, url, error):
+        self.failures.append((url, str(error)))
+        kind = failure_kind(error) or 'error'
+        self.failure_kinds[kind] = self.failure_kinds.get(kind, 0) + 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def total(self):
+        return len(self.latencies) + len(self.failures)
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return {
+            "total": self.total,
+            "succeeded": len(self.latencies),
+            "failed": len(self.failures),
+            "failure_kinds": dict(self.failure_kinds),
+            "elapsed_s": round(elapsed, 2),
+            "throughput_per_s": round(self.total / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000),
+            "p95_ms": round(self.percentile(95) * 1000),
+        }
+
+    def format(self):
+        s = self.summary()
+        kinds = ", ".join(f"{kind} {count}" for kind, count in sorted(s['failure_kinds'].items()))
+        return (
+            f"Scraped {s['total']} URLs in {s['elapsed_s']}s "
+            f"({s['throughput_per_s']}/s): {s['succeeded']} ok, {s['failed']} failed"
+            f"{f' ({kinds})' if kinds else ''}, "
+            f"p50 {s['p50_ms']} ms, p95 {s['p95_ms']} ms"
+        )
+
+
+def read_urls(lines):
+    # One URL per line, blank lines and # comments ignored, duplicates (any
+    # two links to the same eBay item) dropped
+    seen = set()
+    urls = []
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith('#') and listing_key(url) not in seen:
+            seen.add(listing_key(url))
+            urls.append(url)
+    return urls
+
+
+async def scrape_bulk(urls, concurrency=None, per_domain_rate=None, on_result=None):
+    """Scrape many listings concurrently, saving each price as soon as it lands.
+
+    `on_result(url, name, price)` is awaited after every successful save.
+    Returns a BulkScrapeStats for the run.
+    """
+    concurrency = concurrency or getattr(settings, 'SCRAPER_BULK_CONCURRENCY', 4)
+    if per_domain_rate is None:
+        per_domain_rate = getattr(settings, 'SCRAPER_BULK_DOMAIN_RATE', 2.0)
+
+    limiter = DomainRateLimiter(per_domain_rate)
+    stats = BulkScrapeStats()
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+
+    async def worker():
+        while True:
+            try:
+                url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                # Only a real fetch takes a rate-limit slot, not a cached or shared result
+                name, price = await scrape_listing(url, before_fetch=limiter.wait)
+                await save_to_db(name, price)
+            except Exception as e:
+                print(f"Error scraping {url}: {e}")
+                stats.record_failure(url, e)
+                continue
+            latency = time.perf_counter() - start
+            if on_result is not None:
+                try:
+                    await on_result(url, name, price)
+                except Exception as e:
+                    # e.g. a failed DM: this URL counts as failed, the rest carry on
+                    print(f"Error handling the result for {url}: {e}")
+                    stats.record_failure(url, e)
+                    continue
+            stats.record_success(latency)
+
+    # A fixed set of workers keeps memory flat no matter how many URLs are queued
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(urls)))))
+    stats.stop()
+    return stats
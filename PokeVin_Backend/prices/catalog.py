@@ -0,0 +1,153 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, Value, When
+from django.db.utils import OperationalError
+
+from .models import Card, CardSet
+
+# Local mirror of the pokemontcg.io card catalog (filled by `manage.py sync_cards`).
+# Lookups return the same dict shape as the API so the bot can use either.
+
+SEARCH_LIMIT = 250  # pokemontcg.io's default page size
+BATCH_SIZE = 500
+
+
+def _fts_query(text, column=None):
+    # Every word must match, the last one as a prefix so "pika" finds Pikachu
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    query = ' AND '.join(terms)
+    return f'{column} : ({query})' if column else query
+
+
+# Lookups read plain value rows in one query, building model instances would
+# cost more than the index lookup itself
+CARD_FIELDS = (
+    'card_id', 'name', 'number', 'rarity', 'image_small', 'image_large',
+    'card_set__set_id', 'card_set__name', 'card_set__series',
+    'card_set__printed_total', 'card_set__total',
+)
+
+CARD_SELECT = """
+    SELECT c.card_id, c.name, c.number, c.rarity, c.image_small, c.image_large,
+           s.set_id, s.name, s.series, s.printed_total, s.total
+    FROM prices_card c
+    JOIN prices_cardset s ON s.id = c.card_set_id
+"""
+
+# Best matches first, so the LIMIT never cuts off the card asked for: an
+# exact name ("Pikachu", not "Pikachu V"), then FTS5's bm25 rank
+FTS_SQL = CARD_SELECT + """
+    JOIN prices_card_fts f ON f.rowid = c.id
+    WHERE prices_card_fts MATCH %s
+    ORDER BY c.name = %s COLLATE NOCASE DESC, f.rank, c.id
+    LIMIT %s
+"""
+
+
+def card_to_api_dict(row):
+    # Same shape as a pokemontcg.io card, so callers can't tell the difference
+    card_id, name, number, rarity, image_small, image_large, set_id, set_name, series, printed_total, total = row
+    return {
+        "id": card_id,
+        "name": name,
+        "number": number,
+        "rarity": rarity,
+        "set": {
+            "id": set_id,
+            "name": set_name,
+            "series": series,
+            "printedTotal": printed_total,
+            "total": total,
+        },
+        "images": {
+            "small": image_small,
+            "large": image_large,
+        },
+    }
+
+
+def search_cards(text, column=None, limit=SEARCH_LIMIT):
+    """Cards matching `text` across name/set/number, or one `column` of them."""
+    query = _fts_query(text, column)
+    if query is None:
+        return []
+    if connection.vendor == 'sqlite':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(FTS_SQL, [query, text.strip(), limit])
+                return [card_to_api_dict(row) for row in cursor.fetchall()]
+        except OperationalError:
+            pass  # No FTS5 table, use the plain indexes below
+
+    cards = Card.objects.all()
+    if column == 'set_name':
+        cards = cards.filter(card_set__name__icontains=text)
+    elif column == 'number':
+        cards = cards.filter(number=text)
+    else:
+        cards = cards.filter(name__icontains=text)
+    cards = cards.annotate(
+        exact=Case(When(name__iexact=text.strip(), then=Value(0)), default=Value(1)),
+    ).order_by('exact', 'id')
+    return [card_to_api_dict(row) for row in cards.values_list(*CARD_FIELDS)[:limit]]
+
+
+def find_cards_by_name(name, limit=SEARCH_LIMIT):
+    return search_cards(name, column='name', limit=limit)
+
+
+def find_card_by_id(card_id):
+    with connection.cursor() as cursor:
+        cursor.execute(CARD_SELECT + " WHERE c.card_id = %s", [card_id])
+        row = cursor.fetchone()
+    return card_to_api_dict(row) if row else None
+
+def upsert_sets(sets):
+    # `sets` are pokemontcg.io set dicts; returns {set_id: CardSet}
+    CardSet.objects.bulk_create(
+        [
+            CardSet(
+                set_id=s['id'],
+                name=s['name'],
+                series=s.get('series', ''),
+                ptcgo_code=s.get('ptcgoCode') or '',
+                printed_total=s.get('printedTotal'),
+                total=s.get('total'),
+                release_date=s.get('releaseDate', ''),
+                api_updated_at=s.get('updatedAt', ''),
+            )
+            for s in sets
+        ],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['set_id'],
+        update_fields=['name', 'series', 'ptcgo_code', 'printed_total', 'total', 'release_date', 'api_updated_at'],
+    )
+    return CardSet.objects.in_bulk([s['id'] for s in sets], field_name='set_id')
+
+
+def upsert_cards(cards, card_sets):
+    # `cards` are pokemontcg.io card dicts, `card_sets` maps set_id -> CardSet
+    Card.objects.bulk_create(
+        [
+            Card(
+                card_id=c['id'],
+                name=c['name'],
+                card_set=card_sets[c['set']['id']],
+                number=c.get('number', ''),
+                rarity=c.get('rarity', ''),
+                image_small=c.get('images', {}).get('small', ''),
+                image_large=c.get('images', {}).get('large', ''),
+            )
+            for c in cards
+        ],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['card_id'],
+        update_fields=['name', 'card_set', 'number', 'rarity', 'image_small', 'image_large'],
+    )
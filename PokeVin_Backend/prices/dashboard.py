@@ -0,0 +1,98 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from .models import Card, PokemonPrice, PriceRollup
+from .price_cache import price_cache
+
+# Aggregates for the admin price dashboard. Computing them means going over
+# every observation in the window, so the result is cached in the shared
+# 'prices' cache and recomputed at most every DASHBOARD_CACHE_SECONDS; the
+# page says how old the numbers are. Scrape volume comes from the daily
+# rollups, which also still cover days whose raw rows were compacted away.
+
+DASHBOARD_KEY = 'admin:dashboard'
+DASHBOARD_DAYS = 30
+TOP_CARDS = 25
+SOURCES_KEY = 'admin:sources'
+
+
+def dashboard_setting(name, default):
+    return getattr(settings, f'DASHBOARD_{name}', default)
+
+
+def _median(queryset, count):
+    # The middle one or two prices, read straight off a sorted scan of the card's rows
+    middle = list(queryset.order_by('price').values_list('price', flat=True)[(count - 1) // 2:count // 2 + 1])
+    return (sum(middle) / len(middle)).quantize(Decimal('0.01'))
+
+
+def daily_volume(since):
+    # Rollups only cover listings that resolved to a catalog card
+    return list(
+        PriceRollup.objects.filter(period=PriceRollup.DAY, bucket_start__gte=since)
+        .values('bucket_start')
+        .annotate(count=Sum('count'))
+        .order_by('bucket_start')
+    )
+
+
+def card_stats(since, limit=TOP_CARDS):
+    """Min/median/max/count for the `limit` most scraped cards since `since`."""
+    window = PokemonPrice.objects.filter(date_fetched__gte=since).exclude(card_id='')
+    cards = list(
+        window.values('card_id')
+        .annotate(count=Count('id'), min_price=Min('price'), max_price=Max('price'))
+        .order_by('-count')[:limit]
+    )
+    names = dict(
+        (card_id, f"{name} ({set_name})")
+        for card_id, name, set_name in Card.objects.filter(
+            card_id__in=[card['card_id'] for card in cards]
+        ).values_list('card_id', 'name', 'card_set__name')
+    )
+    for card in cards:
+        card['name'] = names.get(card['card_id'], '')
+        card['median_price'] = _median(window.filter(card_id=card['card_id']), card['count'])
+    return cards
+
+
+def compute_dashboard(days=DASHBOARD_DAYS):
+    now = timezone.now()
+    since = now - timedelta(days=days)
+    volume = daily_volume(since)
+    return {
+        'days': days,
+        'computed_at': now,
+        'daily_volume': volume,
+        'total_volume': sum(day['count'] for day in volume),
+        'max_daily_volume': max((day['count'] for day in volume), default=0),
+        'cards': card_stats(since),
+    }
+
+
+def dashboard(refresh=False):
+    cache = price_cache()
+    data = None if refresh else cache.get(DASHBOARD_KEY)
+    if data is None:
+        data = compute_dashboard()
+        cache.set(DASHBOARD_KEY, data, dashboard_setting('CACHE_SECONDS', 600))
+    return data
+
+
+def price_sources():
+    """Every source prices for catalog cards came from, for the admin's
+    source filter. Read from the daily rollups (far fewer rows than the raw
+    table) and cached."""
+    cache = price_cache()
+    sources = cache.get(SOURCES_KEY)
+    if sources is None:
+        sources = list(
+            PriceRollup.objects.filter(period=PriceRollup.DAY)
+            .order_by('source').values_list('source', flat=True).distinct()
+        )
+        cache.set(SOURCES_KEY, sources, dashboard_setting('CACHE_SECONDS', 600))
+    return sources
@@ -0,0 +1,208 @@
+import asyncio
+import itertools
+import json
+import time
+from datetime import datetime, timezone
+
+from aiohttp import WSMsgType, web
+
+from .shards import shard_for_guild
+
+# A stand-in for Discord, for running the bot (sharded or not) locally without
+# a real token: `manage.py fake_gateway` serves just enough of the REST API
+# (login, application info, gateway info, sending messages, DM channels) and
+# of the gateway (hello, heartbeats, identify -> READY with no guilds) for the
+# bot to come online, plus a control API to inject messages as if users sent
+# them and to read back what the bot sent:
+#
+#   POST /_fake/messages {"content": "!commands", "author_id": 1, "guild_id": 2, "channel_id": 3}
+#   GET  /_fake/state
+#
+# Start the bot with DISCORD_API_BASE=http://127.0.0.1:<port> to use it.
+# A guild message is dispatched to the shard Discord would route the guild to.
+
+API_PREFIX = '/api/v10'
+HEARTBEAT_INTERVAL = 41250  # Milliseconds, what Discord sends
+# Heartbeats are acked after a round trip's worth of delay: discord.py notes
+# when it sent one only after handing it over, an instant ack comes first
+HEARTBEAT_ACK_DELAY = 0.05
+
+BOT_USER_ID = 100000000000000001
+OWNER_ID = 100000000000000002
+
+
+def _user(user_id, username, bot=False):
+    return {
+        'id': str(user_id), 'username': username, 'discriminator': '0', 'global_name': None,
+        'avatar': None, 'bot': bot,
+    }
+
+
+def _json(data, status=200):
+    # discord.py only decodes a body whose content type is exactly application/json
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status, content_type='application/json')
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeDiscord:
+    def __init__(self):
+        self.bot_user = _user(BOT_USER_ID, 'PokeVin', bot=True)
+        self.shards = {}  # shard_id -> (websocket, shard_count)
+        self.sent = []  # Messages the bot sent, oldest first
+        self.dm_channels = {}  # user_id -> channel_id
+        self._ids = itertools.count(int(time.time() * 1000) << 22)
+        self._sequence = itertools.count(1)
+
+    def next_id(self):
+        return str(next(self._ids))
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([
+            web.get(f'{API_PREFIX}/users/@me', self.get_me),
+            web.get(f'{API_PREFIX}/users/{{user_id}}', self.get_user),
+            web.post(f'{API_PREFIX}/users/@me/channels', self.create_dm),
+            web.get(f'{API_PREFIX}/oauth2/applications/@me', self.get_application),
+            web.get(f'{API_PREFIX}/gateway', self.get_gateway),
+            web.get(f'{API_PREFIX}/gateway/bot', self.get_bot_gateway),
+            web.post(f'{API_PREFIX}/channels/{{channel_id}}/messages', self.create_message),
+            web.get('/gateway', self.gateway),
+            web.get('/gateway/', self.gateway),
+            web.post('/_fake/messages', self.inject_message),
+            web.get('/_fake/state', self.state),
+        ])
+        return app
+
+    def gateway_url(self, request):
+        return f'ws://{request.host}/gateway'
+
+    # REST
+
+    async def get_me(self, request):
+        return _json(self.bot_user)
+
+    async def get_user(self, request):
+        user_id = request.match_info['user_id']
+        return _json(_user(user_id, f'user{user_id}'))
+
+    async def create_dm(self, request):
+        user_id = int((await request.json())['recipient_id'])
+        channel_id = self.dm_channels.setdefault(user_id, self.next_id())
+        return _json({
+            'id': channel_id, 'type': 1, 'last_message_id': None,
+            'recipients': [_user(user_id, f'user{user_id}')],
+        })
+
+    async def get_application(self, request):
+        return _json({
+            'id': self.bot_user['id'], 'name': 'PokeVin', 'description': '', 'icon': None,
+            'bot_public': False, 'bot_require_code_grant': False, 'owner': _user(OWNER_ID, 'owner'),
+            'verify_key': '0' * 64, 'flags': 0,
+        })
+
+    async def get_gateway(self, request):
+        return _json({'url': self.gateway_url(request)})
+
+    async def get_bot_gateway(self, request):
+        return _json({
+            'url': self.gateway_url(request), 'shards': 1,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1},
+        })
+
+    async def create_message(self, request):
+        channel_id = request.match_info['channel_id']
+        if request.content_type == 'application/json':
+            body = await request.json()
+        else:  # multipart, when the bot attaches a file
+            body = {'content': None, 'attachments': []}
+            async for part in await request.multipart():
+                if part.name == 'payload_json':
+                    body.update(json.loads(await part.text()))
+                elif part.filename:
+                    body['attachments'].append({'filename': part.filename, 'size': len(await part.read())})
+        message = self.message(channel_id, self.bot_user, body.get('content') or '')
+        self.sent.append({
+            'channel_id': channel_id, 'content': message['content'],
+            'embeds': [embed.get('title') for embed in body.get('embeds') or []],
+            'attachments': [attachment.get('filename') for attachment in body.get('attachments') or []],
+        })
+        return _json(message)
+
+    def message(self, channel_id, author, content, guild_id=None):
+        message = {
+            'id': self.next_id(), 'channel_id': str(channel_id), 'author': author, 'content': content,
+            'timestamp': _now(), 'edited_timestamp': None, 'tts': False, 'mention_everyone': False,
+            'mentions': [], 'mention_roles': [], 'attachments': [], 'embeds': [], 'pinned': False, 'type': 0,
+        }
+        if guild_id is not None:
+            message['guild_id'] = str(guild_id)
+        return message
+
+    # Gateway
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({'op': 10, 'd': {'heartbeat_interval': HEARTBEAT_INTERVAL}, 's': None, 't': None})
+        shard_id = None
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            payload = json.loads(msg.data)
+            op = payload.get('op')
+            if op == 1:  # Heartbeat
+                await asyncio.sleep(HEARTBEAT_ACK_DELAY)
+                await ws.send_json({'op': 11, 'd': None, 's': None, 't': None})
+            elif op == 2:  # Identify
+                shard_id, shard_count = payload['d'].get('shard') or (0, 1)
+                self.shards[shard_id] = (ws, shard_count)
+                await self.dispatch(ws, 'READY', {
+                    'v': 10, 'user': self.bot_user, 'guilds': [], 'session_id': self.next_id(),
+                    'resume_gateway_url': self.gateway_url(request), 'shard': [shard_id, shard_count],
+                    'application': {'id': self.bot_user['id'], 'flags': 0},
+                })
+            elif op == 6:  # Resume: not supported, the bot identifies again
+                await ws.send_json({'op': 9, 'd': False, 's': None, 't': None})
+        if shard_id is not None and self.shards.get(shard_id, (None,))[0] is ws:
+            del self.shards[shard_id]
+        return ws
+
+    async def dispatch(self, ws, event, data):
+        await ws.send_json({'op': 0, 's': next(self._sequence), 't': event, 'd': data})
+
+    # Control API
+
+    async def inject_message(self, request):
+        body = await request.json()
+        guild_id = body.get('guild_id')
+        author_id = body.get('author_id', 1)
+        if not self.shards:
+            return _json({'error': 'no shard is connected'}, status=409)
+        shard_count = next(iter(self.shards.values()))[1]
+        # DMs go to shard 0, like on Discord
+        shard_id = shard_for_guild(int(guild_id), shard_count) if guild_id else 0
+        if shard_id not in self.shards:
+            return _json({'error': f'shard {shard_id} is not connected'}, status=409)
+        channel_id = body.get('channel_id') or self.dm_channels.setdefault(int(author_id), self.next_id())
+        message = self.message(channel_id, _user(author_id, f'user{author_id}'), body['content'], guild_id)
+        await self.dispatch(self.shards[shard_id][0], 'MESSAGE_CREATE', message)
+        return _json({'shard': shard_id, 'message': message})
+
+    async def state(self, request):
+        return _json({
+            'shards': {shard_id: shard_count for shard_id, (_, shard_count) in sorted(self.shards.items())},
+            'sent': self.sent,
+        })
+
+
+async def serve(host='127.0.0.1', port=8780):
+    runner = web.AppRunner(FakeDiscord().app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,229 @@
+import statistics
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import PokemonPrice, PriceRollup
+from .price_cache import invalidate_prices
+
+# PokemonPrice is append-only: each scrape is a new observation. Hourly and
+# daily PriceRollup rows (min/max/median/count) per card are kept up to date
+# as observations are written, touching only the buckets those rows fall in.
+# Listing titles vary from one listing to the next, so observations that
+# didn't resolve to a catalog card are kept raw but never rolled up.
+
+CHUNK_SIZE = 5000
+
+
+def bucket_start(moment, period):
+    hour = moment.replace(minute=0, second=0, microsecond=0)
+    return hour if period == PriceRollup.HOUR else hour.replace(hour=0)
+
+
+def bucket_end(start, period):
+    return start + (timedelta(hours=1) if period == PriceRollup.HOUR else timedelta(days=1))
+
+
+def summarize(prices):
+    return {
+        'count': len(prices),
+        'min_price': min(prices),
+        'max_price': max(prices),
+        'median_price': Decimal(statistics.median(prices)).quantize(Decimal('0.01')),
+    }
+
+
+def save_rollups(rollups):
+    PriceRollup.objects.bulk_create(
+        rollups,
+        batch_size=CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=['card_id', 'source', 'period', 'bucket_start'],
+        update_fields=['count', 'min_price', 'max_price', 'median_price'],
+    )
+
+
+def refresh_rollups(buckets):
+    # Recompute the given (card_id, source, period, bucket_start) rollups from
+    # raw rows: one read covering every bucket, one upsert writing them all
+    buckets = set(buckets)
+    if not buckets:
+        return
+    rows = PokemonPrice.objects.filter(
+        card_id__in={card_id for card_id, _, _, _ in buckets},
+        source__in={source for _, source, _, _ in buckets},
+        date_fetched__gte=min(start for _, _, _, start in buckets),
+        date_fetched__lt=max(bucket_end(start, period) for _, _, period, start in buckets),
+    ).values_list('card_id', 'source', 'price', 'date_fetched')
+
+    prices = {}
+    for card_id, source, price, fetched in rows:
+        for period in (PriceRollup.HOUR, PriceRollup.DAY):
+            key = (card_id, source, period, bucket_start(fetched, period))
+            if key in buckets:
+                prices.setdefault(key, []).append(price)
+
+    save_rollups([
+        PriceRollup(card_id=card_id, source=source, period=period, bucket_start=start, **summarize(values))
+        for (card_id, source, period, start), values in prices.items()
+    ])
+
+
+def _nth(weighted, index):
+    # The index-th value of sorted (value, weight) pairs, as if each value were repeated weight times
+    for value, weight in weighted:
+        if index < weight:
+            return value
+        index -= weight
+
+
+def merge_rollup(rollup, prices):
+    """Fold new prices into a rollup whose raw rows may be gone. Count, min
+    and max stay exact; the old rows stand in as `count` copies of their
+    median, so the merged median is an estimate."""
+    weighted = sorted([(price, 1) for price in prices] + [(rollup.median_price, rollup.count)])
+    total = rollup.count + len(prices)
+    middle = (_nth(weighted, (total - 1) // 2) + _nth(weighted, total // 2)) / 2
+    rollup.count = total
+    rollup.min_price = min(rollup.min_price, *prices)
+    rollup.max_price = max(rollup.max_price, *prices)
+    rollup.median_price = Decimal(middle).quantize(Decimal('0.01'))
+    return rollup
+
+
+def update_rollups(observations):
+    """Bring the rollups of newly written observations up to date. Buckets
+    within raw retention are recomputed from raw rows. Older ones may have
+    been compacted down to each card's latest row, so recomputing would
+    replace an accurate rollup with one counting the survivors: the new
+    prices are merged into the existing rollup instead. Hourly buckets past
+    their retention are left alone, compaction drops them anyway."""
+    now = timezone.now()
+    raw_cutoff = now - timedelta(days=getattr(settings, 'PRICE_RAW_RETENTION_DAYS', 30))
+    hourly_cutoff = now - timedelta(days=getattr(settings, 'PRICE_HOURLY_RETENTION_DAYS', 365))
+    recent, compacted = set(), {}
+    for obs in observations:
+        if not obs.card_id:
+            continue
+        for period in (PriceRollup.HOUR, PriceRollup.DAY):
+            start = bucket_start(obs.date_fetched, period)
+            key = (obs.card_id, obs.source, period, start)
+            if bucket_end(start, period) > raw_cutoff:
+                recent.add(key)
+            elif period == PriceRollup.DAY or start >= hourly_cutoff:
+                compacted.setdefault(key, []).append(obs.price)
+
+    existing = {}
+    if compacted:
+        rollups = PriceRollup.objects.filter(
+            card_id__in={card_id for card_id, _, _, _ in compacted},
+            bucket_start__gte=min(start for _, _, _, start in compacted),
+            bucket_start__lte=max(start for _, _, _, start in compacted),
+        )
+        existing = {(r.card_id, r.source, r.period, r.bucket_start): r for r in rollups}
+    # A bucket that never had a rollup has nothing to lose: recompute it
+    recent.update(key for key in compacted if key not in existing)
+    refresh_rollups(recent)
+    PriceRollup.objects.bulk_update(
+        [merge_rollup(existing[key], prices) for key, prices in compacted.items() if key in existing],
+        ['count', 'min_price', 'max_price', 'median_price'],
+        batch_size=CHUNK_SIZE,
+    )
+
+
+def record_observations(rows):
+    """Append (name, price, source, card_id) observations and update their
+    rollups in one transaction, then expire the cached API responses they change."""
+    with transaction.atomic():
+        observations = PokemonPrice.objects.bulk_create(
+            [
+                PokemonPrice(name=name[:100], price=price, source=source, card_id=card_id or '')
+                for name, price, source, card_id in rows
+            ],
+            batch_size=CHUNK_SIZE,
+        )
+        update_rollups(observations)
+    invalidate_prices({obs.card_id for obs in observations if obs.card_id})
+    return observations
+
+
+def latest_price(card_id, source='eBay'):
+    return PokemonPrice.objects.filter(card_id=card_id, source=source).order_by('-date_fetched').first()
+
+
+def price_history(card_id, source='eBay', period=PriceRollup.DAY, since=None):
+    rollups = PriceRollup.objects.filter(card_id=card_id, source=source, period=period)
+    if since is not None:
+        rollups = rollups.filter(bucket_start__gte=since)
+    return rollups.order_by('bucket_start')
+
+
+def rebuild_rollups(since=None):
+    """Backfill rollups from raw rows in one ordered pass (for rows written
+    before rollups existed). Returns the number of rollups written."""
+    observations = PokemonPrice.objects.exclude(card_id='').order_by('card_id', 'source', 'date_fetched')
+    if since is not None:
+        observations = observations.filter(date_fetched__gte=since)
+
+    written = 0
+    pending = []
+    current = {PriceRollup.HOUR: (None, []), PriceRollup.DAY: (None, [])}
+
+    def flush_bucket(period):
+        key, prices = current[period]
+        if prices:
+            card_id, source, start = key
+            pending.append(PriceRollup(card_id=card_id, source=source, period=period, bucket_start=start, **summarize(prices)))
+
+    def write_pending():
+        save_rollups(pending)
+        pending.clear()
+
+    for card_id, source, price, fetched in observations.values_list('card_id', 'source', 'price', 'date_fetched').iterator(CHUNK_SIZE):
+        for period in (PriceRollup.HOUR, PriceRollup.DAY):
+            key = (card_id, source, bucket_start(fetched, period))
+            if current[period][0] != key:
+                flush_bucket(period)
+                current[period] = (key, [])
+            current[period][1].append(price)
+        if len(pending) >= CHUNK_SIZE:
+            written += len(pending)
+            write_pending()
+
+    for period in current:
+        flush_bucket(period)
+    written += len(pending)
+    write_pending()
+    return written
+
+
+def compact_prices(raw_days, hourly_days):
+    """Retention: drop raw observations older than `raw_days` (their rollups
+    stay, and each card keeps its latest observation; listings that never
+    resolved to a card have no rollups and simply expire) and hourly rollups
+    older than `hourly_days`. Daily rollups are kept forever."""
+    now = timezone.now()
+    old = PokemonPrice.objects.filter(date_fetched__lt=now - timedelta(days=raw_days)).order_by('id')
+    # A newer observation of the same card, found through the (card_id, source, date_fetched) index
+    newer = PokemonPrice.objects.filter(card_id=OuterRef('card_id')).filter(
+        Q(date_fetched__gt=OuterRef('date_fetched')) | Q(date_fetched=OuterRef('date_fetched'), id__gt=OuterRef('id'))
+    )
+    stale = Q(card_id='') | Exists(newer)
+
+    # Walk old rows by id in chunks so no single transaction gets huge
+    raw, last_id = 0, 0
+    while True:
+        ids = list(old.filter(id__gt=last_id).values_list('id', flat=True)[:CHUNK_SIZE])
+        if not ids:
+            break
+        last_id = ids[-1]
+        raw += PokemonPrice.objects.filter(stale, id__in=ids).delete()[0]
+
+    hourly = PriceRollup.objects.filter(
+        period=PriceRollup.HOUR, bucket_start__lt=now - timedelta(days=hourly_days)
+    ).delete()[0]
+    return raw, hourly
@@ -0,0 +1,106 @@
+import asyncio
+from urllib.parse import urlencode
+
+import aiohttp
+from django.conf import settings
+
+from .cache import TTLCache
+
+DEFAULT_HEADERS = {
+    # eBay serves a stripped-down page (or a captcha) to obvious bots
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+        '(KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+    ),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+class HttpClient:
+    """One aiohttp session with a pooled keep-alive connector, created lazily.
+
+    aiohttp sessions are bound to the event loop they were created on, so a
+    session from a previous loop (e.g. an earlier asyncio.run) is replaced.
+    JSON GETs go through a TTL/LRU cache, and identical requests made while
+    one is already in flight share its response instead of going out again.
+    """
+
+    def __init__(self, limit=None, limit_per_host=None, timeout=None, cache_size=None, cache_ttl=None):
+        self.limit = limit or getattr(settings, 'HTTP_POOL_SIZE', 20)
+        self.limit_per_host = limit_per_host or getattr(settings, 'HTTP_POOL_SIZE_PER_HOST', 8)
+        self.timeout = timeout or getattr(settings, 'HTTP_TIMEOUT', 15)
+        self.cache = TTLCache(
+            maxsize=cache_size or getattr(settings, 'HTTP_CACHE_SIZE', 1024),
+            ttl=cache_ttl or getattr(settings, 'HTTP_CACHE_TTL', 600),
+        )
+        self.coalesced = 0
+        self._inflight = {}  # cache key -> Task
+        self._session = None
+        self._loop = None
+
+    async def session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=DEFAULT_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._loop = loop
+        return self._session
+
+    async def get_text(self, url, timeout=None):
+        # Returns (status, body); `timeout` (seconds) overrides the session's
+        session = await self.session()
+        kwargs = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        async with session.get(url, **kwargs) as response:
+            return response.status, await response.text()
+
+    async def _fetch_json(self, key, url, params, headers):
+        session = await self.session()
+        async with session.get(url, params=params, headers=headers) as response:
+            if response.status != 200:
+                return response.status, None
+            data = await response.json(content_type=None)
+        self.cache.set(key, data)
+        return 200, data
+
+    async def get_json(self, url, params=None, headers=None):
+        # Returns (status, data); data is None for anything but a 200
+        key = f"{url}?{urlencode(sorted((params or {}).items()))}"
+        data = self.cache.get(key)
+        if data is not None:
+            return 200, data
+
+        task = self._inflight.get(key)
+        if task is None:
+            headers = {'Accept': 'application/json', **(headers or {})}
+            task = asyncio.ensure_future(self._fetch_json(key, url, params, headers))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _task: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller giving up doesn't cancel the request for the others
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            **self.cache.stats(),
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+
+http_client = HttpClient()
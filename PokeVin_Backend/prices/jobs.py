@@ -0,0 +1,139 @@
+import random
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .listing_parser import canonical_listing_url
+from .models import ScrapeJob
+
+# Durable queue of listing scrapes, stored in SQLite so it survives restarts
+# of the bot and of the workers. The bot enqueues, `manage.py scrape_worker`
+# processes lease jobs (a crashed worker's lease simply runs out and another
+# worker takes over) and the bot picks finished jobs back up to report them.
+
+
+def job_setting(name, default):
+    return getattr(settings, f'SCRAPE_JOB_{name}', default)
+
+
+def _claimable(now):
+    # Queued and due, or running under a lease that ran out (the worker died)
+    return (
+        Q(status=ScrapeJob.QUEUED, available_at__lte=now)
+        | Q(status=ScrapeJob.RUNNING, leased_until__lt=now)
+    )
+
+
+@sync_to_async
+def enqueue_jobs(urls, priority=ScrapeJob.NORMAL, requested_by=None, channel_id=None):
+    """Queue a scrape per URL and return the jobs. A listing that's already
+    waiting is reused (at the higher of the two priorities) instead of being
+    queued twice."""
+    now = timezone.now()
+    urls = list(dict.fromkeys(canonical_listing_url(url) for url in urls))
+    with transaction.atomic():
+        waiting = {
+            job.url: job
+            for job in ScrapeJob.objects.filter(url__in=urls, status=ScrapeJob.QUEUED, channel_id=channel_id)
+        }
+        bumped = [job.pk for job in waiting.values() if job.priority < priority]
+        if bumped:
+            ScrapeJob.objects.filter(pk__in=bumped).update(priority=priority)
+        new = ScrapeJob.objects.bulk_create([
+            ScrapeJob(
+                url=url, priority=priority, available_at=now, requested_by=requested_by,
+                channel_id=channel_id, max_attempts=job_setting('MAX_ATTEMPTS', 3),
+            )
+            for url in urls if url not in waiting
+        ])
+    return list(waiting.values()) + new
+
+
+@sync_to_async
+def lease_jobs(worker, limit):
+    """Claim up to `limit` jobs for `worker`, highest priority first."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    leased_until = now + timedelta(seconds=job_setting('LEASE_SECONDS', 300))
+    claimed = []
+    with transaction.atomic():
+        candidates = list(
+            ScrapeJob.objects.filter(_claimable(now))
+            .order_by('-priority', 'available_at')[:limit]
+        )
+        for job in candidates:
+            if job.attempts >= job.max_attempts:
+                # Picked up max_attempts times and never finished: it keeps killing workers
+                ScrapeJob.objects.filter(pk=job.pk).update(
+                    status=ScrapeJob.FAILED, error="Lease expired too many times", error_kind='lease_expired',
+                    finished_at=now,
+                )
+                continue
+            # Conditional, so a job another worker claimed meanwhile isn't claimed twice
+            if ScrapeJob.objects.filter(_claimable(now), pk=job.pk).update(
+                status=ScrapeJob.RUNNING, worker=worker, leased_until=leased_until, attempts=F('attempts') + 1,
+            ):
+                job.attempts += 1
+                job.worker = worker
+                claimed.append(job)
+    return claimed
+
+
+@sync_to_async
+def complete_job(job, name, price):
+    ScrapeJob.objects.filter(pk=job.pk, worker=job.worker).update(
+        status=ScrapeJob.DONE, result={'name': name, 'price': str(price)},
+        error='', error_kind='', leased_until=None, finished_at=timezone.now(),
+    )
+
+
+@sync_to_async
+def fail_job(job, error, kind=None, retry=False, retry_after=None):
+    """Record a failed attempt: back in the queue after a jittered backoff
+    when `retry` and attempts are left, failed for good otherwise."""
+    now = timezone.now()
+    fields = {'error': str(error)[:1000], 'error_kind': kind or 'error', 'leased_until': None}
+    if retry and job.attempts < job.max_attempts:
+        backoff = retry_after or job_setting('RETRY_DELAY', 30) * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.5)
+        fields.update(status=ScrapeJob.QUEUED, available_at=now + timedelta(seconds=backoff))
+    else:
+        fields.update(status=ScrapeJob.FAILED, finished_at=now)
+    ScrapeJob.objects.filter(pk=job.pk, worker=job.worker).update(**fields)
+
+
+@sync_to_async
+def take_finished_jobs(limit=100):
+    """Finished jobs not reported yet, marked as reported."""
+    with transaction.atomic():
+        jobs = list(
+            ScrapeJob.objects.filter(delivered_at__isnull=True, finished_at__isnull=False)
+            .order_by('finished_at')[:limit]
+        )
+        if jobs:
+            ScrapeJob.objects.filter(pk__in=[job.pk for job in jobs]).update(delivered_at=timezone.now())
+    return jobs
+
+
+@sync_to_async
+def prune_jobs(days=None):
+    # Reported jobs are only kept around for a while, for debugging
+    days = days or job_setting('KEEP_DAYS', 7)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = ScrapeJob.objects.filter(delivered_at__lt=cutoff).delete()
+    return deleted
+
+
+@sync_to_async
+def queue_stats():
+    now = timezone.now()
+    return {
+        'queued': ScrapeJob.objects.filter(status=ScrapeJob.QUEUED).count(),
+        'due': ScrapeJob.objects.filter(_claimable(now)).count(),
+        'running': ScrapeJob.objects.filter(status=ScrapeJob.RUNNING, leased_until__gte=now).count(),
+        'failed_undelivered': ScrapeJob.objects.filter(status=ScrapeJob.FAILED, delivered_at__isnull=True).count(),
+    }
@@ -0,0 +1,256 @@
+import json
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+# Pulls title/price out of server-rendered eBay item HTML without a browser.
+# The embedded ld+json product data is tried first since it's one regex and a
+# json.loads; the h1/price markup the Playwright scraper waits for is the backup.
+
+LD_JSON_RE = re.compile(
+    r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def _iter_ld_json_nodes(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from _iter_ld_json_nodes(item)
+    elif isinstance(data, dict):
+        yield data
+        if '@graph' in data:
+            yield from _iter_ld_json_nodes(data['@graph'])
+
+
+def _offer_price(offers):
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    if not isinstance(offers, dict):
+        return None
+    price = offers.get('price') or offers.get('lowPrice')
+    return str(price) if price is not None else None
+
+
+def parse_ld_json(html):
+    for block in LD_JSON_RE.findall(html):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        for node in _iter_ld_json_nodes(data):
+            node_type = node.get('@type')
+            if node_type == 'Product' or (isinstance(node_type, list) and 'Product' in node_type):
+                name = node.get('name')
+                price = _offer_price(node.get('offers'))
+                if name and price:
+                    return name.strip(), price
+    return None, None
+
+
+class _ItemPageParser(HTMLParser):
+    # Mirrors TITLE_SELECTOR / PRICE_SELECTOR from scraper.py
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.price = None
+        self._stack = []  # (tag, in_title_h1, in_price_div)
+        self._capture = None  # 'title' | 'price'
+        self._buffer = []
+
+    def _context(self):
+        return self._stack[-1][1:] if self._stack else (False, False)
+
+    def handle_starttag(self, tag, attrs):
+        classes = (dict(attrs).get('class') or '').split()
+        in_title, in_price = self._context()
+        if tag == 'h1' and 'x-item-title__mainTitle' in classes:
+            in_title = True
+        if tag == 'div' and 'x-price-primary' in classes:
+            in_price = True
+
+        if self._capture is None and tag == 'span' and 'ux-textspans' in classes:
+            if in_title and self.title is None and 'ux-textspans--BOLD' in classes:
+                self._capture = 'title'
+            elif in_price and self.price is None:
+                self._capture = 'price'
+
+        if tag not in ('br', 'img', 'meta', 'link', 'input', 'hr', 'source'):
+            self._stack.append((tag, in_title, in_price))
+
+    def handle_endtag(self, tag):
+        # Pop back to the matching tag, tolerating sloppy markup
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                del self._stack[i:]
+                break
+        if tag == 'span' and self._capture is not None:
+            text = ''.join(self._buffer).strip()
+            if text:
+                setattr(self, self._capture, text)
+            self._capture = None
+            self._buffer = []
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._buffer.append(data)
+
+
+def parse_item_markup(html):
+    parser = _ItemPageParser()
+    parser.feed(html)
+    parser.close()
+    return parser.title, parser.price
+
+
+def parse_listing_html(html):
+    # Returns (name, price_text), either may be None when the page lacks it
+    name, price_text = parse_ld_json(html)
+    if name and price_text:
+        return name, price_text
+    return parse_item_markup(html)
+
+
+# Search results pages: one result card per listing, in either the older
+# s-item markup or the newer s-card markup eBay is rolling out
+ITEM_ID_RE = re.compile(r'/itm/(?:[^/?#]+/)?(\d{9,})')
+PRICE_RE = re.compile(r'\d[\d,]*(?:\.\d+)?')
+RESULT_CARD_CLASSES = {'s-item', 's-card'}
+RESULT_TITLE_CLASSES = {'s-item__title', 's-card__title'}
+RESULT_PRICE_CLASSES = {'s-item__price', 's-card__price'}
+# Text eBay puts in title spans that isn't part of the title
+TITLE_NOISE = ('New Listing', 'Opens in a new window or tab')
+
+
+# Older and app share links: /i/<id>, eBayISAPI.dll?ViewItem&item=<id>
+LEGACY_ITEM_ID_RE = re.compile(r'(?:/i/|[?&]item=)(\d{9,})')
+
+
+def item_id_from_url(url):
+    match = ITEM_ID_RE.search(url or '') or LEGACY_ITEM_ID_RE.search(url or '')
+    return match.group(1) if match else None
+
+
+def canonical_listing_url(url):
+    """https://www.ebay.<site>/itm/<item id> for any link to a listing: title
+    slugs, tracking parameters and mobile/legacy hosts dropped. The regional site
+    is kept since it decides the currency; URLs without an item ID are
+    returned unchanged."""
+    item_id = item_id_from_url(url)
+    if item_id is None:
+        return url
+    parts = urlsplit(url)
+    host = parts.hostname or 'www.ebay.com'
+    labels = host.split('.')
+    site = next((i for i, label in enumerate(labels) if label == 'ebay'), None)
+    if site is not None:
+        # m.ebay.com, cgi.ebay.com, ebay.co.uk -> www.ebay.<site>
+        host = '.'.join(['www'] + labels[site:])
+    if parts.port:
+        host = f'{host}:{parts.port}'
+    return f'{parts.scheme or "https"}://{host}/itm/{item_id}'
+
+
+def listing_key(url):
+    # Item IDs are the same on every eBay site, so one listing has one key
+    item_id = item_id_from_url(url)
+    return f'ebay:{item_id}' if item_id else url
+
+
+def first_price(text):
+    # "$12.34" -> "12.34"; for ranges like "$10.00 to $20.00" the low end
+    match = PRICE_RE.search(text or '')
+    return match.group(0).replace(',', '') if match else None
+
+
+class _SearchResultsParser(HTMLParser):
+
+    def __init__(self, page_url):
+        super().__init__(convert_charrefs=True)
+        self.page_url = page_url
+        self.results = []
+        self.next_url = None
+        self._card = None  # The result being filled in
+        self._card_depth = 0
+        self._stack = []  # (tag, capture) for open tags
+        self._capture = None  # 'title' | 'price'
+        self._buffer = []
+        self._in_next_link = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = set((attrs.get('class') or '').split())
+
+        if tag == 'a' and 'pagination__next' in classes and attrs.get('href'):
+            self.next_url = attrs['href']
+
+        if tag == 'li' and classes & RESULT_CARD_CLASSES and self._card is None:
+            self._card = {'item_id': attrs.get('data-listingid'), 'url': None, 'title': [], 'price': []}
+            self._card_depth = len(self._stack)
+
+        if self._card is not None:
+            if tag == 'a' and self._card['url'] is None and item_id_from_url(attrs.get('href')):
+                self._card['url'] = attrs['href']
+            if self._capture is None:
+                if classes & RESULT_TITLE_CLASSES and not self._card['title']:
+                    self._capture = 'title'
+                elif classes & RESULT_PRICE_CLASSES and not self._card['price']:
+                    self._capture = 'price'
+                if self._capture is not None:
+                    self._stack.append((tag, True))
+                    return
+
+        if tag not in ('br', 'img', 'meta', 'link', 'input', 'hr', 'source', 'wbr'):
+            self._stack.append((tag, False))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                if any(capture for _, capture in self._stack[i:]):
+                    self._end_capture()
+                del self._stack[i:]
+                break
+        if tag == 'li' and self._card is not None and len(self._stack) <= self._card_depth:
+            self._end_card()
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._buffer.append(data)
+
+    def _end_capture(self):
+        text = ' '.join(''.join(self._buffer).split())
+        if self._capture == 'title':
+            for noise in TITLE_NOISE:
+                text = text.replace(noise, '')
+            text = text.strip()
+        if text:
+            self._card[self._capture].append(text)
+        self._capture = None
+        self._buffer = []
+
+    def _end_card(self):
+        card, self._card = self._card, None
+        item_id = card['item_id'] or item_id_from_url(card['url'])
+        title = card['title'][0] if card['title'] else None
+        price = first_price(card['price'][0]) if card['price'] else None
+        # Skips eBay's "Shop on eBay" placeholder and sponsored blocks without a price
+        if item_id and title and price and title != 'Shop on eBay':
+            # On the search page's own eBay site, which decides the listing's currency
+            url = canonical_listing_url(urljoin(self.page_url, f'/itm/{item_id}'))
+            self.results.append((item_id, title, price, url))
+
+    def close(self):
+        super().close()
+        if self._card is not None:
+            self._end_card()
+
+
+def parse_search_results(html, page_url='https://www.ebay.com/'):
+    """Every result card on the search results page at `page_url` as
+    (item_id, title, price_text, url), plus the next page's URL (None on the
+    last page)."""
+    parser = _SearchResultsParser(page_url)
+    parser.feed(html)
+    parser.close()
+    return parser.results, parser.next_url
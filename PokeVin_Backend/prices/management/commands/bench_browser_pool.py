@@ -0,0 +1,86 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from playwright.async_api import async_playwright
+
+from prices.browser_pool import BrowserPool, block_heavy_resources
+from prices.scraper import extract_name_price
+
+
+async def scrape_without_pool(url, block_resources=False):
+    # The old behaviour: a fresh Playwright + Chromium for every URL
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            page = await browser.new_page()
+            if block_resources:
+                await page.route('**/*', block_heavy_resources)
+            return await extract_name_price(page, url)
+        finally:
+            await browser.close()
+
+
+async def scrape_with_pool(pool, url):
+    async with pool.page() as page:
+        return await extract_name_price(page, url)
+
+
+async def time_urls(scrape, urls):
+    latencies = []
+    for url in urls:
+        start = time.perf_counter()
+        try:
+            await scrape(url)
+        except Exception as e:
+            print(f"Error scraping {url}: {e}")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+class Command(BaseCommand):
+    help = "Compare per-URL scrape latency with and without the shared browser pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help="eBay listing URLs to scrape")
+        parser.add_argument('--repeat', type=int, default=3, help="Times to scrape each URL")
+
+    def handle(self, *args, **options):
+        urls = options['urls'] * options['repeat']
+        asyncio.run(self.run(urls))
+
+    async def run(self, urls):
+        # Blocking images/fonts/third-party scripts and reusing the browser are
+        # two separate wins: the unpooled run is timed both ways so each shows
+        without_pool = await time_urls(scrape_without_pool, urls)
+        without_pool_blocked = await time_urls(lambda url: scrape_without_pool(url, block_resources=True), urls)
+
+        pool = BrowserPool(block_resources=True)
+        # Pool startup is a one-off cost paid when the bot starts, time it separately
+        start = time.perf_counter()
+        await pool.start()
+        startup = time.perf_counter() - start
+        try:
+            with_pool = await time_urls(lambda url: scrape_with_pool(pool, url), urls)
+        finally:
+            await pool.stop()
+
+        self.report("without pool", without_pool)
+        self.report("without pool, resources blocked", without_pool_blocked)
+        self.report("with pool, resources blocked", with_pool)
+        self.stdout.write(f"pool startup: {startup * 1000:.0f} ms (once per bot run)")
+        mean = statistics.mean
+        self.stdout.write(f"resource blocking alone: {mean(without_pool) / mean(without_pool_blocked):.2f}x")
+        self.stdout.write(f"pooling alone: {mean(without_pool_blocked) / mean(with_pool):.2f}x")
+        self.stdout.write(self.style.SUCCESS(f"mean speedup, both: {mean(without_pool) / mean(with_pool):.2f}x"))
+
+    def report(self, label, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"{label}: n={len(latencies)} "
+            f"mean={statistics.mean(latencies) * 1000:.0f} ms "
+            f"p50={statistics.median(latencies) * 1000:.0f} ms "
+            f"p95={p95 * 1000:.0f} ms"
+        )
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand
+
+from prices.benchmark import run_benchmarks
+from prices.http_client import http_client
+
+BENCHMARKS = ('normalize', 'matcher', 'scrape', 'search', 'db')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the scraper, wishlist matcher and price saves against recorded "
+        "eBay pages served locally (no network). Prints a JSON report; save it "
+        "with --output to compare runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wishlist-rows', type=int, nargs='+', default=[10000],
+                            help="Synthetic wishlist sizes to match against, e.g. 10000 100000 1000000")
+        parser.add_argument('--users', type=int, default=1000, help="Users the synthetic wishlist is spread over")
+        parser.add_argument('--titles', type=int, default=10000, help="Listing titles normalized/matched")
+        parser.add_argument('--listings', type=int, default=500, help="Item pages scraped from the local server")
+        parser.add_argument('--concurrency', type=int, default=8, help="Item pages scraped at the same time")
+        parser.add_argument('--search-pages', type=int, default=5, help="Search results pages followed")
+        parser.add_argument('--db-rows', type=int, default=5000, help="Prices written through the write-behind writer")
+        parser.add_argument('--batch-size', type=int, default=200, help="Write-behind batch size")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, keep it fixed to compare runs")
+        parser.add_argument('--skip', nargs='+', choices=BENCHMARKS, default=[], help="Benchmarks to leave out")
+        parser.add_argument('--no-tracemalloc', action='store_true',
+                            help="Don't trace allocations (faster, but no per-benchmark peak memory)")
+        parser.add_argument('--output', help="Also write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        report = asyncio.run(self.run(options))
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
+        self.stdout.write(text)
+
+    async def run(self, options):
+        try:
+            return await run_benchmarks(
+                wishlist_rows=options['wishlist_rows'],
+                titles=options['titles'],
+                users=options['users'],
+                listings=options['listings'],
+                concurrency=options['concurrency'],
+                search_pages=options['search_pages'],
+                db_rows=options['db_rows'],
+                batch_size=options['batch_size'],
+                trace_memory=not options['no_tracemalloc'],
+                seed=options['seed'],
+                skip=options['skip'],
+            )
+        finally:
+            await http_client.close()
@@ -0,0 +1,69 @@
+import asyncio
+import random
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from prices.history import record_observations
+from prices.models import PokemonPrice, PriceRollup
+from prices.writer import PriceWriter
+
+BENCH_PREFIX = '__bench__'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure price inserts per second, one transaction per price vs the "
+        "write-behind writer. Run once with and once without SQLITE_TUNING=1 to "
+        "compare the SQLite settings. Bench rows are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help="Prices to write per run")
+        parser.add_argument('--cards', type=int, default=100, help="Distinct card names to spread them over")
+        parser.add_argument('--batch-size', type=int, default=200, help="Write-behind batch size")
+
+    def handle(self, *args, **options):
+        # Bench card IDs, so the rollups are written as for resolved listings
+        cards = [random.randrange(options['cards']) for _ in range(options['rows'])]
+        rows = [
+            (f"{BENCH_PREFIX} card {card}", Decimal(random.randint(100, 50000)) / 100, f"{BENCH_PREFIX}-{card}")
+            for card in cards
+        ]
+        self.report_pragmas()
+        try:
+            per_row = asyncio.run(self.per_row(rows))
+            self.stdout.write(f"one transaction per price: {len(rows) / per_row:,.0f} inserts/s")
+            batched = asyncio.run(self.write_behind(rows, options['batch_size']))
+            self.stdout.write(f"write-behind batches of {options['batch_size']}: {len(rows) / batched:,.0f} inserts/s")
+            self.stdout.write(self.style.SUCCESS(f"speedup: {per_row / batched:.1f}x"))
+        finally:
+            PokemonPrice.objects.filter(name__startswith=BENCH_PREFIX).delete()
+            PriceRollup.objects.filter(card_id__startswith=BENCH_PREFIX).delete()
+
+    def report_pragmas(self):
+        with connection.cursor() as cursor:
+            values = []
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+                cursor.execute(f"PRAGMA {pragma}")
+                values.append(f"{pragma}={cursor.fetchone()[0]}")
+        self.stdout.write("SQLite: " + ", ".join(values))
+
+    async def per_row(self, rows):
+        # The old path: every price is its own sync_to_async call and transaction
+        start = time.perf_counter()
+        for name, price, card_id in rows:
+            await sync_to_async(record_observations)([(name, price, 'eBay', card_id)])
+        return time.perf_counter() - start
+
+    async def write_behind(self, rows, batch_size):
+        writer = PriceWriter(batch_size=batch_size)
+        start = time.perf_counter()
+        for name, price, card_id in rows:
+            writer.add(name, price, card_id=card_id)
+            await asyncio.sleep(0)  # Let the flush task run, as it would between scrapes
+        await writer.close()
+        return time.perf_counter() - start
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from prices.history import compact_prices, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Apply price history retention: compact old raw prices and hourly rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raw-days', type=int, default=settings.PRICE_RAW_RETENTION_DAYS,
+                            help="Keep raw observations this many days")
+        parser.add_argument('--hourly-days', type=int, default=settings.PRICE_HOURLY_RETENTION_DAYS,
+                            help="Keep hourly rollups this many days")
+        parser.add_argument('--rebuild-rollups', nargs='?', const=0, type=int, metavar='DAYS',
+                            help="First rebuild rollups from raw rows (all of them, or the last DAYS days). "
+                                 "Needed once for prices saved before rollups existed.")
+
+    def handle(self, *args, **options):
+        if options['rebuild_rollups'] is not None:
+            days = options['rebuild_rollups']
+            since = timezone.now() - timedelta(days=days) if days else None
+            written = rebuild_rollups(since)
+            self.stdout.write(f"Rebuilt {written} rollups")
+
+        raw, hourly = compact_prices(options['raw_days'], options['hourly_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {raw} raw prices older than {options['raw_days']} days "
+            f"and {hourly} hourly rollups older than {options['hourly_days']} days"
+        ))
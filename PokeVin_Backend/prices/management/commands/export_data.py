@@ -0,0 +1,37 @@
+import sys
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from prices.transfer import FORMATS, export_rows, format_for
+
+
+class Command(BaseCommand):
+    help = "Export wishlists or price observations as CSV or JSONL, streamed row by row"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=['wishlist', 'prices'])
+        parser.add_argument('--output', '-o', default='-', help="File to write ('-' for stdout, the default)")
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the output file's extension, else csv")
+        parser.add_argument('--user', type=int, help="wishlist: only this Discord user's")
+        parser.add_argument('--days', type=int, help="prices: only the last DAYS days")
+        parser.add_argument('--source', help="prices: only from this source, e.g. eBay")
+        parser.add_argument('--card-id', help="prices: only observations resolved to this card")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or format_for(options['output'])
+        filters = {}
+        if options['dataset'] == 'wishlist':
+            filters['user_id'] = options['user']
+        else:
+            filters['since'] = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+            filters['source'] = options['source']
+            filters['card_id'] = options['card_id']
+
+        if options['output'] == '-':
+            count = export_rows(sys.stdout, options['dataset'], fmt, **filters)
+        else:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+                count = export_rows(out, options['dataset'], fmt, **filters)
+        self.stderr.write(f"Exported {count} {options['dataset']} rows")
@@ -0,0 +1,20 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from prices.fake_gateway import serve
+
+
+class Command(BaseCommand):
+    help = "Serve a local stand-in for Discord's API and gateway to run the bot against (see prices/fake_gateway.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8780)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Fake Discord on http://{options['host']}:{options['port']} (DISCORD_API_BASE for the bot)")
+        try:
+            asyncio.run(serve(options['host'], options['port']))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
@@ -0,0 +1,46 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prices.transfer import FORMATS, format_for, import_prices, import_wishlist
+
+
+class Command(BaseCommand):
+    help = "Import wishlists or price observations from CSV or JSONL, in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=['wishlist', 'prices'])
+        parser.add_argument('file', help="File to read ('-' for stdin)")
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the file's extension, else csv")
+        parser.add_argument('--keep-existing', action='store_true',
+                            help="wishlist: leave cards already on a wishlist as they are instead of updating them")
+        parser.add_argument('--allow-duplicates', action='store_true',
+                            help="prices: don't skip rows matching an existing observation (name, source, time)")
+        parser.add_argument('--no-rollups', action='store_true',
+                            help="prices: don't update rollups while importing (run "
+                                 "`compact_prices --rebuild-rollups` afterwards), faster for big backfills")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or format_for(options['file'])
+        if options['file'] == '-':
+            stats = self.run(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline=''), fmt, options)
+        else:
+            try:
+                with open(options['file'], encoding='utf-8-sig', newline='') as lines:
+                    stats = self.run(lines, fmt, options)
+            except OSError as e:
+                raise CommandError(e)
+
+        self.stdout.write(self.style.SUCCESS(stats.format()))
+        for line, error in stats.invalid:
+            self.stdout.write(f"  line {line}: {error}")
+        if options['dataset'] == 'wishlist' and stats.written:
+            self.stdout.write("A running bot picks up imported wishlists when it restarts.")
+
+    def run(self, lines, fmt, options):
+        if options['dataset'] == 'wishlist':
+            stats, _ = import_wishlist(lines, fmt, update=not options['keep_existing'])
+            return stats
+        return import_prices(lines, fmt, skip_existing=not options['allow_duplicates'],
+                             rollups=not options['no_rollups'])
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from prices.shards import ShardHub, assign_shards
+
+RESTART_WINDOW = 60  # Seconds; a process dying more often than this is restarted with a delay
+STOP_TIMEOUT = 60  # Seconds a bot process gets to close before it's killed
+
+
+class Command(BaseCommand):
+    help = "Run the bot as several processes, each connecting its share of the shards, with an IPC hub between them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, help="Total shards (default: BOT_SHARD_COUNT, or one per process)")
+        parser.add_argument('--processes', type=int, help="Bot processes (default: BOT_SHARD_PROCESSES)")
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or getattr(settings, 'BOT_SHARD_PROCESSES', 2)
+        shards = options['shards']
+        if shards is None:
+            configured = str(getattr(settings, 'BOT_SHARD_COUNT', '') or '')
+            if configured.lower() == 'auto':
+                raise CommandError("Splitting shards over processes needs a shard count: pass --shards or set BOT_SHARD_COUNT")
+            shards = int(configured) if configured else processes
+        if processes < 1 or shards < processes:
+            raise CommandError(f"Can't split {shards} shard(s) over {processes} process(es)")
+        try:
+            asyncio.run(self.run(shards, processes))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Stopped")
+
+    def process_env(self, index, shard_ids, shards):
+        env = dict(os.environ)
+        env.update({
+            'BOT_SHARD_COUNT': str(shards),
+            'BOT_SHARD_IDS': ','.join(str(shard_id) for shard_id in shard_ids),
+            'BOT_IPC_PORT': str(settings.BOT_IPC_PORT),
+            # Several processes write to the database at once: WAL, and writers
+            # that wait for the lock
+            'SQLITE_TUNING': '1',
+            'SQLITE_BUSY_TIMEOUT_MS': str(getattr(settings, 'BOT_SHARD_BUSY_TIMEOUT_MS', 15000)),
+        })
+        snapshot_path = getattr(settings, 'BOT_SNAPSHOT_PATH', None)
+        env['POKEVIN_SNAPSHOT_PATH'] = f'{snapshot_path}.{index}' if snapshot_path else ''
+        return env
+
+    async def run(self, shards, processes):
+        hub = ShardHub()
+        await hub.start()
+        bot_script = os.path.join(settings.BASE_DIR, 'bot.py')
+        running = {}
+        stopping = asyncio.Event()
+
+        async def supervise(index, shard_ids):
+            env = self.process_env(index, shard_ids, shards)
+            while not stopping.is_set():
+                started_at = time.monotonic()
+                # In its own session: a Ctrl+C reaches the bots once, through shutdown()
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, bot_script, cwd=settings.BASE_DIR, env=env, start_new_session=True,
+                )
+                running[index] = process
+                self.stdout.write(f"Bot process {index} (pid {process.pid}) running shards {shard_ids}")
+                code = await process.wait()
+                del running[index]
+                if stopping.is_set():
+                    return
+                # Its shards are reconnected by the replacement
+                self.stderr.write(f"Bot process {index} exited with code {code}, restarting")
+                if time.monotonic() - started_at < RESTART_WINDOW:
+                    await asyncio.sleep(5)
+
+        def shutdown():
+            stopping.set()
+            for process in running.values():
+                # bot.run() closes the bot on SIGINT: snapshot written, DMs flushed
+                process.send_signal(signal.SIGINT)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, shutdown)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        assignments = assign_shards(shards, processes)
+        self.stdout.write(f"Running {shards} shards over {processes} bot processes, IPC hub on {hub.host}:{hub.port}")
+        supervisors = [asyncio.create_task(supervise(index, shard_ids)) for index, shard_ids in enumerate(assignments)]
+        try:
+            await stopping.wait()
+            _, pending = await asyncio.wait(supervisors, timeout=STOP_TIMEOUT)
+            for process in running.values():
+                process.kill()
+            await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            await hub.stop()
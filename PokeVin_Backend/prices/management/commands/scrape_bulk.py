@@ -0,0 +1,55 @@
+import asyncio
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prices.browser_pool import browser_pool
+from prices.bulk import scrape_bulk, read_urls
+from prices.http_client import http_client
+from prices.metrics import publish
+from prices.writer import price_writer
+
+
+class Command(BaseCommand):
+    help = "Scrape many eBay listings concurrently and save their prices"
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', help="eBay listing URLs to scrape")
+        parser.add_argument('--file', help="File with one URL per line ('-' for stdin)")
+        parser.add_argument('--concurrency', type=int, help="Listings scraped at the same time")
+        parser.add_argument('--rate', type=float, help="Max requests per second per domain (0 disables)")
+        parser.add_argument('--json', action='store_true', help="Print the summary as JSON")
+
+    def handle(self, *args, **options):
+        lines = list(options['urls'])
+        if options['file'] == '-':
+            lines.extend(sys.stdin)
+        elif options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                lines.extend(f)
+
+        urls = read_urls(lines)
+        if not urls:
+            raise CommandError("No URLs given. Pass them as arguments or with --file.")
+
+        stats = asyncio.run(self.run(urls, options['concurrency'], options['rate']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats.summary()))
+        else:
+            self.stdout.write(self.style.SUCCESS(stats.format()))
+            for url, error in stats.failures:
+                self.stdout.write(f"  failed: {url} ({error})")
+
+    async def run(self, urls, concurrency, rate):
+        async def on_result(url, name, price):
+            self.stdout.write(f"{name} - {price}")
+
+        try:
+            return await scrape_bulk(urls, concurrency, rate, on_result)
+        finally:
+            await browser_pool.stop()
+            await http_client.close()
+            await price_writer.close()
+            publish('scrape_bulk')
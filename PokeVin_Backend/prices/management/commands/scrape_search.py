@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from prices.browser_pool import browser_pool
+from prices.http_client import http_client
+from prices.metrics import publish
+from prices.search import scrape_search
+from prices.writer import price_writer
+
+
+class Command(BaseCommand):
+    help = "Scrape every listing on an eBay search (or saved search) results page, following the next pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="eBay search results URL")
+        parser.add_argument('--pages', type=int, help="Max results pages to follow")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = asyncio.run(self.run(options['url'], options['pages']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {count} prices in {time.perf_counter() - start:.1f}s"
+        ))
+
+    async def run(self, url, pages):
+        async def on_result(result):
+            self.stdout.write(f"{result.item_id} {result.title} - {result.price}")
+
+        try:
+            return await scrape_search(url, pages, on_result)
+        finally:
+            await browser_pool.stop()
+            await http_client.close()
+            await price_writer.close()
+            publish('scrape_search')
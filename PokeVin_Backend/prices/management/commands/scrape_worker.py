@@ -0,0 +1,102 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+# Worker processes are started with 'spawn' (a fresh interpreter, no copied
+# event loop, DB connection or browser), so this module is imported in them
+# before Django is set up: prices imports stay inside the functions below.
+
+RESTART_WINDOW = 60  # Seconds; a process dying more often than this is restarted with a delay
+
+
+def run_worker_process(index, concurrency):
+    import django
+    django.setup()
+    from prices.worker import ScrapeWorker, use_sqlite_tuning
+
+    use_sqlite_tuning()
+
+    async def main():
+        worker = ScrapeWorker(concurrency=concurrency)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                # Finish the jobs in hand before exiting
+                loop.add_signal_handler(sig, worker.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        await worker.run()
+        print(f"Worker {index} ({worker.name}) stopped: {worker.done} done, {worker.failed} failed")
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = "Run scrape worker processes that work through the ScrapeJob queue, each with its own browser"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, help="Worker processes (default: SCRAPE_WORKER_PROCESSES, or one per core)")
+        parser.add_argument('--concurrency', type=int, help="Jobs scraped at the same time by each process")
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from django.db import connections
+
+        processes = options['processes'] or getattr(settings, 'SCRAPE_WORKER_PROCESSES', None) or os.cpu_count() or 1
+        concurrency = options['concurrency']
+        if processes == 1:
+            run_worker_process(0, concurrency)
+            return
+
+        # Nothing of the parent's should leak into the workers
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        workers = {}
+        started_at = {}
+        stopping = False
+
+        def start(index):
+            process = context.Process(target=run_worker_process, args=(index, concurrency), name=f'scrape_worker-{index}')
+            process.start()
+            workers[index] = process
+            started_at[index] = time.monotonic()
+
+        def shutdown(*_):
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, shutdown)
+        for index in range(processes):
+            start(index)
+        self.stdout.write(f"Started {processes} scrape worker processes")
+
+        try:
+            while not stopping:
+                time.sleep(1)
+                for index, process in list(workers.items()):
+                    if process.is_alive():
+                        continue
+                    # A crashed process (e.g. the browser took it down) is replaced;
+                    # its leased jobs go back to the queue when the lease runs out
+                    self.stderr.write(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    if time.monotonic() - started_at[index] < RESTART_WINDOW:
+                        time.sleep(5)
+                    start(index)
+        except KeyboardInterrupt:
+            pass  # The workers got the Ctrl+C too and are finishing their jobs
+
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in workers.values():
+            process.join(timeout=60)
+            if process.is_alive():
+                process.kill()
+        self.stdout.write("Stopped")
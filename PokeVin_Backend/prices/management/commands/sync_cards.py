@@ -0,0 +1,109 @@
+import json
+import os
+from pathlib import Path
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from prices.catalog import upsert_sets, upsert_cards
+from prices.models import CardSet
+
+API_URL = "https://api.pokemontcg.io/v2"
+PAGE_SIZE = 250
+
+
+class Command(BaseCommand):
+    help = "Mirror the pokemontcg.io card catalog locally, only re-importing sets that changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dump',
+            help="Import from a local dump instead of the API: a pokemontcg-data checkout "
+                 "(sets/en.json + cards/en/<set>.json) or a JSON file of cards",
+        )
+        parser.add_argument('--full', action='store_true', help="Re-import every set, changed or not")
+
+    def handle(self, *args, **options):
+        if options['dump']:
+            sets, load_cards = self.from_dump(Path(options['dump']))
+        else:
+            sets, load_cards = self.from_api()
+
+        known = dict(CardSet.objects.values_list('set_id', 'api_updated_at'))
+        changed = [
+            s for s in sets
+            if options['full'] or not s.get('updatedAt') or known.get(s['id']) != s['updatedAt']
+        ]
+        self.stdout.write(f"{len(sets)} sets, {len(changed)} to import")
+
+        total_cards = 0
+        for card_set in changed:
+            cards = load_cards(card_set)
+            for card in cards:
+                card['set'] = card_set
+            # One transaction per set, so an interrupted sync just retries that set
+            with transaction.atomic():
+                card_sets = upsert_sets([card_set])
+                upsert_cards(cards, card_sets)
+            total_cards += len(cards)
+            self.stdout.write(f"  {card_set['name']} ({card_set['id']}): {len(cards)} cards")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {total_cards} cards from {len(changed)} sets"))
+
+    def from_api(self):
+        session = requests.Session()
+        api_key = os.getenv('POKEMONTCG_API_KEY')
+        if api_key:
+            session.headers['X-Api-Key'] = api_key
+
+        def get_all(path, params=None):
+            items, page = [], 1
+            while True:
+                response = session.get(
+                    f"{API_URL}/{path}",
+                    params={**(params or {}), 'page': page, 'pageSize': PAGE_SIZE},
+                    timeout=60,
+                )
+                if response.status_code != 200:
+                    raise CommandError(f"Error fetching {path}: {response.status_code}")
+                data = response.json()
+                items.extend(data.get('data', []))
+                if page * PAGE_SIZE >= data.get('totalCount', 0):
+                    return items
+                page += 1
+
+        def load_cards(card_set):
+            return get_all('cards', {'q': f"set.id:{card_set['id']}"})
+
+        return get_all('sets'), load_cards
+
+    def from_dump(self, path):
+        if path.is_dir():
+            sets_file = path / 'sets' / 'en.json'
+            if not sets_file.exists():
+                raise CommandError(f"{sets_file} not found")
+            sets = self.read_json(sets_file)
+
+            def load_cards(card_set):
+                cards_file = path / 'cards' / 'en' / f"{card_set['id']}.json"
+                return self.read_json(cards_file) if cards_file.exists() else []
+
+            return sets, load_cards
+
+        # A single file of cards, each carrying its own "set"
+        cards = self.read_json(path)
+        if isinstance(cards, dict):
+            cards = cards.get('data', [])
+        sets, cards_by_set = {}, {}
+        for card in cards:
+            sets[card['set']['id']] = card['set']
+            cards_by_set.setdefault(card['set']['id'], []).append(card)
+        return list(sets.values()), lambda card_set: cards_by_set[card_set['id']]
+
+    def read_json(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Couldn't read {path}: {e}")
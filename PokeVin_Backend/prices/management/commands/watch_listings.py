@@ -0,0 +1,47 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from prices.browser_pool import browser_pool
+from prices.http_client import http_client
+from prices.metrics import publish, publish_periodically
+from prices.writer import price_writer
+from prices.watcher import WatchScheduler
+
+
+class Command(BaseCommand):
+    # Monitoring only: prices are saved (history, rollups, price API) but no
+    # wishlist alerts go out, those need the bot's matcher and Discord
+    # connection. The bot runs the same scheduler itself; listings this
+    # process checks instead don't alert anyone.
+    help = (
+        "Run the watched-listing scheduler as a standalone worker that only records prices "
+        "(wishlist alerts are only sent when the bot runs the scheduler)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, help="Max scrapes per minute across all watches")
+        parser.add_argument('--concurrency', type=int, help="Listings scraped at the same time")
+
+    def handle(self, *args, **options):
+        try:
+            asyncio.run(self.run(options['budget'], options['concurrency']))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
+
+    async def run(self, budget, concurrency):
+        async def on_result(listing, name, price, old_price):
+            change = f" (was {old_price})" if old_price is not None and old_price != price else ""
+            self.stdout.write(f"{name} - {price}{change}")
+
+        scheduler = WatchScheduler(budget, concurrency, on_result)
+        publisher = asyncio.create_task(publish_periodically('watch_listings'))
+        try:
+            await scheduler.run()
+        finally:
+            publisher.cancel()
+            scheduler.stop()
+            await browser_pool.stop()
+            await http_client.close()
+            await price_writer.close()
+            publish('watch_listings')
@@ -0,0 +1,251 @@
+import re
+from collections import Counter
+
+from .resolver import card_resolver
+from .scraper import normalize_scraped_data
+
+
+class _Entry:
+    __slots__ = ('pk', 'user_id', 'pokemon_name', 'set_name', 'card_id', 'name_key', 'set_keywords', 'id_part')
+
+    def __init__(self, pk, user_id, pokemon_name, set_name, card_id):
+        self.pk = pk
+        self.user_id = user_id
+        self.pokemon_name = pokemon_name
+        self.set_name = set_name
+        self.card_id = card_id
+        # Everything the match needs is normalized once, here, not per listing
+        self.name_key = normalize_scraped_data(pokemon_name)
+        self.set_keywords = [
+            kw for kw in (normalize_scraped_data(word) for word in set_name.split()) if len(kw) > 3
+        ]
+        # Try to match the numeric part of the card_id, e.g. SM96
+        id_match = re.search(r'(\d+)$', card_id)
+        self.id_part = id_match.group(1).lower() if id_match else ''
+
+    def fields(self):
+        return (
+            self.pk, self.user_id, self.pokemon_name, self.set_name, self.card_id,
+            self.name_key, self.set_keywords, self.id_part,
+        )
+
+    @classmethod
+    def from_fields(cls, fields):
+        # An entry from fields(), skipping the normalization
+        entry = cls.__new__(cls)
+        (
+            entry.pk, entry.user_id, entry.pokemon_name, entry.set_name, entry.card_id,
+            entry.name_key, entry.set_keywords, entry.id_part,
+        ) = fields
+        return entry
+
+    def matches_rest(self, normalized_title):
+        set_match = all(kw in normalized_title for kw in self.set_keywords)
+        id_match_found = self.id_part and self.id_part in normalized_title
+        return set_match or id_match_found
+
+    def as_dict(self):
+        return {
+            "user_id": self.user_id,
+            "pokemon_name": self.pokemon_name,
+            "set_name": self.set_name,
+            "card_id": self.card_id,
+        }
+
+
+class WishlistMatcher:
+    """Matches a listing title against every user's wishlist at once.
+
+    Same rules as the old per-user loop: the normalized Pokémon name must be a
+    substring of the normalized title, plus either all long set keywords or the
+    card number. Names are indexed by their normalized form, so a title is
+    checked by sliding one window per distinct name length over it instead of
+    looping over every wishlist item.
+
+    When the card resolver (prices/resolver.py) is loaded and confidently
+    resolves the title to one catalog card, exactly the entries for that card
+    match instead, which fixes both misses and short-name false positives.
+    """
+
+    def __init__(self, resolver=None):
+        self.resolver = resolver
+        self._entries = {}  # pk -> _Entry
+        self._by_name = {}  # normalized name -> {pk: _Entry}
+        self._by_card = {}  # card_id -> {pk: _Entry}
+        self._by_user = {}  # discord user id -> {pk: _Entry}
+        self._by_user_card = {}  # (discord user id, card_id) -> _Entry
+        self._name_lengths = Counter()  # normalized name length -> distinct names of that length
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, items):
+        # `items` are dicts with id, discord_user_id, pokemon_name, set_name, card_id
+        self._clear()
+        self.sync(items)
+
+    def _clear(self):
+        self._entries.clear()
+        self._by_name.clear()
+        self._by_card.clear()
+        self._by_user.clear()
+        self._by_user_card.clear()
+        self._name_lengths.clear()
+
+    def sync(self, items):
+        """Bring the index in line with `items` (same shape as for load()),
+        only re-adding the entries that changed. Returns how many did."""
+        seen = set()
+        changed = 0
+        for item in items:
+            pk = item['id']
+            seen.add(pk)
+            entry = self._entries.get(pk)
+            row = (item['discord_user_id'], item['pokemon_name'], item['set_name'], item['card_id'])
+            if entry is None or (entry.user_id, entry.pokemon_name, entry.set_name, entry.card_id) != row:
+                self.add(pk, *row)
+                changed += 1
+        for pk in [pk for pk in self._entries if pk not in seen]:
+            self.remove(pk)
+            changed += 1
+        self.loaded = True
+        return changed
+
+    def dump_state(self):
+        # The normalized entries, for the bot's warm-state snapshot
+        # (prices/snapshot.py). Plain tuples: they pickle far faster than objects
+        return [entry.fields() for entry in self._entries.values()]
+
+    def load_state(self, state):
+        self._clear()
+        for fields in state:
+            self._index(_Entry.from_fields(fields))
+        self.loaded = True
+
+    def add(self, pk, user_id, pokemon_name, set_name, card_id):
+        entry = _Entry(pk, user_id, pokemon_name, set_name, card_id)
+        self.remove(pk)
+        self._index(entry)
+
+    def _index(self, entry):
+        named = self._by_name.setdefault(entry.name_key, {})
+        if not named:
+            self._name_lengths[len(entry.name_key)] += 1
+        named[entry.pk] = entry
+        self._entries[entry.pk] = entry
+        self._by_card.setdefault(entry.card_id, {})[entry.pk] = entry
+        self._by_user.setdefault(entry.user_id, {})[entry.pk] = entry
+        self._by_user_card[entry.user_id, entry.card_id] = entry
+
+    def remove(self, pk):
+        entry = self._entries.get(pk)
+        if entry is None:
+            return False
+        self._discard(entry)
+        return True
+
+    def remove_card(self, user_id, card_id):
+        # (user, card_id) is unique, mirrors the wishlist's DB constraint
+        entry = self._find(user_id, card_id)
+        if entry is None:
+            return False
+        self._discard(entry)
+        return True
+
+    def _find(self, user_id, card_id):
+        return self._by_user_card.get((user_id, card_id))
+
+    def clear_user(self, user_id):
+        for entry in list(self._by_user.get(user_id, {}).values()):
+            self._discard(entry)
+
+    def _discard(self, entry):
+        del self._entries[entry.pk]
+        user_entries = self._by_user[entry.user_id]
+        del user_entries[entry.pk]
+        if not user_entries:
+            del self._by_user[entry.user_id]
+        if self._by_user_card.get((entry.user_id, entry.card_id)) is entry:
+            del self._by_user_card[entry.user_id, entry.card_id]
+
+        carded = self._by_card[entry.card_id]
+        del carded[entry.pk]
+        if not carded:
+            del self._by_card[entry.card_id]
+
+        named = self._by_name[entry.name_key]
+        del named[entry.pk]
+        if not named:
+            del self._by_name[entry.name_key]
+            self._name_lengths[len(entry.name_key)] -= 1
+            if not self._name_lengths[len(entry.name_key)]:
+                del self._name_lengths[len(entry.name_key)]
+
+    def _matching_names(self, normalized_title):
+        names = set()
+        for length in self._name_lengths:
+            for start in range(len(normalized_title) - length + 1):
+                window = normalized_title[start:start + length]
+                if window in self._by_name:
+                    names.add(window)
+        return names
+
+    def resolve(self, title):
+        # The catalog card the title is confidently about, or None
+        if self.resolver is None or not self.resolver.loaded:
+            return None
+        resolution = self.resolver.best(title)
+        return resolution.card_id if resolution else None
+
+    def match(self, title, user_id=None):
+        """Every wishlist entry (as a dict) the listing title matches."""
+        card_id = self.resolve(title)
+        if card_id is not None:
+            return [
+                entry.as_dict() for entry in self._by_card.get(card_id, {}).values()
+                if user_id is None or entry.user_id == user_id
+            ]
+
+        normalized_title = normalize_scraped_data(title)
+        matches = []
+        for name in self._matching_names(normalized_title):
+            for entry in self._by_name[name].values():
+                if user_id is not None and entry.user_id != user_id:
+                    continue
+                if entry.matches_rest(normalized_title):
+                    matches.append(entry.as_dict())
+        return matches
+
+    def matched_card_ids(self, title):
+        # Card IDs the title matches; entries for the same card share their set
+        # and number, so each card is only checked once however many want it
+        card_id = self.resolve(title)
+        if card_id is not None:
+            return {card_id} if card_id in self._by_card else set()
+
+        normalized_title = normalize_scraped_data(title)
+        card_ids = set()
+        for name in self._matching_names(normalized_title):
+            checked = set()
+            for entry in self._by_name[name].values():
+                if entry.card_id in checked:
+                    continue
+                checked.add(entry.card_id)
+                if entry.matches_rest(normalized_title):
+                    card_ids.add(entry.card_id)
+        return card_ids
+
+    def get(self, user_id, card_id):
+        entry = self._find(user_id, card_id)
+        return entry.as_dict() if entry else None
+
+    def match_by_user(self, title):
+        # {user_id: [matched entries]}
+        by_user = {}
+        for match in self.match(title):
+            by_user.setdefault(match['user_id'], []).append(match)
+        return by_user
+
+
+wishlist_matcher = WishlistMatcher(card_resolver)
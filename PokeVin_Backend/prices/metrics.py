@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# In-process timers and counters for every scraper stage, aggregated into
+# histograms. The bot and the management commands each scrape in their own
+# process, so each one publishes a JSON snapshot to METRICS_DIR and the
+# /metrics view merges them into one Prometheus text page.
+
+# Upper bounds in seconds, from a fast HTTP parse up to the 60s selector wait
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = 'pokevin_scraper_stage_seconds'
+STAGE_TOTAL = 'pokevin_scraper_stage_total'
+
+SUCCESS = 'success'
+TIMEOUT = 'timeout'
+PARSE_FAILURE = 'parse_failure'
+ERROR = 'error'
+
+
+def classify(exc):
+    if exc is None:
+        return SUCCESS
+    # Classified scrape failures (prices/resilience.py) carry their own kind
+    kind = getattr(exc, 'kind', None)
+    if isinstance(kind, str):
+        return kind
+    # Playwright's TimeoutError doesn't subclass the builtin one
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or type(exc).__name__ == 'TimeoutError':
+        return TIMEOUT
+    if isinstance(exc, (ValueError, ArithmeticError, LookupError)):
+        return PARSE_FAILURE
+    return ERROR
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        # Upper bound of the bucket the q-th observation falls in
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self):
+        return {'buckets': list(self.buckets), 'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['buckets'])
+        histogram.counts = list(data['counts'])
+        histogram.sum = data['sum']
+        histogram.count = data['count']
+        return histogram
+
+
+class _StageTimer:
+    # Set `outcome` to report a failure that didn't raise, e.g. a page without a price
+    __slots__ = ('outcome',)
+
+    def __init__(self):
+        self.outcome = None
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> current value, e.g. a queue depth
+        self.histograms = {}  # (name, labels) -> Histogram
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def stage(self, stage):
+        """Time a scraper stage and count how it ended (success, timeout,
+        parse_failure or error, from the exception it raised, if any):
+
+            with metrics.stage('goto'):
+                await page.goto(url)
+        """
+        start = time.perf_counter()
+        timer = _StageTimer()
+        exc = None
+        try:
+            yield timer
+        except BaseException as e:
+            exc = e
+            raise
+        finally:
+            if not isinstance(exc, asyncio.CancelledError):
+                self.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+                outcome = timer.outcome if exc is None and timer.outcome else classify(exc)
+                self.inc(STAGE_TOTAL, stage=stage, outcome=outcome)
+
+    def snapshot(self):
+        return {
+            'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+            'gauges': [[name, dict(labels), value] for (name, labels), value in self.gauges.items()],
+            'histograms': [[name, dict(labels), h.as_dict()] for (name, labels), h in self.histograms.items()],
+        }
+
+    def merge(self, snapshot):
+        for name, labels, value in snapshot['counters']:
+            self.inc(name, value, **labels)
+        # Summed: every process's queue adds up to the total (older snapshots have none)
+        for name, labels, value in snapshot.get('gauges', ()):
+            key = (name, _label_key(labels))
+            self.gauges[key] = self.gauges.get(key, 0) + value
+        for name, labels, data in snapshot['histograms']:
+            key = (name, _label_key(labels))
+            if key in self.histograms:
+                self.histograms[key].merge(Histogram.from_dict(data))
+            else:
+                self.histograms[key] = Histogram.from_dict(data)
+
+    def stage_summary(self):
+        """{stage: {'count', 'mean', 'p50', 'p95', outcome: count, ...}} for quick reports."""
+        summary = {}
+        for (name, labels), histogram in self.histograms.items():
+            if name == STAGE_SECONDS:
+                stage = dict(labels)['stage']
+                summary[stage] = {
+                    'count': histogram.count,
+                    'mean': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                }
+        for (name, labels), value in self.counters.items():
+            if name == STAGE_TOTAL:
+                labels = dict(labels)
+                summary.setdefault(labels['stage'], {})[labels['outcome']] = value
+        return summary
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+
+        def format_labels(labels, **extra):
+            pairs = list(labels) + list(extra.items())
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f'# TYPE {name} counter')
+            for (metric, labels), value in sorted(self.counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+
+        for name in sorted({name for name, _ in self.gauges}):
+            lines.append(f'# TYPE {name} gauge')
+            for (metric, labels), value in sorted(self.gauges.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def publish(process_name):
+    """Write this process's metrics where the /metrics view can find them."""
+    directory = metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{process_name}-{os.getpid()}.json')
+    # Write then rename, so the view never reads half a file
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(metrics.snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def collect():
+    """This process's metrics merged with every published snapshot."""
+    combined = MetricsRegistry()
+    combined.merge(metrics.snapshot())
+    directory = metrics_dir()
+    if directory and os.path.isdir(directory):
+        max_age = getattr(settings, 'METRICS_MAX_AGE', 3600)
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename.endswith(f'-{os.getpid()}.json'):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                # Running processes rewrite theirs every few seconds, one that
+                # hasn't changed in a while is left over from an exited process
+                if time.time() - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    combined.merge(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping metrics snapshot {filename}: {e}")
+    return combined
+
+
+async def publish_periodically(process_name, interval=None):
+    interval = interval or getattr(settings, 'METRICS_PUBLISH_INTERVAL', 15)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            publish(process_name)
+        except OSError as e:
+            print(f"Error publishing metrics: {e}")
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0005_wishlistitem_card_id_wishlistitem_set_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('set_id', models.CharField(max_length=50, unique=True)),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('series', models.CharField(blank=True, max_length=255)),
+                ('printed_total', models.PositiveIntegerField(blank=True, null=True)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('release_date', models.CharField(blank=True, max_length=20)),
+                ('api_updated_at', models.CharField(blank=True, max_length=32)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Card',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card_id', models.CharField(max_length=50, unique=True)),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('number', models.CharField(max_length=20)),
+                ('rarity', models.CharField(blank=True, max_length=100)),
+                ('image_small', models.URLField(blank=True)),
+                ('image_large', models.URLField(blank=True)),
+                ('card_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cards', to='prices.cardset')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['card_set', 'number'], name='prices_card_card_se_9b23d8_idx')],
+            },
+        ),
+    ]
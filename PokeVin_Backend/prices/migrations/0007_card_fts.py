@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:09
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Full-text index over card name, set name and number. The FTS rowid is the
+# Card primary key and triggers keep it in step with prices_card/prices_cardset.
+CREATE_FTS = [
+    """
+    CREATE VIRTUAL TABLE prices_card_fts USING fts5(
+        name, set_name, number,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER prices_card_fts_insert AFTER INSERT ON prices_card BEGIN
+        INSERT INTO prices_card_fts(rowid, name, set_name, number)
+        VALUES (NEW.id, NEW.name, (SELECT name FROM prices_cardset WHERE id = NEW.card_set_id), NEW.number);
+    END
+    """,
+    """
+    CREATE TRIGGER prices_card_fts_update AFTER UPDATE ON prices_card BEGIN
+        DELETE FROM prices_card_fts WHERE rowid = OLD.id;
+        INSERT INTO prices_card_fts(rowid, name, set_name, number)
+        VALUES (NEW.id, NEW.name, (SELECT name FROM prices_cardset WHERE id = NEW.card_set_id), NEW.number);
+    END
+    """,
+    """
+    CREATE TRIGGER prices_card_fts_delete AFTER DELETE ON prices_card BEGIN
+        DELETE FROM prices_card_fts WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER prices_cardset_fts_update AFTER UPDATE OF name ON prices_cardset BEGIN
+        UPDATE prices_card_fts SET set_name = NEW.name
+        WHERE rowid IN (SELECT id FROM prices_card WHERE card_set_id = NEW.id);
+    END
+    """,
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS prices_cardset_fts_update",
+    "DROP TRIGGER IF EXISTS prices_card_fts_delete",
+    "DROP TRIGGER IF EXISTS prices_card_fts_update",
+    "DROP TRIGGER IF EXISTS prices_card_fts_insert",
+    "DROP TABLE IF EXISTS prices_card_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    # Only SQLite has FTS5; elsewhere catalog lookups fall back to the name index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            for statement in CREATE_FTS:
+                cursor.execute(statement)
+        except OperationalError as e:
+            print(f"\n  Skipping card full-text index, SQLite has no FTS5: {e}")
+            for statement in DROP_FTS:
+                cursor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_FTS:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0006_cardset_card'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
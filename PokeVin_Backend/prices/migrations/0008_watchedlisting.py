@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0007_card_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchedListing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, unique=True)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('last_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('volatility', models.FloatField(default=0.0)),
+                ('interval_seconds', models.PositiveIntegerField(default=3600)),
+                ('next_check_at', models.DateTimeField()),
+                ('last_checked_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('active', models.BooleanField(default=True)),
+                ('added_by', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['active', 'next_check_at'], name='prices_watc_active_af9ee1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0008_watchedlisting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('source', models.CharField(max_length=100)),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('median_price', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pokemonprice',
+            index=models.Index(fields=['name', 'source', 'date_fetched'], name='prices_poke_name_eb6385_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemonprice',
+            index=models.Index(fields=['date_fetched'], name='prices_poke_date_fe_952f60_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pricerollup',
+            constraint=models.UniqueConstraint(fields=('name', 'source', 'period', 'bucket_start'), name='unique_price_rollup'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:16
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_cards(apps, schema_editor):
+    # Keep the oldest entry of each (user, card) so the constraint can be added
+    WishlistItem = apps.get_model('prices', 'WishlistItem')
+    keep = WishlistItem.objects.values('discord_user_id', 'card_id').annotate(first=Min('id')).values('first')
+    WishlistItem.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0009_price_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_cards, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wishlistitem',
+            constraint=models.UniqueConstraint(fields=('discord_user_id', 'card_id'), name='unique_wishlist_card'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0010_wishlist_unique_card'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wishlistitem',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('discord_user_id', models.BigIntegerField()),
+                ('url', models.URLField(max_length=500)),
+                ('card_id', models.CharField(max_length=255)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('url', 'discord_user_id'), name='unique_price_alert')],
+            },
+        ),
+    ]
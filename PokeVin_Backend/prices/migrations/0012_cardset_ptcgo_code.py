@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:32
+
+import importlib
+
+from django.db import migrations, models
+
+# SQLite adds the column by rebuilding prices_cardset, and the rename that
+# finishes the rebuild fails while the FTS triggers from 0007 still reference
+# the table. Drop them around the change and put them back afterwards.
+card_fts = importlib.import_module('prices.migrations.0007_card_fts')
+TRIGGERS = [statement for statement in card_fts.CREATE_FTS if 'CREATE TRIGGER' in statement]
+DROP_TRIGGERS = [statement for statement in card_fts.DROP_FTS if 'DROP TRIGGER' in statement]
+
+
+def has_fts(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prices_card_fts'")
+        return cursor.fetchone() is not None
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_TRIGGERS:
+            cursor.execute(statement)
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite' or not has_fts(schema_editor.connection):
+        return
+    drop_triggers(apps, schema_editor)
+    with schema_editor.connection.cursor() as cursor:
+        for statement in TRIGGERS:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0011_price_alerts'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='cardset',
+            name='ptcgo_code',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
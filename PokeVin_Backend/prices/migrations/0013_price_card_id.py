@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0012_cardset_ptcgo_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemonprice',
+            name='card_id',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='pokemonprice',
+            index=models.Index(fields=['card_id', 'date_fetched'], name='prices_poke_card_id_9015af_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0014_scrape_jobs'),
+    ]
+
+    # Only the Python-side default changes, the column stays as it is; a plain
+    # AlterField would have SQLite rebuild the whole price table for nothing
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='pokemonprice',
+                    name='date_fetched',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+            ],
+        ),
+    ]
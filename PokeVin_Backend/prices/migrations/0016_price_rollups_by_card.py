@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def _weighted_median(rollups):
+    # Each rollup stands in as `count` copies of its median, as in history.merge_rollup
+    weighted = sorted((rollup.median_price, rollup.count) for rollup in rollups)
+    total = sum(count for _, count in weighted)
+
+    def nth(index):
+        for value, count in weighted:
+            if index < count:
+                return value
+            index -= count
+
+    return Decimal((nth((total - 1) // 2) + nth(total // 2)) / 2).quantize(Decimal('0.01'))
+
+
+def rollups_by_card(apps, schema_editor):
+    """Re-key the rollups written per listing title onto the card the title
+    resolved to. Titles that never resolved, or resolved to more than one
+    card, can't be attributed and are dropped."""
+    PokemonPrice = apps.get_model('prices', 'PokemonPrice')
+    PriceRollup = apps.get_model('prices', 'PriceRollup')
+
+    cards = {}
+    for name, card_id in PokemonPrice.objects.exclude(card_id='').values_list('name', 'card_id').distinct().iterator():
+        cards.setdefault(name, set()).add(card_id)
+
+    merged = {}
+    for rollup in PriceRollup.objects.iterator():
+        card_ids = cards.get(rollup.name, ())
+        if len(card_ids) == 1:
+            key = (next(iter(card_ids)), rollup.source, rollup.period, rollup.bucket_start)
+            merged.setdefault(key, []).append(rollup)
+
+    PriceRollup.objects.all().delete()
+    PriceRollup.objects.bulk_create(
+        [
+            PriceRollup(
+                name='', card_id=card_id, source=source, period=period, bucket_start=start,
+                count=sum(rollup.count for rollup in rollups),
+                min_price=min(rollup.min_price for rollup in rollups),
+                max_price=max(rollup.max_price for rollup in rollups),
+                median_price=_weighted_median(rollups),
+            )
+            for (card_id, source, period, start), rollups in merged.items()
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices', '0015_price_date_fetched_default'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='pricerollup',
+            name='unique_price_rollup',
+        ),
+        migrations.AddField(
+            model_name='pricerollup',
+            name='card_id',
+            field=models.CharField(default='', max_length=50),
+            preserve_default=False,
+        ),
+        migrations.RunPython(rollups_by_card, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='pricerollup',
+            name='name',
+        ),
+        migrations.AddConstraint(
+            model_name='pricerollup',
+            constraint=models.UniqueConstraint(fields=('card_id', 'source', 'period', 'bucket_start'), name='unique_price_rollup'),
+        ),
+        migrations.RemoveIndex(
+            model_name='pokemonprice',
+            name='prices_poke_card_id_9015af_idx',
+        ),
+        migrations.AddIndex(
+            model_name='pokemonprice',
+            index=models.Index(fields=['card_id', 'source', 'date_fetched'], name='prices_poke_card_id_c76b54_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User  # Associating users with wishlists
 
 
@@ -6,18 +7,178 @@ class PokemonPrice(models.Model):
     name = models.CharField(max_length=100)  # Name of the Pokémon
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price of the Pokémon
     source = models.CharField(max_length=100)  # Source where the price was fetched from (e.g., Ebay)
-    date_fetched = models.DateTimeField(auto_now_add=True)  # Date and time when the price was fetched
+    # Date and time when the price was fetched. A default rather than auto_now_add, which
+    # would overwrite the original times of imported observations
+    date_fetched = models.DateTimeField(default=timezone.now, editable=False)
+    card_id = models.CharField(max_length=50, blank=True, default='')  # Catalog card the listing resolved to, if any
+
+    # Append-only: every scrape adds a row, history/rollups/retention read them by card and time
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'source', 'date_fetched']),  # Admin search by listing title
+            models.Index(fields=['date_fetched']),
+            models.Index(fields=['card_id', 'source', 'date_fetched']),
+        ]
 
     def __str__(self):
         return f"{self.name} - ${self.price}"
 
 
+class PriceRollup(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [(HOUR, 'Hourly'), (DAY, 'Daily')]
+
+    # Same as PokemonPrice.card_id; listings that didn't resolve to a card have no rollups
+    card_id = models.CharField(max_length=50)
+    source = models.CharField(max_length=100)
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()  # Start of the hour/day (UTC) this row summarizes
+    count = models.PositiveIntegerField()
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    median_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            # Also the index history queries run on
+            models.UniqueConstraint(fields=['card_id', 'source', 'period', 'bucket_start'], name='unique_price_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.card_id} {self.period} {self.bucket_start:%Y-%m-%d %H:00}: {self.count} prices"
+
+
 class WishlistItem(models.Model):
     discord_user_id = models.BigIntegerField()  # The Discord user ID
     pokemon_name = models.CharField(max_length=100)  # Store the name of the Pokémon
     set_name = models.CharField(max_length=255)  # Store the set name
     card_id = models.CharField(max_length=255)  # Store the card ID
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Only alert at or below this price
+
+    class Meta:
+        constraints = [
+            # A card is on a user's wishlist at most once. Its index also serves
+            # every per-user lookup, discord_user_id being the leading column.
+            models.UniqueConstraint(fields=['discord_user_id', 'card_id'], name='unique_wishlist_card'),
+        ]
 
     def __str__(self):
         return f"Wishlist for user {self.discord_user_id}: {self.pokemon_name}"
 
+
+
+class PriceAlert(models.Model):
+    discord_user_id = models.BigIntegerField()  # Who was alerted
+    url = models.URLField(max_length=500)  # The listing they were alerted about
+    card_id = models.CharField(max_length=255)  # First matched card, for reference
+    price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at alert time
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # One alert per user per listing, however often it's re-scraped
+            models.UniqueConstraint(fields=['url', 'discord_user_id'], name='unique_price_alert'),
+        ]
+
+    def __str__(self):
+        return f"Alerted {self.discord_user_id} about {self.url} at ${self.price}"
+
+
+class CardSet(models.Model):
+    set_id = models.CharField(max_length=50, unique=True)  # pokemontcg.io set ID, e.g. base1
+    name = models.CharField(max_length=255, db_index=True)  # Set name, e.g. Base
+    series = models.CharField(max_length=255, blank=True)
+    ptcgo_code = models.CharField(max_length=20, blank=True)  # Set abbreviation used in listings, e.g. EVS
+    printed_total = models.PositiveIntegerField(null=True, blank=True)  # The "102" in 4/102
+    total = models.PositiveIntegerField(null=True, blank=True)
+    release_date = models.CharField(max_length=20, blank=True)  # As given by the API, e.g. 1999/01/09
+    api_updated_at = models.CharField(max_length=32, blank=True)  # Set's updatedAt, drives incremental sync
+
+    def __str__(self):
+        return f"{self.name} ({self.set_id})"
+
+
+class Card(models.Model):
+    card_id = models.CharField(max_length=50, unique=True)  # pokemontcg.io card ID, e.g. base1-4
+    name = models.CharField(max_length=255, db_index=True)
+    card_set = models.ForeignKey(CardSet, related_name='cards', on_delete=models.CASCADE)
+    number = models.CharField(max_length=20)  # Number within the set, e.g. 4
+    rarity = models.CharField(max_length=100, blank=True)
+    image_small = models.URLField(blank=True)
+    image_large = models.URLField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['card_set', 'number']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.card_id})"
+
+
+
+class WatchedListing(models.Model):
+    url = models.URLField(max_length=500, unique=True)  # eBay listing being re-scraped on a schedule
+    name = models.CharField(max_length=255, blank=True)  # Listing title from the last scrape
+    last_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    volatility = models.FloatField(default=0.0)  # Moving average of relative price change per check
+    interval_seconds = models.PositiveIntegerField(default=3600)  # Current adaptive re-check interval
+    next_check_at = models.DateTimeField()  # When the scheduler should look at it next
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)  # Auction end, checks speed up as it nears
+    failures = models.PositiveIntegerField(default=0)  # Consecutive failed scrapes
+    active = models.BooleanField(default=True)
+    added_by = models.BigIntegerField(null=True, blank=True)  # Discord user ID that started the watch
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The scheduler's priority queue: active listings by due time
+            models.Index(fields=['active', 'next_check_at']),
+        ]
+
+    def __str__(self):
+        return f"Watching {self.name or self.url}"
+
+
+class ScrapeJob(models.Model):
+    # Listing scrapes queued for `manage.py scrape_worker` processes
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    # Higher runs first: someone waiting on !scrape beats a bulk import
+    HIGH = 10
+    NORMAL = 0
+    LOW = -10
+
+    url = models.URLField(max_length=500)  # Canonical listing URL
+    priority = models.SmallIntegerField(default=NORMAL)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)  # Times a worker has picked it up
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    available_at = models.DateTimeField()  # Not picked up before this, pushed back on retry
+    leased_until = models.DateTimeField(null=True, blank=True)  # A running job past this is up for grabs again
+    worker = models.CharField(max_length=100, blank=True)  # Worker holding or last holding the lease
+    result = models.JSONField(null=True, blank=True)  # {'name': ..., 'price': ...} once done
+    error = models.TextField(blank=True)
+    error_kind = models.CharField(max_length=20, blank=True)  # blocked/removed/timeout/... (prices/resilience.py)
+    requested_by = models.BigIntegerField(null=True, blank=True)  # Discord user ID
+    channel_id = models.BigIntegerField(null=True, blank=True)  # Discord channel the result is posted to
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)  # When the bot picked up the result
+
+    class Meta:
+        indexes = [
+            # The workers' queue: claimable jobs, best priority and oldest first
+            models.Index(fields=['status', '-priority', 'available_at']),
+            # The bot's outbox: finished jobs it hasn't reported yet
+            models.Index(fields=['delivered_at', 'finished_at']),
+        ]
+
+    def __str__(self):
+        return f"Scrape {self.url} ({self.status})"
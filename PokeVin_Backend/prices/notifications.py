@@ -0,0 +1,265 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .cache import TTLCache
+from .metrics import metrics
+
+MAX_MESSAGE_LENGTH = 2000  # Discord's limit per message
+DIGEST_SEPARATOR = "\n\n――――――――――\n\n"
+
+
+class NotificationError(Exception):
+    """Raised by a dispatcher's `send` function; `retryable` failures are retried with backoff."""
+
+    def __init__(self, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate  # Tokens added per second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    # Break on line boundaries where possible so a digest never exceeds the limit
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        cut = cut if cut > 0 else limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class NotificationDispatcher:
+    """Background queue for outbound DMs.
+
+    `notify()` never blocks: messages for the same user that arrive within
+    `coalesce_window` seconds go out as one digest. Sends are paced by a global
+    token bucket and one per user (Discord rate-limits each DM channel
+    separately), and failures are retried with jittered backoff without
+    holding up any worker. A user's messages are delivered by one worker at
+    a time, so their DMs never interleave or race for the same rate limit.
+    """
+
+    def __init__(self, send, workers=None, coalesce_window=None, max_retries=None,
+                 global_rate=None, per_user_rate=None, per_user_burst=None):
+        self.send = send  # async send(user_id, content), raises NotificationError
+        self.workers = workers or getattr(settings, 'NOTIFY_WORKERS', 4)
+        self.coalesce_window = coalesce_window if coalesce_window is not None else getattr(settings, 'NOTIFY_COALESCE_SECONDS', 2.0)
+        self.max_retries = max_retries or getattr(settings, 'NOTIFY_MAX_RETRIES', 5)
+        self.global_bucket = TokenBucket(global_rate or getattr(settings, 'NOTIFY_GLOBAL_RATE', 40), 10)
+        self.per_user_rate = per_user_rate or getattr(settings, 'NOTIFY_PER_USER_RATE', 1.0)
+        self.per_user_burst = per_user_burst or getattr(settings, 'NOTIFY_PER_USER_BURST', 5)
+        # Idle users' buckets can be forgotten, a fresh one starts full anyway
+        self._user_buckets = TTLCache(maxsize=10000, ttl=60)
+
+        self._pending = {}  # user_id -> [(queued_at, text, attempts)]
+        self._retrying = {}  # user_id -> (TimerHandle, messages) waiting out a backoff
+        self._in_flight = set()  # Users a worker is delivering to
+        self._ready = None  # asyncio.Queue of user_ids with pending messages, none in flight
+        self._tasks = []
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=1000)  # Seconds from notify() to delivery
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        for user_id in self._pending:
+            self._ready.put_nowait(user_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10):
+        # Give queued messages a chance to go out, then stop the workers.
+        # Shutdown can't wait out retry backoffs: those go back in the queue now
+        for user_id in list(self._retrying):
+            self._retry_due(user_id)
+        if self._ready is not None and self._queued():
+            try:
+                await asyncio.wait_for(self._drained(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Dropping notifications for {len(self._queued())} user(s) on shutdown")
+        for handle, _ in self._retrying.values():
+            handle.cancel()
+        self._retrying.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._in_flight.clear()
+
+    def _queued(self):
+        return self._pending.keys() | self._retrying.keys() | self._in_flight
+
+    async def _drained(self):
+        while self._queued():
+            await asyncio.sleep(0.1)
+
+    def notify(self, user_id, text):
+        self._enqueue(user_id, [(time.monotonic(), text, 0)])
+
+    def _enqueue(self, user_id, messages):
+        if user_id in self._pending:
+            # Already waiting to go out, ride along in the same digest
+            self._pending[user_id].extend(messages)
+            return
+        self._pending[user_id] = list(messages)
+        # A user in flight is queued again once their delivery is done
+        if self._ready is not None and user_id not in self._in_flight:
+            self._ready.put_nowait(user_id)
+        self._update_gauges()
+
+    def _user_bucket(self, user_id):
+        bucket = self._user_buckets.get(user_id, count=False)
+        if bucket is None:
+            bucket = TokenBucket(self.per_user_rate, self.per_user_burst)
+        self._user_buckets.set(user_id, bucket)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            user_id = await self._ready.get()
+            self._in_flight.add(user_id)
+            first_queued = self._pending[user_id][0][0]
+            # Hold the user's slot open briefly so close-together matches coalesce
+            wait = self.coalesce_window - (time.monotonic() - first_queued)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            messages = self._pending.pop(user_id)
+            self._update_gauges()
+            try:
+                await self._deliver(user_id, messages)
+            finally:
+                self._in_flight.discard(user_id)
+                if user_id in self._pending:
+                    # More arrived while we were sending
+                    self._ready.put_nowait(user_id)
+
+    async def _deliver(self, user_id, messages):
+        digest = DIGEST_SEPARATOR.join(text for _, text, _ in messages)
+        delivered = 0  # Characters of the digest sent so far
+        try:
+            for chunk in split_message(digest):
+                await self.global_bucket.acquire()
+                await self._user_bucket(user_id).acquire()
+                await self.send(user_id, chunk)
+                delivered = digest.index(chunk, delivered) + len(chunk)
+        except NotificationError as e:
+            error = e
+        except Exception as e:
+            error = NotificationError(str(e), retryable=True)
+        else:
+            self._record_sent(messages)
+            return
+
+        # Only what didn't go out is retried, the user already has the chunks before it
+        sent, unsent = self._split_delivered(messages, delivered)
+        self._record_sent(sent)
+        self._retry_or_drop(user_id, unsent, error)
+
+    def _split_delivered(self, messages, delivered):
+        sent, unsent = [], []
+        offset = 0
+        for queued_at, text, attempts in messages:
+            end = offset + len(text)
+            rest = text[max(0, delivered - offset):].lstrip('\n') if end > delivered else ''
+            if rest:
+                unsent.append((queued_at, rest, attempts))
+            else:
+                sent.append((queued_at, text, attempts))
+            offset = end + len(DIGEST_SEPARATOR)
+        return sent, unsent
+
+    def _record_sent(self, messages):
+        self.sent += len(messages)
+        now = time.monotonic()
+        for queued_at, _, _ in messages:
+            self.latencies.append(now - queued_at)
+            metrics.observe('pokevin_notify_latency_seconds', now - queued_at)
+        if messages:
+            metrics.inc('pokevin_notifications_total', len(messages), outcome='sent')
+
+    def _retry_or_drop(self, user_id, messages, error):
+        attempts = max(attempts for _, _, attempts in messages) + 1
+        if not error.retryable or attempts > self.max_retries:
+            print(f"Giving up on {len(messages)} notification(s) for user {user_id}: {error}")
+            self.failed += len(messages)
+            metrics.inc('pokevin_notifications_total', len(messages), outcome='failed')
+            return
+
+        self.retries += 1
+        metrics.inc('pokevin_notifications_total', len(messages), outcome='retried')
+        delay = error.retry_after or min(60.0, 2 ** attempts) * random.uniform(0.5, 1.5)
+        retry = [(queued_at, text, attempts) for queued_at, text, _ in messages]
+        if user_id in self._retrying:
+            # Already waiting out a backoff: go along with that retry
+            self._retrying[user_id][1].extend(retry)
+            return
+        # Re-queued later instead of sleeping here, so the worker moves on
+        handle = asyncio.get_running_loop().call_later(delay, self._retry_due, user_id)
+        self._retrying[user_id] = (handle, retry)
+        self._update_gauges()
+
+    def _retry_due(self, user_id):
+        handle, messages = self._retrying.pop(user_id)
+        handle.cancel()
+        self._enqueue(user_id, messages)
+
+    def _queue_depth(self):
+        users = self._pending.keys() | self._retrying.keys()
+        messages = sum(len(messages) for messages in self._pending.values())
+        messages += sum(len(messages) for _, messages in self._retrying.values())
+        return len(users), messages
+
+    def _update_gauges(self):
+        users, messages = self._queue_depth()
+        metrics.set('pokevin_notify_queued_users', users)
+        metrics.set('pokevin_notify_queued_messages', messages)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(pct):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+        queued_users, queued_messages = self._queue_depth()
+        return {
+            "queued_users": queued_users,
+            "queued_messages": queued_messages,  # Including those waiting to be retried
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latency_p50_ms": round(percentile(50) * 1000),
+            "latency_p95_ms": round(percentile(95) * 1000),
+        }
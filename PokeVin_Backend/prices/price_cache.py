@@ -0,0 +1,63 @@
+import itertools
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+# Version stamps for the JSON price API (prices/views.py). Every cached
+# response is keyed by the versions of the data it was built from: a card or
+# a user's wishlist. Listings that didn't resolve to a card appear in no
+# response, so saving them bumps nothing. Writing new observations bumps the
+# versions they touch, so stale responses simply stop being looked up. The
+# cache is shared between processes (see CACHES['prices']), so prices saved
+# by the bot expire responses served by the web process.
+
+VERSION_TTL = 30 * 24 * 3600
+CULL_EVERY = 500  # Writes between two culls of the file cache
+
+_writes = itertools.count()
+
+
+class PriceCache(FileBasedCache):
+    """FileBasedCache that culls every CULL_EVERY writes instead of on each
+    one. Django's culling lists the whole cache directory on every set(), and
+    a batch of price writes bumps hundreds of version keys, which made every
+    batch cost (keys x cache files)."""
+
+    def _cull(self):
+        if next(_writes) % CULL_EVERY == 0:
+            super()._cull()
+
+
+def price_cache():
+    return caches[getattr(settings, 'PRICE_API_CACHE', 'default')]
+
+
+def card_key(card_id):
+    return f'v:card:{card_id}'
+
+
+def wishlist_key(user_id):
+    return f'v:wishlist:{user_id}'
+
+
+def versions(keys):
+    """{key: version}; data that was never written since the cache started is version 0."""
+    found = price_cache().get_many(keys)
+    return {key: found.get(key, 0) for key in keys}
+
+
+def bump(keys):
+    if keys:
+        # A timestamp, not a counter: survives cache restarts without going backwards
+        stamp = time.time_ns()
+        price_cache().set_many({key: stamp for key in keys}, VERSION_TTL)
+
+
+def invalidate_prices(card_ids):
+    bump([card_key(card_id) for card_id in card_ids])
+
+
+def invalidate_wishlist(user_id):
+    bump([wishlist_key(user_id)])
@@ -0,0 +1,271 @@
+import asyncio
+import random
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import aiohttp
+from django.conf import settings
+
+from .metrics import metrics
+
+# Fail-fast scraping. Failures are classified so a removed listing or selector
+# drift isn't retried, while network errors and timeouts are, with jittered
+# backoff. Browser waits get timeout budgets derived from the page-load times
+# actually observed instead of a flat minute, and a per-domain circuit breaker
+# fails scrapes immediately while a domain keeps blocking or timing out.
+
+BLOCKED = 'blocked'
+REMOVED = 'removed'
+SELECTOR_DRIFT = 'selector_drift'
+NETWORK = 'network'
+TIMEOUT = 'timeout'
+CIRCUIT_OPEN = 'circuit_open'
+
+RETRYABLE = {NETWORK, TIMEOUT}
+# Failures that say the domain is unhealthy; a removed listing or a page we
+# couldn't parse still means eBay answered
+DOMAIN_FAILURES = {BLOCKED, NETWORK, TIMEOUT}
+
+BLOCKED_STATUSES = {403, 429, 503}
+REMOVED_STATUSES = {404, 410}
+BLOCKED_MARKERS = ('pardon our interruption', 'splashui/challenge', 'g-recaptcha', 'hcaptcha')
+REMOVED_MARKERS = (
+    "the item you're looking for isn't available",
+    'this listing is no longer available',
+    'we looked everywhere.',
+    'this listing was removed',
+)
+
+
+class ScrapeError(Exception):
+    """A classified scrape failure; `kind` is one of the constants above."""
+
+    def __init__(self, message, kind, retry_after=None):
+        super().__init__(message)
+        self.kind = kind
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.kind in RETRYABLE
+
+
+def classify_status(status):
+    if status in REMOVED_STATUSES:
+        return REMOVED
+    if status in BLOCKED_STATUSES:
+        return BLOCKED
+    return None
+
+
+def classify_page(html):
+    # Captcha interstitials and "item not available" pages come back as a 200
+    lowered = (html or '').lower()
+    if any(marker in lowered for marker in BLOCKED_MARKERS):
+        return BLOCKED
+    if any(marker in lowered for marker in REMOVED_MARKERS):
+        return REMOVED
+    return None
+
+
+def failure_kind(exc):
+    if isinstance(exc, ScrapeError):
+        return exc.kind
+    # Playwright's TimeoutError doesn't subclass the builtin one
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or type(exc).__name__ == 'TimeoutError':
+        return TIMEOUT
+    if isinstance(exc, (aiohttp.ClientError, ConnectionError)):
+        return NETWORK
+    # Playwright reports DNS/connection failures as "net::ERR_..." errors
+    if 'net::ERR_' in str(exc):
+        return NETWORK
+    return None
+
+
+def domain_of(url):
+    return urlsplit(url).hostname or ''
+
+
+def resilience_setting(name, default):
+    return getattr(settings, f'SCRAPER_{name}', default)
+
+
+class AdaptiveTimeout:
+    """Timeout budgets per (domain, stage) from recently observed durations.
+
+    The budget is `multiplier` x the p95 of the last `window` durations,
+    clamped to [minimum, maximum]; until `min_samples` have been seen it's
+    `maximum`. A timed-out wait is recorded at its full budget, so if pages
+    really do get slower the budget grows back instead of failing forever.
+    """
+
+    def __init__(self, minimum=None, maximum=None, multiplier=None, window=200, min_samples=10):
+        self.minimum = minimum or resilience_setting('TIMEOUT_MIN', 2.0)
+        self.maximum = maximum or resilience_setting('TIMEOUT_MAX', 30.0)
+        self.multiplier = multiplier or resilience_setting('TIMEOUT_MULTIPLIER', 3.0)
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}  # (domain, stage) -> deque of seconds
+        self._budgets = {}  # (domain, stage) -> seconds, recomputed on observe
+
+    def budget(self, domain, stage):
+        """Seconds to allow for the stage."""
+        return self._budgets.get((domain, stage), self.maximum)
+
+    def budget_ms(self, domain, stage):
+        # Playwright takes milliseconds
+        return self.budget(domain, stage) * 1000
+
+    def observe(self, domain, stage, seconds):
+        key = (domain, stage)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+        if len(samples) >= self.min_samples:
+            ordered = sorted(samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            self._budgets[key] = min(self.maximum, max(self.minimum, p95 * self.multiplier))
+
+    def observe_timeout(self, domain, stage):
+        self.observe(domain, stage, self.budget(domain, stage))
+
+    def stats(self):
+        return {f'{domain} {stage}': round(budget, 2) for (domain, stage), budget in self._budgets.items()}
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` domain failures in a row; while open
+    every call fails straight away. After the cooldown one probe is let
+    through (half-open): success closes the circuit, failure re-opens it with
+    the cooldown doubled, up to `max_cooldown`."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=None, cooldown=None, max_cooldown=None):
+        self.threshold = threshold or resilience_setting('BREAKER_FAILURES', 5)
+        self.base_cooldown = cooldown or resilience_setting('BREAKER_COOLDOWN', 30.0)
+        self.max_cooldown = max_cooldown or resilience_setting('BREAKER_MAX_COOLDOWN', 600.0)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.cooldown = self.base_cooldown
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_after(self):
+        return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    def allow(self):
+        """Raise ScrapeError(CIRCUIT_OPEN) unless a call may go out now."""
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                raise ScrapeError('Circuit open', CIRCUIT_OPEN, retry_after=self.retry_after())
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                raise ScrapeError('Circuit half-open, waiting on a probe', CIRCUIT_OPEN, retry_after=1.0)
+            self._probing = True
+
+    def record_success(self):
+        self._probing = False
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self._open()
+        elif self.state == self.CLOSED and self.failures >= self.threshold:
+            self._open()
+
+    def release(self):
+        # The call ended without telling us anything about the domain
+        self._probing = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self.trips += 1
+        self._opened_at = time.monotonic()
+
+
+class DomainBreakers:
+    def __init__(self, **options):
+        self.options = options
+        self._breakers = {}
+
+    def for_url(self, url):
+        domain = domain_of(url)
+        breaker = self._breakers.get(domain)
+        if breaker is None:
+            breaker = self._breakers[domain] = CircuitBreaker(**self.options)
+        return breaker
+
+    def stats(self):
+        return {
+            domain: {'state': b.state, 'failures': b.failures, 'trips': b.trips, 'retry_after_s': round(b.retry_after(), 1)}
+            for domain, b in self._breakers.items()
+        }
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    # "Full jitter": anywhere between 0 and the exponential step, so retries
+    # from concurrent scrapes don't land on the domain together
+    base = base or resilience_setting('RETRY_BASE_DELAY', 1.0)
+    cap = cap or resilience_setting('RETRY_MAX_DELAY', 30.0)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def guarded(url, func):
+    """Await `func()` behind the URL's domain circuit breaker."""
+    breaker = breakers.for_url(url)
+    breaker.allow()
+    try:
+        result = await func()
+    except BaseException as e:  # Cancellation too, or a half-open probe would never end
+        kind = failure_kind(e)
+        if kind in DOMAIN_FAILURES:
+            was_open = breaker.state == breaker.OPEN
+            breaker.record_failure()
+            if breaker.state == breaker.OPEN and not was_open:
+                metrics.inc('pokevin_scraper_circuit_open_total', domain=domain_of(url))
+                print(f"Circuit open for {domain_of(url)} for {breaker.cooldown:.0f}s after {kind}")
+        elif kind is not None:
+            breaker.record_success()  # The domain answered, the listing itself is the problem
+        else:
+            breaker.release()
+        raise
+    breaker.record_success()
+    return result
+
+
+async def with_retries(url, func, retries=None):
+    """Await `func()` behind the domain's circuit breaker, retrying network
+    errors and timeouts with jittered backoff. Anything else, or an open
+    circuit, is raised straight away."""
+    if retries is None:
+        retries = resilience_setting('RETRIES', 2)
+    attempt = 0
+    while True:
+        try:
+            return await guarded(url, func)
+        except Exception as e:
+            kind = failure_kind(e)
+            if kind not in RETRYABLE or attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            metrics.inc('pokevin_scraper_retries_total', kind=kind)
+            print(f"Retrying {url} after {kind} (attempt {attempt}, in {delay:.1f}s)")
+            await asyncio.sleep(delay)
+
+
+# Shared by every scraper entry point in the process
+timeouts = AdaptiveTimeout()
+breakers = DomainBreakers()
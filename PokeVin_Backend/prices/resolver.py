@@ -0,0 +1,253 @@
+import heapq
+import math
+import re
+from collections import namedtuple
+
+from django.conf import settings
+
+from .models import Card
+
+# Resolves a listing title to one catalog card. Titles are tokenized (so
+# "Mew" no longer matches inside "Mewtwo") and the card number is read from
+# "4/102"-style numbers, whose total also identifies the set. Candidates come
+# from an inverted index over card-name tokens built once from the catalog,
+# and set scores are computed once per title and shared by every candidate
+# from that set, so a title only costs a few dict lookups per candidate.
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+# "4/102", "TG05/TG30", "#4"; letters allowed for trainer gallery/promo numbers
+NUMBER_TOTAL_RE = re.compile(r'(?<![a-z0-9])([a-z]{0,4}\d{1,4}[a-z]?)\s*/\s*([a-z]{0,4}\d{1,4})(?![a-z0-9])')
+HASH_NUMBER_RE = re.compile(r'#\s*([a-z]{0,4}\d{1,4}[a-z]?)(?![a-z0-9])')
+LEADING_ZEROS_RE = re.compile(r'(?<![0-9])0+(?=\d)')
+
+# How much each part counts towards a card's score (they add up to 1)
+NAME_WEIGHT = 0.45
+NUMBER_WEIGHT = 0.30
+SET_WEIGHT = 0.25
+# Name words on more than this share of cards don't generate candidates on their own
+COMMON_TOKEN_SHARE = 0.05
+# A runner-up within this much of the best card makes the match ambiguous
+AMBIGUITY_MARGIN = 0.1
+# Words every set name shares that say nothing about which set it is
+SET_STOPWORDS = {'and', 'the', 'of', 'set', 'pokemon', 'tcg', 'promos', 'promo'}
+
+Resolution = namedtuple('Resolution', ['card_id', 'name', 'set_id', 'number', 'score', 'confidence'])
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower().replace('é', 'e'))
+
+
+def normalize_number(number):
+    # "004" -> "4", "TG05" -> "tg5", so title and catalog numbers compare equal
+    return LEADING_ZEROS_RE.sub('', number.lower())
+
+
+def parse_numbers(title):
+    """(card numbers, set totals) written in the title, e.g. ({'4'}, {'102'}) for '4/102'."""
+    lowered = title.lower()
+    numbers, totals = set(), set()
+    for number, total in NUMBER_TOTAL_RE.findall(lowered):
+        numbers.add(normalize_number(number))
+        totals.add(normalize_number(total))
+    for number in HASH_NUMBER_RE.findall(lowered):
+        numbers.add(normalize_number(number))
+    return numbers, totals
+
+
+def initialism(name):
+    words = [word for word in tokenize(name) if word not in SET_STOPWORDS]
+    return ''.join(word[0] for word in words) if len(words) > 1 else ''
+
+
+class _Set:
+    __slots__ = ('set_id', 'tokens', 'token_weight', 'codes', 'totals')
+
+    def __init__(self, set_id, name, ptcgo_code, printed_total, total):
+        self.set_id = set_id
+        self.tokens = {token for token in tokenize(name) if token not in SET_STOPWORDS}
+        self.token_weight = 0.0  # Filled in once every set is known (IDF)
+        # Abbreviations a seller might use: the set ID, the PTCGO code, the initials
+        self.codes = {code for code in (set_id.lower(), (ptcgo_code or '').lower(), initialism(name)) if code}
+        self.totals = {str(t) for t in (printed_total, total) if t}
+
+
+class CardResolver:
+    """Token-index resolver from listing titles to catalog card IDs.
+
+    `resolve(title)` returns the best candidates with a score (how well the
+    card's name, number and set agree with the title) and a confidence (the
+    score, discounted when another card scores almost as well). `best(title)`
+    is the single card, or None below `min_confidence`.
+    """
+
+    def __init__(self, min_confidence=None):
+        self.min_confidence = min_confidence or getattr(settings, 'CARD_RESOLVER_MIN_CONFIDENCE', 0.6)
+        self.loaded = False
+        self._clear()
+
+    def __len__(self):
+        return len(self._card_ids)
+
+    def _clear(self):
+        # Parallel per-card lists, indexed by position
+        self._card_ids = []
+        self._names = []
+        self._name_tokens = []
+        self._numbers = []
+        self._set_index = []
+        self._sets = []
+        self._by_name_token = {}  # token -> [card positions]
+        self._token_idf = {}  # name token -> weight
+        self._set_token_idf = {}
+        self._name_weight = []  # Sum of the card's name token weights
+        self._common_postings = 0
+
+    def load(self, cards=None):
+        """Build the index. `cards` are (card_id, name, number, set_id, set_name,
+        ptcgo_code, printed_total, total) rows; by default the whole catalog."""
+        if cards is None:
+            cards = Card.objects.values_list(
+                'card_id', 'name', 'number', 'card_set__set_id', 'card_set__name',
+                'card_set__ptcgo_code', 'card_set__printed_total', 'card_set__total',
+            ).iterator(chunk_size=5000)
+
+        self._clear()
+        set_positions = {}
+        for card_id, name, number, set_id, set_name, ptcgo_code, printed_total, total in cards:
+            if set_id not in set_positions:
+                set_positions[set_id] = len(self._sets)
+                self._sets.append(_Set(set_id, set_name, ptcgo_code, printed_total, total))
+            position = len(self._card_ids)
+            tokens = tuple(dict.fromkeys(tokenize(name)))
+            self._card_ids.append(card_id)
+            self._names.append(name)
+            self._name_tokens.append(tokens)
+            self._numbers.append(normalize_number(number or ''))
+            self._set_index.append(set_positions[set_id])
+            for token in tokens:
+                self._by_name_token.setdefault(token, []).append(position)
+
+        # Rare tokens ("charizard") say more than common ones ("ex", "v")
+        card_count = max(len(self._card_ids), 1)
+        self._common_postings = max(COMMON_TOKEN_SHARE * card_count, 50)
+        self._token_idf = {
+            token: math.log(1 + card_count / len(positions)) for token, positions in self._by_name_token.items()
+        }
+        self._name_weight = [sum(self._token_idf[t] for t in tokens) or 1.0 for tokens in self._name_tokens]
+
+        set_count = max(len(self._sets), 1)
+        set_token_counts = {}
+        for card_set in self._sets:
+            for token in card_set.tokens:
+                set_token_counts[token] = set_token_counts.get(token, 0) + 1
+        self._set_token_idf = {
+            token: math.log(1 + set_count / count) for token, count in set_token_counts.items()
+        }
+        for card_set in self._sets:
+            card_set.token_weight = sum(self._set_token_idf[t] for t in card_set.tokens) or 1.0
+
+        self.loaded = True
+        return self
+
+    # Everything load() builds, for the bot's warm-state snapshot (prices/snapshot.py)
+    STATE = (
+        '_card_ids', '_names', '_name_tokens', '_numbers', '_set_index', '_sets', '_by_name_token',
+        '_token_idf', '_set_token_idf', '_name_weight', '_common_postings',
+    )
+
+    def dump_state(self):
+        return {name: getattr(self, name) for name in self.STATE}
+
+    def load_state(self, state):
+        for name in self.STATE:
+            setattr(self, name, state[name])
+        self.loaded = True
+        return self
+
+    def _set_score(self, card_set, tokens, totals):
+        score = 0.0
+        if totals & card_set.totals:
+            score += 0.6
+        if tokens & card_set.codes:
+            score += 0.4
+        if card_set.tokens:
+            covered = sum(self._set_token_idf[t] for t in card_set.tokens & tokens)
+            score += 0.5 * covered / card_set.token_weight
+        return min(score, 1.0)
+
+    def resolve(self, title, limit=3):
+        """Best `limit` Resolutions for the title, best first."""
+        if not self.loaded or not title:
+            return []
+        tokens = set(tokenize(title))
+        numbers, totals = parse_numbers(title)
+        # A bare number token ("Charizard 4 Base Set") counts, for less than "4/102"
+        loose_numbers = {normalize_number(t) for t in tokens if t[-1].isdigit()} - numbers
+
+        # Candidates: every card sharing a distinctive name token with the title.
+        # Words on a big share of the catalog ("ex", "v") only add weight to
+        # cards that are already candidates instead of pulling in thousands
+        name_hits = {}
+        common = []
+        for token in tokens:
+            positions = self._by_name_token.get(token)
+            if positions is None:
+                continue
+            if len(positions) > self._common_postings:
+                common.append(token)
+                continue
+            weight = self._token_idf[token]
+            for position in positions:
+                name_hits[position] = name_hits.get(position, 0.0) + weight
+        for token in common:
+            weight = self._token_idf[token]
+            name_tokens = self._name_tokens
+            for position in name_hits:
+                if token in name_tokens[position]:
+                    name_hits[position] += weight
+
+        set_scores = {}
+        scored = []
+        # Hot loop: per-card data is read from the parallel lists bound locally
+        name_weights, card_numbers, set_index = self._name_weight, self._numbers, self._set_index
+        for position, hit_weight in name_hits.items():
+            name_score = hit_weight / name_weights[position]
+            if name_score < 0.5:
+                continue  # Shares only a minor word like "ex" with the title
+
+            number = card_numbers[position]
+            if number in numbers:
+                number_score = NUMBER_WEIGHT
+            elif number in loose_numbers:
+                number_score = NUMBER_WEIGHT / 2
+            else:
+                number_score = 0.0
+
+            set_position = set_index[position]
+            set_score = set_scores.get(set_position)
+            if set_score is None:
+                set_score = set_scores[set_position] = SET_WEIGHT * self._set_score(self._sets[set_position], tokens, totals)
+
+            scored.append((NAME_WEIGHT * name_score + number_score + set_score, position))
+
+        scored = heapq.nlargest(limit + 1, scored)
+        results = []
+        for rank, (score, position) in enumerate(scored[:limit]):
+            runner_up = scored[rank + 1][0] if rank + 1 < len(scored) else 0.0
+            margin = score - runner_up
+            confidence = score if margin >= AMBIGUITY_MARGIN else score * (0.5 + 0.5 * margin / AMBIGUITY_MARGIN)
+            results.append(Resolution(
+                self._card_ids[position], self._names[position], self._sets[self._set_index[position]].set_id,
+                self._numbers[position], round(score, 3), round(confidence, 3),
+            ))
+        return results
+
+    def best(self, title):
+        results = self.resolve(title, limit=1)
+        if results and results[0].confidence >= self.min_confidence:
+            return results[0]
+        return None
+
+
+card_resolver = CardResolver()
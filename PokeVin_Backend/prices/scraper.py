@@ -1,87 +1,218 @@
-from .models import PokemonPrice
+from .writer import price_writer
+from .browser_pool import browser_pool
+from .http_client import http_client
+from .cache import TTLCache
+from .listing_parser import canonical_listing_url, listing_key, parse_listing_html
+from .metrics import metrics, PARSE_FAILURE
+from .resilience import (
+    ScrapeError, REMOVED, SELECTOR_DRIFT, TIMEOUT,
+    classify_page, classify_status, domain_of, failure_kind, timeouts, with_retries,
+)
+from .resolver import card_resolver
+import time
 from decimal import Decimal
-from playwright.async_api import async_playwright
-from asgiref.sync import sync_to_async
+from django.conf import settings
+import asyncio
 import re
 
-@sync_to_async
-def save_to_db(name, price):
-    # Make sure this runs in a synchronous context
-    card, created = PokemonPrice.objects.update_or_create(
-        name=name,
-        defaults={'price': price, 'source': 'eBay'}
-    )
-    return card
-
-async def scrape_and_update_cards(url):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
-        await page.goto(url)
-
+TITLE_SELECTOR = 'h1.x-item-title__mainTitle span.ux-textspans--BOLD'
+PRICE_SELECTOR = 'div.x-price-primary span.ux-textspans'
+# Class the title selector hangs off; a page without it has changed its markup
+TITLE_SELECTOR_ROOT = 'x-item-title__mainTitle'
+RESULT_CACHE = 'pokevin_scraper_result_cache_total'
+
+# Finished scrapes by listing key (the eBay item ID), so the same listing
+# asked for again within the TTL isn't scraped again, plus the scrapes
+# currently running so concurrent requests for one listing share a scrape
+scrape_results = TTLCache(
+    maxsize=getattr(settings, 'SCRAPER_RESULT_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'SCRAPER_RESULT_CACHE_TTL', 120),
+)
+_inflight = {}  # listing key -> Task
+_coalesced = 0
+
+
+async def save_to_db(name, price):
+    # Write-behind: appended to the price history by price_writer in batched
+    # transactions, so scrapes never wait on (or fight over) the SQLite lock
+    with metrics.stage('save_to_db'):
+        # Tagged with the catalog card when the title resolves to one, for per-card prices
+        resolution = card_resolver.best(name) if card_resolver.loaded else None
+        price_writer.add(name, price, 'eBay', resolution.card_id if resolution else '')
+
+
+def clean_price(price_text):
+    # Clean price (remove symbols and convert to Decimal)
+    if not price_text:
+        return None
+    return Decimal(re.sub(r'[^\d.]', '', price_text))
+
+
+async def timed(domain, stage, awaitable):
+    # Feeds the stage's duration (or its timed-out budget) into its adaptive timeout
+    start = time.perf_counter()
+    try:
+        result = await awaitable
+    except Exception as e:
+        if failure_kind(e) == TIMEOUT:
+            timeouts.observe_timeout(domain, stage)
+        raise
+    timeouts.observe(domain, stage, time.perf_counter() - start)
+    return result
+
+
+async def extract_name_price(page, url):
+    domain = domain_of(url)
+    with metrics.stage('goto'):
+        response = await timed(domain, 'goto', page.goto(url, timeout=timeouts.budget_ms(domain, 'goto')))
+        kind = classify_status(response.status) if response is not None else None
+        if kind:
+            raise ScrapeError(f"HTTP {response.status}", kind)
+
+    # Wait for the title to appear, for about as long as titles usually take
+    with metrics.stage('wait_for_selector'):
         try:
-            # Wait for the title to appear
-            await page.wait_for_selector('h1.x-item-title__mainTitle span.ux-textspans--BOLD', timeout=60000)
-
-            # Extract card name (eBay listing title)
-            raw_title = await page.locator('h1.x-item-title__mainTitle span.ux-textspans--BOLD').inner_text()
-            name = raw_title.strip()
-
-            # Extract price
-            price_text = await page.locator("div.x-price-primary span.ux-textspans").first.inner_text()
-            print(f"Raw price text: {price_text}")  # Debug: Print raw price text
-
-            # Clean price (remove symbols and convert to Decimal)
-            if price_text:
-                price_text = re.sub(r'[^\d.]', '', price_text)  # Remove non-numeric characters
-                print(f"Cleaned price text: {price_text}")  # Debug: Print cleaned price
-                cleaned_price = Decimal(price_text)
-            else:
-                print("Price not found!")
-                return  # Skip saving if price is missing
-
-            # Save to database using sync_to_async
-            await save_to_db(name, cleaned_price)
-            print(f"Saved to DB: {name} - {cleaned_price}")
-
+            await timed(domain, 'wait_for_selector', page.wait_for_selector(
+                TITLE_SELECTOR, timeout=timeouts.budget_ms(domain, 'wait_for_selector'),
+            ))
+        except Exception as e:
+            if failure_kind(e) != TIMEOUT:
+                raise
+            # Work out why the title never showed up before giving up on the page
+            html = await page.content()
+            kind = classify_page(html)
+            if kind:
+                raise ScrapeError(f"Page is {kind}", kind) from e
+            name, price_text = parse_listing_html(html)
+            if name and price_text:
+                return name, price_text
+            if TITLE_SELECTOR_ROOT not in html:
+                raise ScrapeError("Page loaded but the title markup is missing", SELECTOR_DRIFT) from e
+            raise
+
+    with metrics.stage('extract'):
+        # Extract card name (eBay listing title)
+        raw_title = await page.locator(TITLE_SELECTOR).inner_text()
+        name = raw_title.strip()
+
+        # Extract price
+        price_text = await page.locator(PRICE_SELECTOR).first.inner_text()
+    return name, price_text
+
+
+async def fetch_name_price(url):
+    # Fast path: plain HTTP fetch + HTML parse, no browser involved
+    domain = domain_of(url)
+    with metrics.stage('http_fetch') as timer:
+        status, html = await timed(domain, 'http_fetch', http_client.get_text(
+            url, timeout=timeouts.budget(domain, 'http_fetch'),
+        ))
+        if status != 200:
+            timer.outcome = f'http_{status}'
+    if classify_status(status) == REMOVED:
+        # A browser would only wait out its timeout on the same 404
+        raise ScrapeError(f"HTTP {status}", REMOVED)
+    if status != 200:
+        return None, None
+    with metrics.stage('parse') as timer:
+        name, price_text = parse_listing_html(html)
+        if not (name and price_text):
+            timer.outcome = PARSE_FAILURE
+            if classify_page(html) == REMOVED:
+                raise ScrapeError("Listing is no longer available", REMOVED)
+    return name, price_text
+
+
+async def scrape_listing(url, pool=browser_pool, fast_path=None, retries=None, use_cache=True, before_fetch=None):
+    """Scrape one listing and return (name, price), raising on any failure.
+
+    Any link to the listing works: it's scraped at its canonical URL, a result
+    from the last SCRAPER_RESULT_CACHE_TTL seconds is reused (unless
+    `use_cache` is False) and callers asking while it's being scraped share
+    that scrape. Network errors and timeouts are retried with jittered
+    backoff; anything else, or a domain whose circuit breaker is open, fails
+    right away. `before_fetch`, if given, is awaited only when this call
+    starts a scrape itself, e.g. to wait for a rate-limit slot.
+    """
+    key = listing_key(url)
+    if use_cache:
+        cached = scrape_results.get(key)
+        if cached is not None:
+            metrics.inc(RESULT_CACHE, result='hit')
+            return cached
+
+    task = _inflight.get(key)
+    if task is None:
+        metrics.inc(RESULT_CACHE, result='miss')
+        task = asyncio.ensure_future(_scrape_fresh(key, canonical_listing_url(url), pool, fast_path, retries, before_fetch))
+        _inflight[key] = task
+        task.add_done_callback(lambda _task: _inflight.pop(key, None))
+    else:
+        global _coalesced
+        _coalesced += 1
+        metrics.inc(RESULT_CACHE, result='coalesced')
+    # Shielded so one caller giving up doesn't cancel the scrape for the others
+    return await asyncio.shield(task)
+
+
+def scrape_cache_stats():
+    return {**scrape_results.stats(), 'coalesced': _coalesced, 'in_flight': len(_inflight)}
+
+
+async def _scrape_fresh(key, url, pool, fast_path, retries, before_fetch=None):
+    if before_fetch is not None:
+        await before_fetch(url)
+    with metrics.stage('scrape'):
+        result = await with_retries(url, lambda: _scrape_listing(url, pool, fast_path), retries)
+    scrape_results.set(key, result)
+    return result
+
+
+async def _scrape_listing(url, pool, fast_path):
+    if fast_path is None:
+        fast_path = getattr(settings, 'SCRAPER_HTTP_FAST_PATH', True)
+
+    name = price_text = None
+    if fast_path:
+        try:
+            name, price_text = await fetch_name_price(url)
+        except ScrapeError:
+            raise
         except Exception as e:
-            print(f"Error scraping {url}: {e}")
+            print(f"HTTP fast path failed for {url}: {e}")
 
-        finally:
-            await browser.close()
+    # Only spin up a page when the server HTML didn't have what we need
+    if not (name and price_text):
+        async with pool.page() as page:
+            name, price_text = await extract_name_price(page, url)
 
-async def scrape_and_get_name_price(url):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
-        await page.goto(url)
+    cleaned_price = clean_price(price_text)
+    if cleaned_price is None:
+        raise ValueError("Price not found!")
+    return name, cleaned_price
 
-        try:
-            # Wait for the title to appear
-            await page.wait_for_selector('h1.x-item-title__mainTitle span.ux-textspans--BOLD', timeout=60000)
 
-            # Extract card name (eBay listing title)
-            raw_title = await page.locator('h1.x-item-title__mainTitle span.ux-textspans--BOLD').inner_text()
-            name = raw_title.strip()
+async def scrape_and_update_cards(url, pool=browser_pool):
+    try:
+        name, cleaned_price = await scrape_listing(url, pool)
+        print(f"Cleaned price text: {cleaned_price}")  # Debug: Print cleaned price
 
-            # Extract price
-            price_text = await page.locator("div.x-price-primary span.ux-textspans").first.inner_text()
+        # Queue for the next batched database write
+        await save_to_db(name, cleaned_price)
+        print(f"Queued for DB: {name} - {cleaned_price}")
 
-            if price_text:
-                price_text = re.sub(r'[^\d.]', '', price_text)
-                cleaned_price = Decimal(price_text)
-            else:
-                return None, None
+    except Exception as e:
+        print(f"Error scraping {url}: {e}")
 
-            return name, cleaned_price
 
-        except Exception as e:
-            print(f"Error scraping {url}: {e}")
-            return None, None
+async def scrape_and_get_name_price(url, pool=browser_pool):
+    try:
+        return await scrape_listing(url, pool)
 
-        finally:
-            await browser.close()
+    except Exception as e:
+        print(f"Error scraping {url}: {e}")
+        return None, None
 
 
 def normalize_scraped_data(text):
-    return re.sub(r'[^a-zA-Z0-9]', '', text).lower()
\ No newline at end of file
+    return re.sub(r'[^a-zA-Z0-9]', '', text).lower()
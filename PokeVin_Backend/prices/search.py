@@ -0,0 +1,96 @@
+from collections import namedtuple
+from urllib.parse import urlencode, urljoin, urlsplit, urlunsplit, parse_qsl
+
+from django.conf import settings
+
+from .browser_pool import browser_pool
+from .http_client import http_client
+from .listing_parser import parse_search_results
+from .metrics import metrics
+from .resilience import domain_of, timeouts, with_retries
+from .scraper import clean_price, save_to_db, timed
+
+# Scrapes eBay search (or saved search) results pages: every result card
+# carries a title and price, so one navigation yields a whole page of price
+# points instead of the single one an item page gives.
+
+RESULTS_SELECTOR = 'li.s-item, li.s-card'
+MAX_RESULTS_PER_PAGE = 240  # The largest page size eBay serves
+
+SearchResult = namedtuple('SearchResult', ['item_id', 'title', 'price', 'url'])
+
+
+def with_page_size(url, page_size):
+    # Ask for the biggest pages eBay allows (_ipg), so fewer navigations cover the same results
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query['_ipg'] = str(page_size)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def fetch_results_page(url, pool, fast_path):
+    domain = domain_of(url)
+    if fast_path:
+        try:
+            with metrics.stage('search_http_fetch'):
+                status, html = await timed(domain, 'search_http_fetch', http_client.get_text(
+                    url, timeout=timeouts.budget(domain, 'search_http_fetch'),
+                ))
+            if status == 200:
+                with metrics.stage('search_parse'):
+                    results, next_url = parse_search_results(html, url)
+                if results:
+                    return results, next_url
+        except Exception as e:
+            print(f"HTTP fast path failed for {url}: {e}")
+
+    # Results are rendered client-side for some searches, let a browser page do it
+    async with pool.page() as page:
+        with metrics.stage('search_goto'):
+            await timed(domain, 'search_goto', page.goto(url, timeout=timeouts.budget_ms(domain, 'search_goto')))
+        with metrics.stage('search_wait_for_selector'):
+            await timed(domain, 'search_wait_for_selector', page.wait_for_selector(
+                RESULTS_SELECTOR, timeout=timeouts.budget_ms(domain, 'search_wait_for_selector'),
+            ))
+        with metrics.stage('search_parse'):
+            return parse_search_results(await page.content(), url)
+
+
+async def iter_search_results(url, max_pages=None, pool=browser_pool, fast_path=None):
+    """Async generator of SearchResult for every listing on up to `max_pages`
+    results pages, following eBay's own "next page" link. Listings that show up
+    on more than one page are only yielded once."""
+    if max_pages is None:
+        max_pages = getattr(settings, 'SCRAPER_SEARCH_MAX_PAGES', 5)
+    if fast_path is None:
+        fast_path = getattr(settings, 'SCRAPER_HTTP_FAST_PATH', True)
+    page_size = getattr(settings, 'SCRAPER_SEARCH_PAGE_SIZE', MAX_RESULTS_PER_PAGE)
+
+    seen = set()
+    page_url = with_page_size(url, page_size)
+    for _ in range(max_pages):
+        results, next_url = await with_retries(page_url, lambda: fetch_results_page(page_url, pool, fast_path))
+        for item_id, title, price_text, item_url in results:
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            try:
+                price = clean_price(price_text)
+            except ArithmeticError:
+                continue
+            yield SearchResult(item_id, title, price, item_url)
+
+        if not next_url:
+            break
+        page_url = urljoin(page_url, next_url)
+
+
+async def scrape_search(url, max_pages=None, on_result=None, pool=browser_pool):
+    # Saves every result's price and awaits on_result(result) for each, returns how many
+    count = 0
+    async for result in iter_search_results(url, max_pages, pool):
+        await save_to_db(result.title, result.price)
+        if on_result is not None:
+            await on_result(result)
+        count += 1
+    return count
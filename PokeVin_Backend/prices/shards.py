@@ -0,0 +1,235 @@
+import asyncio
+import json
+import os
+
+from django.conf import settings
+
+# Sharded deployment. `manage.py run_shards` starts several bot processes,
+# each connecting a share of the shards (BOT_SHARD_IDS of BOT_SHARD_COUNT) as
+# an AutoShardedBot, and runs a ShardHub the processes talk to over localhost
+# TCP. The process holding shard 0 is the primary: it sends every DM, so the
+# notification rate limits and per-user batching stay in one place, and the
+# others forward their notifications to it. Wishlist changes are broadcast so
+# every process's matcher stays current. Anything else the processes share
+# (prices, watched listings, scrape jobs) goes through the database.
+
+ALL = 'all'
+PRIMARY = 'primary'
+
+
+def _int_list(value):
+    return [int(part) for part in str(value or '').replace(' ', '').split(',') if part]
+
+
+class ShardConfig:
+    """Which shards this process runs, from BOT_SHARD_COUNT/BOT_SHARD_IDS.
+
+    No shard count: a plain single-connection bot. A count but no IDs (or
+    'auto'): every shard in this process. Both: this process's share, which
+    is how run_shards starts the bot.
+    """
+
+    def __init__(self, shard_count=None, shard_ids=None):
+        count = settings.BOT_SHARD_COUNT if shard_count is None else shard_count
+        self.auto = str(count).lower() == 'auto'
+        self.shard_count = None if self.auto or not count else int(count)
+        self.shard_ids = _int_list(settings.BOT_SHARD_IDS if shard_ids is None else shard_ids) or None
+
+    @property
+    def sharded(self):
+        return self.auto or self.shard_count is not None
+
+    @property
+    def multi_process(self):
+        # Only some of the shards are here, the others are in sibling processes
+        return self.shard_ids is not None and self.shard_count is not None and len(self.shard_ids) < self.shard_count
+
+    @property
+    def primary(self):
+        return not self.multi_process or 0 in self.shard_ids
+
+    @property
+    def process_name(self):
+        # Distinct per process, for metrics files and logs
+        if not self.multi_process:
+            return 'bot'
+        return 'bot-shard-' + '-'.join(str(shard_id) for shard_id in self.shard_ids)
+
+    def bot_options(self):
+        if not self.sharded:
+            return {}
+        return {'shard_count': self.shard_count, 'shard_ids': self.shard_ids}
+
+
+def shard_for_guild(guild_id, shard_count):
+    # Discord's routing: which shard receives a guild's events
+    return (guild_id >> 22) % shard_count
+
+
+def assign_shards(shard_count, processes):
+    """Shard IDs per process, round-robin: [[0, 2], [1, 3]] for 4 over 2."""
+    return [list(range(index, shard_count, processes)) for index in range(processes)]
+
+
+def use_discord_api(base):
+    """Point discord.py's REST calls and gateway connections at `base` (e.g.
+    prices/fake_gateway.py's http://127.0.0.1:8780) instead of Discord."""
+    import yarl
+    from discord.gateway import DiscordWebSocket
+    from discord.http import Route
+
+    base = base.rstrip('/')
+    Route.BASE = f'{base}/api/v10'
+    DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(base.replace('http', 'ws', 1) + '/gateway')
+
+
+def _encode(message):
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+class ShardLink:
+    """A bot process's connection to the launcher's ShardHub.
+
+    Messages are JSON objects with a `type`, sent to every other process or
+    only to the primary (`to`). Handlers registered with on(type, handler)
+    are awaited per message received. A message for the primary that the hub
+    couldn't deliver comes back as 'undeliverable'. The link reconnects by
+    itself; while it's down send() returns False and the caller falls back
+    to handling the message locally, and once it's back a 'reconnected'
+    message is handled, since broadcasts sent meanwhile were missed.
+    """
+
+    def __init__(self, config, host=None, port=None):
+        self.config = config
+        self.host = host or getattr(settings, 'BOT_IPC_HOST', '127.0.0.1')
+        self.port = port or getattr(settings, 'BOT_IPC_PORT', 8790)
+        self.connections = 0
+        self._handlers = {}
+        self._writer = None
+        self._task = None
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    def on(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def send(self, kind, to=ALL, **payload):
+        if self._writer is None:
+            return False
+        self._writer.write(_encode({'type': kind, 'to': to, **payload}))
+        return True
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                print(f"Shard IPC hub at {self.host}:{self.port} unreachable ({e}), retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            delay = 1.0
+            writer.write(_encode({
+                'type': 'hello', 'shards': self.config.shard_ids, 'primary': self.config.primary, 'pid': os.getpid(),
+            }))
+            self._writer = writer
+            self.connections += 1
+            if self.connections > 1:
+                await self._handle({'type': 'reconnected'})
+            try:
+                async for line in reader:
+                    await self._dispatch(line)
+            except ConnectionError:
+                pass
+            finally:
+                self._writer = None
+                writer.close()
+            print("Shard IPC hub connection lost, reconnecting")
+
+    async def _dispatch(self, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        await self._handle(message)
+
+    async def _handle(self, message):
+        handler = self._handlers.get(message.get('type'))
+        if handler is None:
+            return
+        try:
+            await handler(message)
+        except Exception as e:
+            print(f"Error handling shard IPC {message.get('type')} message: {e}")
+
+
+class ShardHub:
+    """Relays ShardLink messages between the bot processes (run by run_shards)."""
+
+    def __init__(self, host=None, port=None):
+        self.host = host or getattr(settings, 'BOT_IPC_HOST', '127.0.0.1')
+        self.port = port or getattr(settings, 'BOT_IPC_PORT', 8790)
+        self._clients = {}  # StreamWriter -> hello message
+        self._handlers = set()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            # The handlers see the connections close and return
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            hello = json.loads(await reader.readline() or 'null')
+        except ValueError:
+            hello = None
+        if not isinstance(hello, dict) or hello.get('type') != 'hello':
+            writer.close()
+            return
+        self._clients[writer] = hello
+        self._handlers.add(asyncio.current_task())
+        try:
+            async for line in reader:
+                self._relay(writer, line)
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def _relay(self, sender, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        to_primary = message.get('to') == PRIMARY
+        targets = [
+            writer for writer, hello in self._clients.items()
+            if writer is not sender and (not to_primary or hello.get('primary'))
+        ]
+        if to_primary and not targets:
+            # The primary is restarting: the sender handles it itself
+            sender.write(_encode({'type': 'undeliverable', 'message': message}))
+            return
+        for writer in targets:
+            writer.write(line)
@@ -0,0 +1,99 @@
+import os
+import pickle
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import Card, CardSet
+
+# Warm-state snapshot for bot restarts. On shutdown the bot pickles what it
+# otherwise rebuilds from scratch on startup: the card resolver's index, the
+# wishlist matcher's index, the card API response cache and the DM channel
+# IDs. The next start reads the file back and unpickles it, then checks each
+# part against the database instead of rebuilding it: the resolver is reused
+# while the catalog is unchanged, and the matcher only re-indexes the wishlist
+# rows that changed while the bot was down. Anything that doesn't check out
+# is rebuilt as before. Unpickling runs code, so the file lives in the
+# project directory (BOT_SNAPSHOT_PATH) and only the bot's user can read or
+# write it; it's only ever written by the bot itself.
+
+SNAPSHOT_FORMAT = 1  # Bump when what's pickled changes shape
+
+
+def snapshot_path():
+    return getattr(settings, 'BOT_SNAPSHOT_PATH', None)
+
+
+def catalog_fingerprint():
+    # Changes whenever sync_cards adds cards or a set was updated upstream
+    cards = Card.objects.aggregate(count=Count('id'), last=Max('id'))
+    sets = CardSet.objects.aggregate(count=Count('id'), updated=Max('api_updated_at'))
+    return (cards['count'], cards['last'], sets['count'], sets['updated'])
+
+
+def write_snapshot(parts, path=None):
+    """Pickle `parts` (a dict) to the snapshot file, atomically: a crash
+    mid-write leaves the previous snapshot in place."""
+    path = path or snapshot_path()
+    if not path:
+        return False
+    snapshot = {'format': SNAPSHOT_FORMAT, 'written_at': time.time(), **parts}
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Couldn't write the warm-state snapshot to {path}: {e}")
+        return False
+    return True
+
+
+def read_snapshot(path=None):
+    """The snapshot's dict, with `age` in seconds added, or None when there's
+    no usable snapshot."""
+    path = path or snapshot_path()
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.loads(f.read())
+    except Exception as e:  # Truncated, or from code that no longer unpickles it
+        print(f"Ignoring the warm-state snapshot at {path}: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT:
+        return None
+    snapshot['age'] = max(0.0, time.time() - snapshot['written_at'])
+    return snapshot
+
+
+def warm_resolver(resolver, snapshot):
+    """Restore the resolver's index from the snapshot if it was built from
+    the current catalog, load it from the database otherwise. Returns the
+    catalog's fingerprint (to snapshot along with the index) and whether the
+    snapshot was used."""
+    fingerprint = catalog_fingerprint()
+    if snapshot and snapshot.get('catalog') == fingerprint and 'resolver' in snapshot:
+        resolver.load_state(snapshot['resolver'])
+        return fingerprint, True
+    resolver.load()
+    return fingerprint, False
+
+
+def warm_matcher(matcher, snapshot, items):
+    """Restore the matcher from the snapshot and apply the wishlist changes
+    made since, or build it from `items`. Returns the number of entries that
+    had to be (re)indexed."""
+    if snapshot and 'matcher' in snapshot:
+        matcher.load_state(snapshot['matcher'])
+        return matcher.sync(items)
+    matcher.load(items)
+    return len(matcher)
+
+
+def restore_cache(cache, snapshot, name):
+    # A TTLCache's entries, aged by the time the bot was down
+    if snapshot and name in snapshot:
+        cache.restore(snapshot[name], elapsed=snapshot['age'])
+    return len(cache)
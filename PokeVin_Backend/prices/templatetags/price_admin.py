@@ -0,0 +1,69 @@
+import calendar
+
+from django import template
+from django.utils import timezone
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def price_date_hierarchy(cl):
+    """The admin's date drill-down for the price changelist. The stock tag
+    lists the years/months/days that have rows with a DISTINCT over a date
+    function of every row; this one offers every year/month/day between the
+    table's first and last observation, found with two index lookups.
+    A choice can turn out empty."""
+    field = cl.date_hierarchy
+    year_field, month_field, day_field = f'{field}__year', f'{field}__month', f'{field}__day'
+    year, month, day = (cl.params.get(name) for name in (year_field, month_field, day_field))
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field}__', 'before'])
+
+    # Two queries: SQLite only answers a lone MIN() or MAX() from the index
+    dates = cl.model._default_manager.values_list(field, flat=True)
+    first, last = dates.order_by(field).first(), dates.order_by('-' + field).first()
+    if first is None:
+        return {'show': False}
+    first, last = timezone.localtime(first), timezone.localtime(last)
+
+    try:
+        year, month, day = (int(value) if value else None for value in (year, month, day))
+    except ValueError:
+        return {'show': False}
+    if year is None and first.year == last.year:
+        year = first.year
+
+    if year and month and day:
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year, month_field: month}), 'title': f'{calendar.month_name[month]} {year}'},
+            'choices': [{'title': f'{calendar.month_name[month]} {day}'}],
+        }
+    if year and month:
+        days = range(1, calendar.monthrange(year, month)[1] + 1)
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year}), 'title': str(year)},
+            'choices': [
+                {'link': link({year_field: year, month_field: month, day_field: d}), 'title': f'{calendar.month_abbr[month]} {d}'}
+                for d in days
+                if (first.year, first.month, first.day) <= (year, month, d) <= (last.year, last.month, last.day)
+            ],
+        }
+    if year:
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': 'All dates'},
+            'choices': [
+                {'link': link({year_field: year, month_field: m}), 'title': f'{calendar.month_name[m]} {year}'}
+                for m in range(1, 13)
+                if (first.year, first.month) <= (year, m) <= (last.year, last.month)
+            ],
+        }
+    return {
+        'show': True,
+        'choices': [
+            {'link': link({year_field: y}), 'title': str(y)} for y in range(first.year, last.year + 1)
+        ],
+    }
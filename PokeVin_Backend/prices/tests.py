@@ -1,3 +1,849 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import PokemonPriceAdmin
+from .alerts import AlertEngine
+from .benchmark import FIXTURES_DIR
+from .catalog import find_card_by_id, find_cards_by_name, search_cards
+from .history import compact_prices, price_history, rebuild_rollups, record_observations, update_rollups
+from .jobs import enqueue_jobs, fail_job, lease_jobs
+from .listing_parser import canonical_listing_url, listing_key, parse_ld_json, parse_listing_html, parse_search_results
+from .matcher import WishlistMatcher
+from .metrics import metrics
+from .models import Card, CardSet, PokemonPrice, PriceAlert, PriceRollup, ScrapeJob, WishlistItem
+from .notifications import DIGEST_SEPARATOR, NotificationDispatcher, NotificationError, split_message
+from .price_cache import card_key, invalidate_prices, price_cache, versions
+from .resilience import (
+    BLOCKED, CIRCUIT_OPEN, NETWORK, REMOVED, TIMEOUT, AdaptiveTimeout, CircuitBreaker, DomainBreakers, ScrapeError,
+    classify_page, classify_status, failure_kind, with_retries,
+)
+from .resolver import CardResolver, parse_numbers
+from .transfer import export_rows, import_prices, import_wishlist
+from .watcher import WatchScheduler, add_watch, remove_watch
+from .worker import ScrapeWorker
+from .writer import PriceWriter
+
+ITEM_URL = 'https://www.ebay.com/itm/123456789012'
+
+# The 'prices' cache is file-based and shared with the running bot and web
+# process: tests get their own, in memory
+TEST_CACHES = {
+    **settings.CACHES,
+    'prices': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'prices-tests'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PricesTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        price_cache().clear()
+
+
+class PriceApiTests(PricesTestCase):
+    def setUp(self):
+        super().setUp()
+        PokemonPrice.objects.create(
+            name='Charizard Base Set Holo', price=Decimal('250.00'), source='eBay', card_id='base1-4',
+            date_fetched=timezone.now() - timedelta(hours=1),
+        )
+        self.url = reverse('card-latest-price', args=['base1-4'])
+
+    def test_latest_price(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['price'], '250.00')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_unknown_card_is_a_404(self):
+        self.assertEqual(self.client.get(reverse('card-latest-price', args=['base1-999'])).status_code, 404)
+
+    def test_unchanged_data_revalidates_as_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_price_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        PokemonPrice.objects.create(name='Charizard Base Set', price=Decimal('199.99'), source='eBay', card_id='base1-4')
+        invalidate_prices({'base1-4'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['price'], '199.99')
+
+    def test_cached_response_is_served_until_invalidated(self):
+        self.client.get(self.url)
+        PokemonPrice.objects.create(name='Charizard Base Set', price=Decimal('199.99'), source='eBay', card_id='base1-4')
+        self.assertEqual(self.client.get(self.url).json()['price'], '250.00')
+        invalidate_prices({'base1-4'})
+        self.assertEqual(self.client.get(self.url).json()['price'], '199.99')
+
+    def test_only_get(self):
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+@override_settings(API_TOKEN='s3cret', METRICS_DIR='')
+class PrivateApiTests(PricesTestCase):
+    def setUp(self):
+        super().setUp()
+        WishlistItem.objects.create(discord_user_id=10, pokemon_name='Charizard', set_name='Base', card_id='base1-4', max_price=Decimal('300.00'))
+        self.url = reverse('wishlist-prices', args=[10])
+
+    def test_anonymous_requests_are_refused(self):
+        for url in (self.url, reverse('metrics')):
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Bearer'))
+        with override_settings(API_TOKEN=''):
+            self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+
+    def test_token_or_staff_gets_in(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.client.force_login(User.objects.create_user('staff', password='password', is_staff=True))
+        self.assertEqual(self.client.get(self.url).json()['items'][0]['card_id'], 'base1-4')
+
+    def test_wishlist_follows_its_cards_prices(self):
+        etag = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret')['ETag']
+        record_observations([('Charizard lot', Decimal('50.00'), 'eBay', '')])  # Unresolved: bumps nothing
+        self.assertEqual(versions([card_key('base1-4')]), {card_key('base1-4'): 0})
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        record_observations([('Charizard Base Set', Decimal('250.00'), 'eBay', 'base1-4')])
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer s3cret', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['items'][0]['below_max_price'])
+
+
+class PriceHistoryTests(PricesTestCase):
+    def observe(self, prices, card_id='base1-4', age=timedelta(hours=1)):
+        # Observations written at a given age, as an import would
+        observations = PokemonPrice.objects.bulk_create([
+            PokemonPrice(name='Charizard Base Set', price=Decimal(price), source='eBay', card_id=card_id,
+                         date_fetched=timezone.now() - age)
+            for price in prices
+        ])
+        update_rollups(observations)
+        return observations
+
+    def rollup(self, period=PriceRollup.DAY, card_id='base1-4'):
+        return PriceRollup.objects.get(card_id=card_id, period=period)
+
+    def test_rollups_are_per_card(self):
+        record_observations([
+            ('Charizard Base Set Holo', Decimal('100.00'), 'eBay', 'base1-4'),
+            ('Charizard 4/102 PSA 9', Decimal('300.00'), 'eBay', 'base1-4'),
+            ('Charizard 4/102 PSA 10', Decimal('200.00'), 'eBay', 'base1-4'),
+            ('Some Charizard lot', Decimal('50.00'), 'eBay', ''),
+        ])
+        for period in (PriceRollup.HOUR, PriceRollup.DAY):
+            rollup = self.rollup(period)
+            self.assertEqual(
+                (rollup.count, rollup.min_price, rollup.max_price, rollup.median_price),
+                (3, Decimal('100.00'), Decimal('300.00'), Decimal('200.00')),
+            )
+        self.assertEqual(PriceRollup.objects.count(), 2)  # Nothing for the unresolved listing
+        self.assertEqual(price_history('base1-4').get(), self.rollup())
+
+    def test_compaction_keeps_the_latest_price_per_card(self):
+        self.observe(['100.00', '110.00'], age=timedelta(days=40))
+        self.observe(['90.00'], card_id='base1-2', age=timedelta(days=50))
+        self.observe(['80.00'], card_id='', age=timedelta(days=40))
+        self.observe(['120.00'], card_id='base1-2', age=timedelta(days=1))
+        self.observe(['130.00'], card_id='base1-2', age=timedelta(days=400))
+        raw, hourly = compact_prices(raw_days=30, hourly_days=365)
+        self.assertEqual((raw, hourly), (4, 0))  # Too old for an hourly rollup in the first place
+        self.assertEqual(
+            sorted(PokemonPrice.objects.values_list('card_id', 'price')),
+            [('base1-2', Decimal('120.00')), ('base1-4', Decimal('110.00'))],
+        )
+        self.assertEqual(self.rollup().count, 2)  # Rollups outlive the raw rows
+
+    def test_prices_merge_into_compacted_buckets(self):
+        self.observe(['100.00', '120.00', '140.00'], age=timedelta(days=40))
+        self.observe(['150.00'], age=timedelta(days=1))
+        compact_prices(raw_days=30, hourly_days=365)
+        # Recounting the bucket's raw rows would find none left: the new price is merged in
+        self.observe(['160.00'], age=timedelta(days=40))
+        rollup = PriceRollup.objects.filter(period=PriceRollup.HOUR).earliest('bucket_start')
+        self.assertEqual(rollup.count, 4)
+        self.assertEqual((rollup.min_price, rollup.max_price), (Decimal('100.00'), Decimal('160.00')))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.observe(['100.00', '300.00'])
+        self.observe(['200.00'], card_id='base1-2', age=timedelta(days=2))
+        self.observe(['50.00'], card_id='')
+        expected = sorted(PriceRollup.objects.values_list('card_id', 'period', 'count', 'median_price'))
+        PriceRollup.objects.all().delete()
+        self.assertEqual(rebuild_rollups(), 4)
+        self.assertEqual(sorted(PriceRollup.objects.values_list('card_id', 'period', 'count', 'median_price')), expected)
+
+    def test_history_endpoint_reads_the_rollups(self):
+        self.observe(['100.00', '300.00'], age=timedelta(days=40))
+        compact_prices(raw_days=30, hourly_days=365)
+        response = self.client.get(reverse('card-price-history', args=['base1-4']), {'days': 60})
+        history = response.json()['history']
+        self.assertEqual([(day['count'], day['median_price']) for day in history], [(2, '200.00')])
+
+
+class CatalogSearchTests(PricesTestCase):
+    def setUp(self):
+        super().setUp()
+        base = CardSet.objects.create(set_id='base1', name='Base', printed_total=102, total=102)
+        jungle = CardSet.objects.create(set_id='base2', name='Jungle', printed_total=64, total=64)
+        for number in range(1, 6):
+            Card.objects.create(card_id=f'swsh-{number}', name='Pikachu V', card_set=base, number=str(number))
+        Card.objects.create(card_id='base2-60', name='Pikachu', card_set=jungle, number='60')
+        Card.objects.create(card_id='base1-4', name='Charizard', card_set=base, number='4')
+
+    def ids(self, cards):
+        return [card['id'] for card in cards]
+
+    def test_exact_name_comes_before_the_limit(self):
+        self.assertEqual(self.ids(find_cards_by_name('Pikachu', limit=2))[0], 'base2-60')
+        self.assertEqual(len(find_cards_by_name('pikachu')), 6)
+
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(self.ids(find_cards_by_name('chari')), ['base1-4'])
+        self.assertEqual(find_cards_by_name('Raichu'), [])
+
+    def test_search_by_set_and_number(self):
+        self.assertEqual(self.ids(search_cards('Jungle', column='set_name')), ['base2-60'])
+        self.assertEqual(self.ids(search_cards('charizard base 4')), ['base1-4'])
+
+    def test_lookup_by_id_has_the_api_shape(self):
+        card = find_card_by_id('base2-60')
+        self.assertEqual((card['name'], card['set']['name'], card['set']['printedTotal']), ('Pikachu', 'Jungle', 64))
+        self.assertIsNone(find_card_by_id('base2-999'))
+
+    def test_index_follows_set_renames(self):
+        CardSet.objects.filter(set_id='base2').update(name='Jungle Unlimited')
+        self.assertEqual(self.ids(search_cards('unlimited', column='set_name')), ['base2-60'])
+
+
+class WishlistMatcherTests(PricesTestCase):
+    def setUp(self):
+        self.matcher = WishlistMatcher()
+        self.matcher.add(1, 10, 'Charizard', 'Base Set', 'base1-4')
+        self.matcher.add(2, 20, 'Charizard', 'Base Set', 'base1-4')
+        self.matcher.add(3, 10, 'Pikachu', 'Jungle', 'jungle-60')
+
+    def test_match_needs_name_and_set_or_number(self):
+        self.assertEqual(
+            sorted(match['user_id'] for match in self.matcher.match('Charizard Holo Base Set Unlimited')),
+            [10, 20],
+        )
+        self.assertEqual(self.matcher.match('Charizard Holo Team Rocket'), [])
+        self.assertEqual([match['card_id'] for match in self.matcher.match('PSA 9 Pikachu #60')], ['jungle-60'])
+
+    def test_match_for_one_user(self):
+        self.assertEqual([match['user_id'] for match in self.matcher.match('Charizard Base Set', user_id=20)], [20])
+
+    def test_matched_card_ids(self):
+        self.assertEqual(self.matcher.matched_card_ids('Charizard Base Set'), {'base1-4'})
+
+    def test_readding_an_entry_reindexes_it(self):
+        self.matcher.add(1, 10, 'Blastoise', 'Base Set', 'base1-2')
+        self.assertIsNone(self.matcher.get(10, 'base1-4'))
+        self.assertEqual(self.matcher.get(10, 'base1-2')['pokemon_name'], 'Blastoise')
+        self.assertEqual([match['user_id'] for match in self.matcher.match('Charizard Base Set')], [20])
+
+    def test_remove_card_and_clear_user(self):
+        self.assertTrue(self.matcher.remove_card(20, 'base1-4'))
+        self.assertFalse(self.matcher.remove_card(20, 'base1-4'))
+        self.matcher.clear_user(10)
+        self.assertEqual(len(self.matcher), 0)
+        self.assertEqual(self.matcher.match('Charizard Base Set'), [])
+
+    def test_sync_only_reindexes_changes(self):
+        items = [
+            {'id': 1, 'discord_user_id': 10, 'pokemon_name': 'Charizard', 'set_name': 'Base Set', 'card_id': 'base1-4'},
+            {'id': 3, 'discord_user_id': 10, 'pokemon_name': 'Raichu', 'set_name': 'Jungle', 'card_id': 'jungle-14'},
+        ]
+        self.assertEqual(self.matcher.sync(items), 2)  # Pikachu changed to Raichu, pk 2 removed
+        self.assertEqual(len(self.matcher), 2)
+        self.assertIsNone(self.matcher.get(20, 'base1-4'))
+
+    def test_state_round_trip(self):
+        restored = WishlistMatcher()
+        restored.load_state(self.matcher.dump_state())
+        self.assertEqual(restored.get(20, 'base1-4'), self.matcher.get(20, 'base1-4'))
+        self.assertEqual(len(restored.match('Charizard Base Set')), 2)
+
+
+class WatchSchedulerTests(PricesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.listing, _ = async_to_sync(add_watch)(ITEM_URL + '?hash=x')
+        self.results = []
+
+    def check(self, scrape, on_result=None):
+        scheduler = WatchScheduler(on_result=on_result)
+        with mock.patch('prices.watcher.scrape_listing', scrape), mock.patch('prices.watcher.save_to_db', mock.AsyncMock()):
+            async_to_sync(scheduler._check)(self.listing)
+        self.listing.refresh_from_db()
+
+    def test_success_reschedules(self):
+        async def on_result(listing, name, price, old_price):
+            self.results.append((name, price, old_price))
+
+        self.check(mock.AsyncMock(return_value=('Charizard Base Set', Decimal('250.00'))), on_result)
+        self.assertEqual(self.listing.url, ITEM_URL)
+        self.assertEqual(self.listing.last_price, Decimal('250.00'))
+        self.assertGreater(self.listing.next_check_at, timezone.now())
+        self.assertEqual(self.results, [('Charizard Base Set', Decimal('250.00'), None)])
+
+    def test_failing_on_result_is_contained(self):
+        self.check(mock.AsyncMock(return_value=('Charizard', Decimal('1.00'))), mock.AsyncMock(side_effect=RuntimeError))
+        self.assertEqual(self.listing.last_price, Decimal('1.00'))
+
+    def test_failures_back_off_and_removed_listings_stop(self):
+        self.check(mock.AsyncMock(side_effect=TimeoutError))
+        self.assertEqual((self.listing.failures, self.listing.active), (1, True))
+        self.check(mock.AsyncMock(side_effect=ScrapeError("Listing is no longer available", REMOVED)))
+        self.assertFalse(self.listing.active)
+
+    def test_unwatch_during_a_check_sticks(self):
+        async def scrape(url, **kwargs):
+            await remove_watch(url)
+            return 'Charizard', Decimal('1.00')
+
+        self.check(scrape)
+        self.assertFalse(self.listing.active)
+        self.assertEqual(self.listing.last_price, Decimal('1.00'))
+
+
+class ScrapeJobTests(PricesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job = async_to_sync(enqueue_jobs)([ITEM_URL + '?hash=x'])[0]
+
+    def test_enqueue_reuses_a_waiting_job(self):
+        again = async_to_sync(enqueue_jobs)([ITEM_URL], ScrapeJob.HIGH)
+        self.assertEqual([job.pk for job in again], [self.job.pk])
+        self.assertEqual(ScrapeJob.objects.get().priority, ScrapeJob.HIGH)
+
+    def test_retry_waits_for_the_backoff(self):
+        job = async_to_sync(lease_jobs)('worker-1', 10)[0]
+        self.assertEqual(async_to_sync(lease_jobs)('worker-2', 10), [])
+
+        async_to_sync(fail_job)(job, 'Timed out', 'timeout', retry=True, retry_after=60)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScrapeJob.QUEUED)
+        self.assertGreater(job.available_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(async_to_sync(lease_jobs)('worker-2', 10), [])
+
+        ScrapeJob.objects.update(available_at=timezone.now())
+        retried = async_to_sync(lease_jobs)('worker-2', 10)
+        self.assertEqual([(job.pk, job.attempts) for job in retried], [(self.job.pk, 2)])
+
+    def test_no_retry_once_attempts_run_out(self):
+        ScrapeJob.objects.update(max_attempts=1)
+        job = async_to_sync(lease_jobs)('worker-1', 10)[0]
+        async_to_sync(fail_job)(job, 'Timed out', 'timeout', retry=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScrapeJob.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_expired_lease_is_taken_over(self):
+        async_to_sync(lease_jobs)('worker-1', 10)
+        ScrapeJob.objects.update(leased_until=timezone.now() - timedelta(seconds=1))
+        taken = async_to_sync(lease_jobs)('worker-2', 10)
+        self.assertEqual([job.worker for job in taken], ['worker-2'])
+
+        # The old worker's late result doesn't count
+        async_to_sync(fail_job)(ScrapeJob(pk=self.job.pk, worker='worker-1', attempts=1, max_attempts=3), 'late')
+        self.assertEqual(ScrapeJob.objects.get().status, ScrapeJob.RUNNING)
+
+    def test_job_whose_leases_keep_expiring_fails(self):
+        for _ in range(ScrapeJob.objects.get().max_attempts):
+            self.assertEqual(len(async_to_sync(lease_jobs)('worker', 10)), 1)
+            ScrapeJob.objects.update(leased_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(async_to_sync(lease_jobs)('worker', 10), [])
+        job = ScrapeJob.objects.get()
+        self.assertEqual((job.status, job.error_kind), (ScrapeJob.FAILED, 'lease_expired'))
+
+
+
+class ScrapeWorkerTests(PricesTestCase):
+    def test_locked_database_backs_off_instead_of_exiting(self):
+        worker = ScrapeWorker(name='worker-1', concurrency=2)
+        worker.db_retry_delay = 0.001
+        leases = [OperationalError('database is locked'), OperationalError('database is locked')]
+
+        async def lease(name, limit):
+            if leases:
+                raise leases.pop()
+            worker.stop()
+            return []
+
+        # Nothing else of the worker's runs: no browser, HTTP client, writer or metrics
+        stubs = {name: mock.AsyncMock() for name in ('prune_jobs', 'publish_periodically', 'browser_pool', 'http_client', 'price_writer')}
+        with mock.patch.multiple('prices.worker', lease_jobs=lease, publish=mock.Mock(), **stubs):
+            async_to_sync(worker.run)()
+        self.assertEqual(leases, [])
+
+
+class NotificationDispatcherTests(PricesTestCase):
+    def dispatcher(self, send, **kwargs):
+        return NotificationDispatcher(send, workers=4, coalesce_window=0.05, per_user_burst=10, **kwargs)
+
+    async def test_close_messages_go_out_as_one_digest(self):
+        sent = []
+
+        async def send(user_id, content):
+            sent.append((user_id, content))
+
+        dispatcher = self.dispatcher(send)
+        await dispatcher.start()
+        dispatcher.notify(10, 'Charizard')
+        dispatcher.notify(10, 'Blastoise')
+        dispatcher.notify(20, 'Pikachu')
+        await dispatcher.stop()
+        self.assertEqual(sorted(sent), [(10, 'Charizard' + DIGEST_SEPARATOR + 'Blastoise'), (20, 'Pikachu')])
+        self.assertEqual(dispatcher.stats()['sent'], 3)
+
+    async def test_waiting_retries_count_as_queued_and_go_out_on_stop(self):
+        attempts = []
+
+        async def send(user_id, content):
+            attempts.append(content)
+            if len(attempts) == 1:
+                raise NotificationError("Rate limited", retryable=True, retry_after=60)
+
+        dispatcher = self.dispatcher(send)
+        await dispatcher.start()
+        dispatcher.notify(10, 'Charizard')
+        while not dispatcher.retries:
+            await asyncio.sleep(0.01)
+        stats = dispatcher.stats()
+        self.assertEqual((stats['queued_users'], stats['queued_messages']), (1, 1))
+        self.assertIn((('pokevin_notify_queued_messages', ()), 1), metrics.gauges.items())
+        await dispatcher.stop()
+        self.assertEqual(attempts, ['Charizard', 'Charizard'])
+        self.assertEqual((dispatcher.sent, dispatcher.stats()['queued_messages']), (1, 0))
+
+    async def test_one_delivery_per_user_at_a_time(self):
+        sending, overlaps, sent = set(), [], []
+
+        async def send(user_id, content):
+            if user_id in sending:
+                overlaps.append(user_id)
+            sending.add(user_id)
+            await asyncio.sleep(0.3)
+            sending.discard(user_id)
+            sent.append(content)
+
+        dispatcher = self.dispatcher(send)
+        await dispatcher.start()
+        dispatcher.notify(10, 'Charizard')
+        await asyncio.sleep(0.08)  # Sending the first one
+        dispatcher.notify(10, 'Blastoise')
+        await asyncio.sleep(0.08)  # A free worker would have picked this up by now
+        dispatcher.notify(10, 'Venusaur')
+        await dispatcher.stop()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(sent, ['Charizard', 'Blastoise' + DIGEST_SEPARATOR + 'Venusaur'])
+
+    def test_long_digests_are_split_on_lines(self):
+        chunks = split_message('\n'.join(['x' * 900] * 3))
+        self.assertEqual([len(chunk) for chunk in chunks], [1801, 900])
+
+
+SEARCH_PAGE = """
+<ul>
+  <li class="s-item"><a href="https://www.ebay.com/itm/123456789"><span>Shop on eBay</span></a>
+    <div class="s-item__title">Shop on eBay</div><span class="s-item__price">$20.00</span></li>
+  <li class="s-item" data-listingid="285000000001">
+    <a class="s-item__link" href="https://www.ebay.co.uk/itm/charizard/285000000001?hash=x">
+      <div class="s-item__title"><span>New Listing</span>Charizard 4/102 Base Set Holo</div></a>
+    <span class="s-item__price">&pound;1,250.00 to &pound;1,400.00</span></li>
+  <li class="s-card"><a href="/itm/285000000002"><div class="s-card__title">Pikachu 58/102</div></a>
+    <div class="s-card__price">&pound;4.99</div></li>
+  <li class="s-item"><div class="s-item__title">Sponsored, no price</div><a href="/itm/285000000003"></a></li>
+</ul>
+<a class="pagination__next" href="/sch/i.html?_nkw=pokemon&amp;_pgn=2">Next</a>
+"""
+
+
+class SearchResultsParserTests(PricesTestCase):
+    def test_results_and_next_page(self):
+        results, next_url = parse_search_results(SEARCH_PAGE, 'https://www.ebay.co.uk/sch/i.html?_nkw=pokemon')
+        self.assertEqual(results, [
+            ('285000000001', 'Charizard 4/102 Base Set Holo', '1250.00', 'https://www.ebay.co.uk/itm/285000000001'),
+            ('285000000002', 'Pikachu 58/102', '4.99', 'https://www.ebay.co.uk/itm/285000000002'),
+        ])
+        self.assertEqual(next_url, '/sch/i.html?_nkw=pokemon&_pgn=2')
+
+    def test_listing_urls_are_on_the_search_pages_site(self):
+        for page_url, expected in (
+            ('https://m.ebay.de/sch/i.html', 'https://www.ebay.de/itm/285000000002'),
+            ('http://127.0.0.1:8765/sch/i.html', 'http://127.0.0.1:8765/itm/285000000002'),
+        ):
+            results, _ = parse_search_results(SEARCH_PAGE, page_url)
+            self.assertEqual(results[-1][3], expected)
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class ListingPageParserTests(PricesTestCase):
+    def test_ld_json_product(self):
+        self.assertEqual(
+            parse_listing_html(fixture('listing_ld_json.html')),
+            ('Charizard Holo 4/102 Base Set Unlimited WOTC Pokemon Card', '349.99'),
+        )
+
+    def test_markup_when_there_is_no_ld_json(self):
+        self.assertEqual(
+            parse_listing_html(fixture('listing_markup.html')),
+            ('Umbreon VMAX 215/203 Evolving Skies Alt Art PSA 10', 'US $1,249.00'),
+        )
+
+    def test_ld_json_graph_and_offer_lists(self):
+        html = (
+            '<script type="application/ld+json">{"@graph": [{"@type": "BreadcrumbList"}, '
+            '{"@type": ["Product"], "name": " Mew ex ", "offers": [{"lowPrice": 12.5}]}]}</script>'
+        )
+        self.assertEqual(parse_ld_json(html), ('Mew ex', '12.5'))
+
+    def test_broken_or_priceless_ld_json_falls_back_to_markup(self):
+        html = (
+            '<script type="application/ld+json">{not json</script>'
+            '<script type="application/ld+json">{"@type": "Product", "name": "Mew"}</script>'
+            '<h1 class="x-item-title__mainTitle"><span class="ux-textspans ux-textspans--BOLD">Mew 151</span></h1>'
+            '<div class="x-price-primary"><span class="ux-textspans">$9.99</span></div>'
+        )
+        self.assertEqual(parse_listing_html(html), ('Mew 151', '$9.99'))
+        self.assertEqual(parse_listing_html('<html><h1>Gone</h1></html>'), (None, None))
+
+
+class PriceWriterTests(PricesTestCase):
+    async def test_full_batches_go_out_at_once_and_close_flushes_the_rest(self):
+        writer = PriceWriter(batch_size=3, flush_interval=60)
+        for i in range(5):
+            writer.add(f'Charizard {i}', Decimal('100.00') + i, card_id='base1-4')
+        await asyncio.sleep(0.1)  # The flush task's turn: everything, in batch_size chunks
+        self.assertEqual((writer.written, writer.batches), (5, 2))
+        for i in range(5, 7):
+            writer.add(f'Charizard {i}', Decimal('100.00') + i, card_id='base1-4')
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(writer), 2)  # Not a full batch, waits for flush_interval
+        await writer.close()
+        self.assertEqual(writer.stats(), {'buffered': 0, 'written': 7, 'batches': 3, 'dropped': 0})
+        self.assertEqual(await PokemonPrice.objects.filter(card_id='base1-4').acount(), 7)
+        rollup = await PriceRollup.objects.aget(card_id='base1-4', period=PriceRollup.DAY)
+        self.assertEqual(rollup.count, 7)
+
+    async def test_failed_batches_are_kept_up_to_max_buffer(self):
+        writer = PriceWriter(batch_size=2, flush_interval=60, max_buffer=4)
+        with mock.patch('prices.writer.record_observations', side_effect=OperationalError('database is locked')):
+            for i in range(3):
+                writer.add(f'Charizard {i}', Decimal('100.00'))
+            await writer.flush()
+            for i in range(3, 6):
+                writer.add(f'Charizard {i}', Decimal('100.00'))
+            await writer.flush()
+        self.assertEqual((len(writer), writer.dropped, writer.written), (4, 2, 0))
+        await writer.close()
+        names = [name async for name in PokemonPrice.objects.order_by('id').values_list('name', flat=True)]
+        self.assertEqual(names, ['Charizard 2', 'Charizard 3', 'Charizard 4', 'Charizard 5'])
+
+
+class AlertEngineTests(PricesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.matcher = WishlistMatcher()
+        self.engine = AlertEngine(self.matcher)
+        items = [
+            {'id': 1, 'discord_user_id': 10, 'pokemon_name': 'Charizard', 'set_name': 'Base Set', 'card_id': 'base1-4', 'max_price': '100'},
+            {'id': 2, 'discord_user_id': 20, 'pokemon_name': 'Charizard', 'set_name': 'Base Set', 'card_id': 'base1-4', 'max_price': '300'},
+            {'id': 3, 'discord_user_id': 30, 'pokemon_name': 'Charizard', 'set_name': 'Base Set', 'card_id': 'base1-4', 'max_price': None},
+        ]
+        self.matcher.load(items)
+        self.engine.load(items)
+
+    def triggered_users(self, price):
+        return sorted(self.engine.triggered('Charizard Base Set Holo', Decimal(price)))
+
+    def test_only_thresholds_the_price_is_within(self):
+        self.assertEqual(self.triggered_users('50'), [10, 20, 30])
+        self.assertEqual(self.triggered_users('100'), [10, 20, 30])
+        self.assertEqual(self.triggered_users('100.01'), [20, 30])
+        self.assertEqual(self.triggered_users('1000'), [30])
+
+    def test_triggered_entries_carry_the_max_price(self):
+        triggered = self.engine.triggered('Charizard Base Set Holo', Decimal('50'))
+        self.assertEqual(triggered[10][0]['max_price'], Decimal('100'))
+        self.assertIsNone(triggered[30][0]['max_price'])
+
+    def test_no_price_triggers_nothing(self):
+        self.assertEqual(self.engine.triggered('Charizard Base Set Holo', None), {})
+
+    def test_set_threshold_and_remove(self):
+        self.engine.set_threshold(10, 'base1-4', '10')
+        self.engine.remove(30, 'base1-4')
+        self.assertEqual(self.triggered_users('50'), [20])
+
+    def test_each_user_is_alerted_once_per_listing(self):
+        evaluate = async_to_sync(self.engine.evaluate)
+        self.assertEqual(sorted(evaluate('Charizard Base Set Holo', Decimal('250'), ITEM_URL)), [20, 30])
+        self.assertEqual(sorted(evaluate('Charizard Base Set Holo', Decimal('50'), ITEM_URL)), [10])
+        self.assertEqual(evaluate('Charizard Base Set Holo', Decimal('50'), ITEM_URL), {})
+        self.assertEqual(PriceAlert.objects.filter(url=ITEM_URL).count(), 3)
+
+
+RESOLVER_CARDS = [
+    ('base1-4', 'Charizard', '4', 'base1', 'Base', 'BS', 102, 102),
+    ('base1-10', 'Mewtwo', '10', 'base1', 'Base', 'BS', 102, 102),
+    ('base1-58', 'Pikachu', '58', 'base1', 'Base', 'BS', 102, 102),
+    ('base2-60', 'Pikachu', '60', 'base2', 'Jungle', 'JU', 64, 64),
+    ('basep-8', 'Mew', '8', 'basep', 'Wizards Black Star Promos', 'PR', 53, 53),
+    ('swsh7-215', 'Umbreon VMAX', '215', 'swsh7', 'Evolving Skies', 'EVS', 203, 237),
+]
+
+
+class CardResolverTests(PricesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.resolver = CardResolver().load(RESOLVER_CARDS)
+
+    def best_id(self, title, resolver=None):
+        best = (resolver or self.resolver).best(title)
+        return best.card_id if best else None
+
+    def test_number_and_set_pick_the_printing(self):
+        self.assertEqual(self.best_id('Charizard 4/102 Base Set Holo WOTC'), 'base1-4')
+        self.assertEqual(self.best_id('Charizard 004/102'), 'base1-4')
+        self.assertEqual(self.best_id('Pikachu 60/64 Jungle'), 'base2-60')
+        self.assertEqual(self.best_id('Pikachu Base Set 58/102 Yellow Cheeks'), 'base1-58')
+        self.assertEqual(self.best_id('Umbreon VMAX 215/203 EVS Alt Art PSA 10'), 'swsh7-215')
+
+    def test_whole_words_only(self):
+        self.assertEqual(self.best_id('Mew #8 Black Star Promo'), 'basep-8')
+        self.assertEqual(self.best_id('Mewtwo 10/102 Holo'), 'base1-10')
+
+    def test_ambiguous_titles_resolve_to_nothing(self):
+        candidates = self.resolver.resolve('Pikachu')
+        self.assertEqual(sorted(c.card_id for c in candidates), ['base1-58', 'base2-60'])
+        self.assertTrue(all(c.confidence < self.resolver.min_confidence for c in candidates))
+        self.assertIsNone(self.best_id('Pikachu'))
+        self.assertIsNone(self.best_id('Blastoise 2/102'))
+
+    def test_numbers_in_titles(self):
+        self.assertEqual(parse_numbers('Charizard 004/102'), ({'4'}, {'102'}))
+        self.assertEqual(parse_numbers('Mew ex TG05/TG30 and #151'), ({'tg5', '151'}, {'tg30'}))
+
+    def test_catalog_and_snapshot_give_the_same_index(self):
+        sets = {}
+        for card_id, name, number, set_id, set_name, code, printed_total, total in RESOLVER_CARDS:
+            if set_id not in sets:
+                sets[set_id] = CardSet.objects.create(
+                    set_id=set_id, name=set_name, ptcgo_code=code, printed_total=printed_total, total=total,
+                )
+            Card.objects.create(card_id=card_id, name=name, number=number, card_set=sets[set_id])
+        from_catalog = CardResolver().load()
+        restored = CardResolver().load_state(from_catalog.dump_state())
+        for title in ('Charizard 4/102 Base Set Holo WOTC', 'Pikachu 60/64 Jungle', 'Pikachu'):
+            self.assertEqual(self.best_id(title, from_catalog), self.best_id(title))
+            self.assertEqual(restored.resolve(title), from_catalog.resolve(title))
+
+
+class ResilienceTests(PricesTestCase):
+    def test_failures_are_classified(self):
+        self.assertEqual((classify_status(410), classify_status(429), classify_status(200)), (REMOVED, BLOCKED, None))
+        self.assertEqual(classify_page('<h1>Pardon Our Interruption...</h1>'), BLOCKED)
+        self.assertEqual(classify_page('<p>This listing was removed</p>'), REMOVED)
+        self.assertEqual(failure_kind(asyncio.TimeoutError()), TIMEOUT)
+        self.assertEqual(failure_kind(Exception('net::ERR_NAME_NOT_RESOLVED')), NETWORK)
+        self.assertIsNone(failure_kind(ValueError('no price')))
+
+    def test_breaker_opens_probes_and_backs_off(self):
+        now = [1000.0]
+        breaker = CircuitBreaker(threshold=2, cooldown=10, max_cooldown=15)
+        with mock.patch('prices.resilience.time.monotonic', lambda: now[0]):
+            for _ in range(2):
+                breaker.allow()
+                breaker.record_failure()
+            with self.assertRaises(ScrapeError) as raised:
+                breaker.allow()
+            self.assertEqual((raised.exception.kind, raised.exception.retry_after), (CIRCUIT_OPEN, 10))
+
+            now[0] += 10
+            breaker.allow()  # The one probe
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            with self.assertRaises(ScrapeError):
+                breaker.allow()
+            breaker.record_failure()
+            self.assertEqual((breaker.state, breaker.cooldown, breaker.trips), (CircuitBreaker.OPEN, 15, 2))
+
+            now[0] += 15
+            breaker.allow()
+            breaker.record_success()
+            self.assertEqual((breaker.state, breaker.failures, breaker.cooldown), (CircuitBreaker.CLOSED, 0, 10))
+
+    def test_retries_only_network_errors_and_timeouts(self):
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise asyncio.TimeoutError()
+            return 'Charizard', '1.00'
+
+        async def removed():
+            calls.append(1)
+            raise ScrapeError('Listing is no longer available', REMOVED)
+
+        with mock.patch('prices.resilience.breakers', DomainBreakers(threshold=5)), \
+                mock.patch('prices.resilience.backoff_delay', return_value=0):
+            self.assertEqual(async_to_sync(with_retries)(ITEM_URL, flaky, retries=2), ('Charizard', '1.00'))
+            self.assertEqual(len(calls), 3)
+            calls.clear()
+            with self.assertRaises(ScrapeError):
+                async_to_sync(with_retries)(ITEM_URL, removed, retries=2)
+            self.assertEqual(len(calls), 1)
+
+    def test_adaptive_timeout_follows_observed_durations(self):
+        timeouts = AdaptiveTimeout(minimum=1, maximum=30, multiplier=3, min_samples=10)
+        for _ in range(9):
+            timeouts.observe('www.ebay.com', 'goto', 2.0)
+        self.assertEqual(timeouts.budget('www.ebay.com', 'goto'), 30)  # Too few samples yet
+        timeouts.observe('www.ebay.com', 'goto', 2.0)
+        self.assertEqual(timeouts.budget_ms('www.ebay.com', 'goto'), 6000)
+        # Timed-out waits count at their full budget, so the budget grows back
+        timeouts.observe_timeout('www.ebay.com', 'goto')
+        self.assertEqual(timeouts.budget('www.ebay.com', 'goto'), 18)
+        timeouts.observe_timeout('www.ebay.com', 'goto')
+        self.assertEqual(timeouts.budget('www.ebay.com', 'goto'), 30)
+
+
+class ListingUrlTests(PricesTestCase):
+    def test_canonical_url_drops_slug_and_tracking(self):
+        url = 'https://www.ebay.com/itm/Charizard-Base-Set-4-102/123456789012?hash=item1c&_trkparms=x#desc'
+        self.assertEqual(canonical_listing_url(url), ITEM_URL)
+
+    def test_canonical_url_keeps_the_regional_site(self):
+        self.assertEqual(
+            canonical_listing_url('https://m.ebay.co.uk/itm/123456789012?var=0'),
+            'https://www.ebay.co.uk/itm/123456789012',
+        )
+
+    def test_canonical_url_from_legacy_links(self):
+        self.assertEqual(canonical_listing_url('https://cgi.ebay.com/ws/eBayISAPI.dll?ViewItem&item=123456789012'), ITEM_URL)
+        self.assertEqual(canonical_listing_url('https://ebay.com/i/123456789012'), ITEM_URL)
+
+    def test_url_without_item_id_is_unchanged(self):
+        url = 'https://www.ebay.com/sch/i.html?_nkw=charizard'
+        self.assertEqual(canonical_listing_url(url), url)
+        self.assertEqual(listing_key(url), url)
+
+    def test_listing_key_is_the_same_on_every_site(self):
+        self.assertEqual(listing_key(ITEM_URL), 'ebay:123456789012')
+        self.assertEqual(listing_key('https://www.ebay.de/itm/Glurak/123456789012'), 'ebay:123456789012')
+
+
+class TransferTests(PricesTestCase):
+    def export(self, dataset, fmt, **filters):
+        out = io.StringIO()
+        export_rows(out, dataset, fmt, **filters)
+        return out.getvalue().splitlines(keepends=True)
+
+    def test_wishlist_round_trip(self):
+        WishlistItem.objects.create(discord_user_id=10, pokemon_name='Charizard', set_name='Base', card_id='base1-4', max_price=Decimal('99.50'))
+        WishlistItem.objects.create(discord_user_id=20, pokemon_name='Pikachu', set_name='Jungle', card_id='jungle-60')
+        rows = list(WishlistItem.objects.values_list('discord_user_id', 'pokemon_name', 'set_name', 'card_id', 'max_price').order_by('pk'))
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(fmt=fmt):
+                lines = self.export('wishlist', fmt)
+                WishlistItem.objects.all().delete()
+                stats, _ = import_wishlist(lines, fmt)
+                self.assertEqual((stats.read, stats.written, stats.invalid_count), (2, 2, 0))
+                self.assertEqual(
+                    list(WishlistItem.objects.values_list('discord_user_id', 'pokemon_name', 'set_name', 'card_id', 'max_price').order_by('pk')),
+                    rows,
+                )
+
+    def test_wishlist_import_without_max_price_keeps_it(self):
+        WishlistItem.objects.create(discord_user_id=10, pokemon_name='Charizard', set_name='Base', card_id='base1-4', max_price=Decimal('99.50'))
+        stats, written = import_wishlist(['card_id,pokemon_name,set_name\n', 'base1-4,Charizard Holo,Base\n'], 'csv', user_id=10)
+        item = WishlistItem.objects.get()
+        self.assertEqual((item.pokemon_name, item.max_price), ('Charizard Holo', Decimal('99.50')))
+        self.assertEqual(written[0].max_price, Decimal('99.50'))
+
+    def test_invalid_rows_are_counted(self):
+        lines = [
+            '{"discord_user_id": 10, "card_id": "base1-4", "pokemon_name": "Charizard", "set_name": "Base"}\n',
+            'not json\n',
+            '{"card_id": "base1-2", "pokemon_name": "Blastoise", "set_name": "Base"}\n',  # No user
+            '{"discord_user_id": 10, "card_id": "base1-15"}\n',  # No name, and not in the catalog
+        ]
+        stats, _ = import_wishlist(lines, 'jsonl')
+        self.assertEqual((stats.written, stats.invalid_count), (1, 3))
+
+    def test_missing_names_come_from_the_catalog(self):
+        card_set = CardSet.objects.create(set_id='base1', name='Base')
+        Card.objects.create(card_id='base1-4', name='Charizard', card_set=card_set, number='4')
+        import_wishlist(['discord_user_id,card_id\n', '10,base1-4\n'], 'csv')
+        self.assertEqual(list(WishlistItem.objects.values_list('pokemon_name', 'set_name')), [('Charizard', 'Base')])
+
+    def test_price_round_trip_keeps_date_fetched(self):
+        fetched = datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone.utc)
+        PokemonPrice.objects.create(name='Charizard Base Set', price=Decimal('250.00'), source='eBay', card_id='base1-4', date_fetched=fetched)
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(fmt=fmt):
+                lines = self.export('prices', fmt)
+                self.assertEqual(import_prices(lines, fmt).skipped, 1)  # Already there
+                PokemonPrice.objects.all().delete()
+                PriceRollup.objects.all().delete()
+                stats = import_prices(lines, fmt)
+                self.assertEqual((stats.written, stats.skipped), (1, 0))
+                self.assertEqual(
+                    list(PokemonPrice.objects.values_list('name', 'price', 'source', 'card_id', 'date_fetched')),
+                    [('Charizard Base Set', Decimal('250.00'), 'eBay', 'base1-4', fetched)],
+                )
+                self.assertEqual(PriceRollup.objects.get(card_id='base1-4', period=PriceRollup.DAY).count, 1)
+
+
+class PriceChangeListTests(PricesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        fetched = timezone.now() - timedelta(hours=1)
+        # Several rows on the same date_fetched, so the pk has to break the tie across pages
+        PokemonPrice.objects.bulk_create([
+            PokemonPrice(name=f'Charizard {i}', price=Decimal(i + 1), source='eBay', date_fetched=fetched + timedelta(minutes=i // 3))
+            for i in range(7)
+        ])
+
+    def pages(self):
+        url = reverse('admin:prices_pokemonprice_changelist')
+        query = ''
+        while True:
+            changelist = self.client.get(url + query).context['cl']
+            yield [obs.pk for obs in changelist.result_list]
+            query = changelist.next_page_url()
+            if query is None:
+                return
+
+    def test_cursor_pages_through_equal_date_fetched(self):
+        with mock.patch.object(PokemonPriceAdmin, 'list_per_page', 2):
+            pages = list(self.pages())
+        expected = list(PokemonPrice.objects.order_by('-date_fetched', '-pk').values_list('pk', flat=True))
+        self.assertEqual(len(pages), 4)
+        self.assertEqual([pk for page in pages for pk in page], expected)
@@ -0,0 +1,309 @@
+import csv
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .history import update_rollups
+from .models import Card, PokemonPrice, WishlistItem
+from .price_cache import invalidate_prices, invalidate_wishlist
+
+# Streaming CSV/JSONL import and export of wishlists and price observations
+# (`manage.py export_data` / `import_data`, and the bot's wishlist file
+# commands). Exports walk the table with .iterator() and write row by row;
+# imports read, validate and bulk_create CHUNK_SIZE rows at a time, so memory
+# stays flat however many rows move.
+
+CHUNK_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+
+WISHLIST_FIELDS = ['discord_user_id', 'pokemon_name', 'set_name', 'card_id', 'max_price']
+PRICE_FIELDS = ['name', 'price', 'source', 'card_id', 'date_fetched']
+FIELDS = {'wishlist': WISHLIST_FIELDS, 'prices': PRICE_FIELDS}
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.written = 0
+        self.skipped = 0  # Already there (or duplicated within the file)
+        self.invalid = []  # [(line number, error)], only the first few are kept
+        self.invalid_count = 0
+
+    def record_invalid(self, line, error):
+        self.invalid_count += 1
+        if len(self.invalid) < 20:
+            self.invalid.append((line, str(error)))
+
+    def format(self):
+        return (
+            f"Read {self.read} rows: {self.written} written, {self.skipped} skipped as duplicates, "
+            f"{self.invalid_count} invalid"
+        )
+
+
+def format_for(filename, default='csv'):
+    for fmt in FORMATS:
+        if filename and filename.lower().endswith('.' + fmt):
+            return fmt
+    return default
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+# Export
+
+def export_queryset(dataset, user_id=None, since=None, source=None, card_id=None):
+    if dataset == 'wishlist':
+        queryset = WishlistItem.objects.order_by('discord_user_id', 'id')
+        if user_id is not None:
+            queryset = queryset.filter(discord_user_id=user_id)
+    else:
+        queryset = PokemonPrice.objects.order_by('id')
+        if since is not None:
+            queryset = queryset.filter(date_fetched__gte=since)
+        if source:
+            queryset = queryset.filter(source=source)
+        if card_id:
+            queryset = queryset.filter(card_id=card_id)
+    return queryset.values_list(*FIELDS[dataset])
+
+
+def write_rows(out, rows, fields, fmt):
+    """Write `rows` (tuples in `fields` order) to the text stream `out` one
+    at a time. Returns the number written."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow(['' if value is None else _plain(value) for value in row])
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps({field: _plain(value) for field, value in zip(fields, row)}) + '\n')
+            count += 1
+    return count
+
+
+def export_rows(out, dataset, fmt, **filters):
+    rows = export_queryset(dataset, **filters).iterator(chunk_size=CHUNK_SIZE)
+    return write_rows(out, rows, FIELDS[dataset], fmt)
+
+
+# Import
+
+def read_records(lines, fmt):
+    """(line number, dict) per record of a CSV (with a header row) or JSONL
+    stream, read lazily. Unparseable JSON lines come out as (line, None)."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def _text(record, field, max_length, required=True):
+    value = str(record.get(field) or '').strip()
+    if required and not value:
+        raise ValueError(f"{field} is required")
+    return value[:max_length]
+
+
+def _decimal(value, field, required=True):
+    if value in (None, ''):
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    try:
+        number = Decimal(str(value).strip().lstrip('$')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"{field} isn't a number: {value!r}")
+    if not number.is_finite() or number < 0:
+        raise ValueError(f"{field} must be a positive number: {value!r}")
+    return number
+
+
+def wishlist_item_from_record(record, user_id=None):
+    """A WishlistItem from an import record; `user_id` overrides the record's
+    discord_user_id (the bot imports into the sender's own wishlist)."""
+    if user_id is None:
+        try:
+            user_id = int(record.get('discord_user_id'))
+        except (TypeError, ValueError):
+            raise ValueError(f"discord_user_id isn't a number: {record.get('discord_user_id')!r}")
+    return WishlistItem(
+        discord_user_id=user_id,
+        card_id=_text(record, 'card_id', 255),
+        pokemon_name=_text(record, 'pokemon_name', 100, required=False),
+        set_name=_text(record, 'set_name', 255, required=False),
+        max_price=_decimal(record.get('max_price'), 'max_price', required=False),
+    )
+
+
+def price_from_record(record):
+    fetched = record.get('date_fetched')
+    date_fetched = parse_datetime(str(fetched).strip()) if fetched else None
+    if fetched and date_fetched is None:
+        raise ValueError(f"date_fetched isn't a date/time: {fetched!r}")
+    if date_fetched is not None and date_fetched.tzinfo is None:
+        date_fetched = date_fetched.replace(tzinfo=dt_timezone.utc)
+    return PokemonPrice(
+        name=_text(record, 'name', 100),
+        price=_decimal(record.get('price'), 'price'),
+        source=_text(record, 'source', 100, required=False) or 'eBay',
+        card_id=_text(record, 'card_id', 50, required=False),
+        date_fetched=date_fetched or datetime.now(dt_timezone.utc),
+    )
+
+
+def valid_objects(records, build, stats):
+    for line, record in records:
+        stats.read += 1
+        if record is None:
+            stats.record_invalid(line, "Not a JSON object")
+            continue
+        try:
+            yield build(record)
+        except ValueError as e:
+            stats.record_invalid(line, e)
+
+
+def fill_card_names(items, stats):
+    """Fill in missing pokemon_name/set_name from the local catalog, one query
+    per chunk. Items whose card isn't in the catalog either are dropped: the
+    matcher needs a name to look for."""
+    missing = {item.card_id for item in items if not (item.pokemon_name and item.set_name)}
+    if not missing:
+        return items
+    catalog = {
+        card_id: (name, set_name)
+        for card_id, name, set_name in Card.objects.filter(card_id__in=missing).values_list('card_id', 'name', 'card_set__name')
+    }
+    kept = []
+    for item in items:
+        if item.card_id in missing:
+            if item.card_id not in catalog:
+                stats.record_invalid('-', f"{item.card_id}: no pokemon_name given and not in the local card catalog")
+                continue
+            name, set_name = catalog[item.card_id]
+            item.pokemon_name = item.pokemon_name or name[:100]
+            item.set_name = item.set_name or set_name[:255]
+        kept.append(item)
+    return kept
+
+
+def import_wishlist(lines, fmt, update=True, user_id=None, stats=None):
+    """Upsert wishlist rows (all into `user_id`'s wishlist, if given). An
+    existing (user, card) row gets the file's name/set, and its max price if
+    the row has a max_price column/key, when `update`; it's left alone
+    otherwise. Returns the ImportStats and the written items."""
+    stats = stats or ImportStats()
+    users = set()
+    written = []
+
+    def build(record):
+        # A row without max_price says nothing about it: the existing threshold stays
+        return wishlist_item_from_record(record, user_id), 'max_price' in record
+
+    for chunk in chunked(valid_objects(read_records(lines, fmt), build, stats), CHUNK_SIZE):
+        # The last row for a (user, card) in a chunk wins
+        unique = {(item.discord_user_id, item.card_id): (item, sets_max) for item, sets_max in chunk}
+        stats.skipped += len(chunk) - len(unique)
+        sets_max = {key for key, (_, given) in unique.items() if given}
+        items = fill_card_names([item for item, _ in unique.values()], stats)
+        if not update:
+            existing = set(
+                WishlistItem.objects.filter(
+                    discord_user_id__in={item.discord_user_id for item in items},
+                    card_id__in={item.card_id for item in items},
+                ).values_list('discord_user_id', 'card_id')
+            )
+            stats.skipped += sum((item.discord_user_id, item.card_id) in existing for item in items)
+            items = [item for item in items if (item.discord_user_id, item.card_id) not in existing]
+        with transaction.atomic():
+            if update:
+                with_max = [item for item in items if (item.discord_user_id, item.card_id) in sets_max]
+                without_max = [item for item in items if (item.discord_user_id, item.card_id) not in sets_max]
+                for group, fields in ((with_max, ['pokemon_name', 'set_name', 'max_price']),
+                                      (without_max, ['pokemon_name', 'set_name'])):
+                    if group:
+                        WishlistItem.objects.bulk_create(
+                            group, update_conflicts=True, unique_fields=['discord_user_id', 'card_id'], update_fields=fields,
+                        )
+            else:
+                WishlistItem.objects.bulk_create(items, ignore_conflicts=True)
+        stats.written += len(items)
+        users.update(item.discord_user_id for item in items)
+        if user_id is not None:
+            if update and without_max:
+                # Hand back the max prices those rows kept
+                kept = dict(
+                    WishlistItem.objects.filter(discord_user_id=user_id, card_id__in=[item.card_id for item in without_max])
+                    .values_list('card_id', 'max_price')
+                )
+                for item in without_max:
+                    item.max_price = kept.get(item.card_id)
+            written.extend(items)  # One user's wishlist, small enough to hand back
+    for user in users:
+        invalidate_wishlist(user)
+    return stats, written
+
+
+def import_prices(lines, fmt, skip_existing=True, rollups=True, stats=None):
+    """Append price observations. With `skip_existing`, rows matching an
+    existing (name, source, date_fetched) are skipped, so importing the same
+    export twice doesn't double it. Rollups for the touched hours/days are
+    refreshed per chunk unless `rollups` is False (rebuild them afterwards
+    with `compact_prices --rebuild-rollups`)."""
+    stats = stats or ImportStats()
+    for chunk in chunked(valid_objects(read_records(lines, fmt), price_from_record, stats), CHUNK_SIZE):
+        keys = {}
+        for obs in chunk:
+            keys.setdefault((obs.name, obs.source, obs.date_fetched), obs)
+        stats.skipped += len(chunk) - len(keys)
+        if skip_existing:
+            existing = set(
+                PokemonPrice.objects.filter(
+                    name__in={name for name, _, _ in keys},
+                    date_fetched__gte=min(moment for _, _, moment in keys),
+                    date_fetched__lte=max(moment for _, _, moment in keys),
+                ).values_list('name', 'source', 'date_fetched')
+            )
+            stats.skipped += sum(key in existing for key in keys)
+            keys = {key: obs for key, obs in keys.items() if key not in existing}
+        observations = list(keys.values())
+        with transaction.atomic():
+            PokemonPrice.objects.bulk_create(observations)
+            if rollups:
+                update_rollups(observations)
+        invalidate_prices({obs.card_id for obs in observations if obs.card_id})
+        stats.written += len(observations)
+    return stats
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('cards/<str:card_id>/price', views.card_latest_price, name='card-latest-price'),
+    path('cards/<str:card_id>/stats', views.card_price_stats, name='card-price-stats'),
+    path('cards/<str:card_id>/history', views.card_price_history, name='card-price-history'),
+    path('wishlists/<int:user_id>', views.wishlist_prices, name='wishlist-prices'),
+]
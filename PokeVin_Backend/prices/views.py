@@ -1,3 +1,173 @@
-from django.shortcuts import render
+import hashlib
+import hmac
+from datetime import timedelta
+from decimal import Decimal
+from functools import wraps
 
-# Create your views here.
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min, OuterRef, Subquery
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .history import price_history
+from .metrics import collect
+from .models import PokemonPrice, PriceRollup, WishlistItem
+from .price_cache import card_key, price_cache, versions, wishlist_key
+
+
+def _has_api_token(request):
+    token = getattr(settings, 'API_TOKEN', '')
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def private(view):
+    """Only for staff users logged in to the admin, or requests with the API token."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not (request.user.is_staff or _has_api_token(request)):
+            response = JsonResponse({'error': 'Authentication required'}, status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, private=True)
+        return response
+    return wrapper
+
+
+@private
+def metrics_view(request):
+    # Prometheus scrape target: scraper stage timings from every PokeVin process
+    return HttpResponse(collect().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Read-only JSON price API. Each endpoint is one aggregated query, cached in
+# the shared 'prices' cache under the versions of the data it reads (see
+# price_cache.py), with ETags so polling dashboards mostly get 304s.
+
+API_CACHE_TIMEOUT = 3600  # Stale entries are never read again, this just frees them
+DEFAULT_DAYS = 30  # Raw observations are kept PRICE_RAW_RETENTION_DAYS anyway
+
+
+def price_api(version_keys):
+    """GET-only JSON view cached under `version_keys(request, ...)`'s versions.
+    The view returns a JSON-able payload, or None for a 404."""
+    def decorator(build):
+        def etag(request, *args, **kwargs):
+            if not hasattr(request, '_price_api_etag'):
+                current = versions(version_keys(request, *args, **kwargs))
+                fingerprint = request.get_full_path() + repr(sorted(current.items()))
+                request._price_api_etag = hashlib.md5(fingerprint.encode('utf-8')).hexdigest()
+            return request._price_api_etag
+
+        @wraps(build)
+        @require_GET
+        @condition(etag_func=etag)
+        def view(request, *args, **kwargs):
+            cache = price_cache()
+            cache_key = 'api:' + etag(request, *args, **kwargs)
+            payload = cache.get(cache_key)
+            if payload is None:
+                payload = build(request, *args, **kwargs)
+                if payload is None:
+                    return JsonResponse({'error': 'Not found'}, status=404)
+                cache.set(cache_key, payload, API_CACHE_TIMEOUT)
+            response = JsonResponse(payload)
+            response['Cache-Control'] = 'no-cache'  # Always revalidate, it's usually a 304
+            return response
+        return view
+    return decorator
+
+
+def _days(request):
+    try:
+        return max(1, int(request.GET.get('days', DEFAULT_DAYS)))
+    except ValueError:
+        return DEFAULT_DAYS
+
+
+def _period(request):
+    period = request.GET.get('period', PriceRollup.DAY)
+    return period if period in (PriceRollup.HOUR, PriceRollup.DAY) else PriceRollup.DAY
+
+
+def _card_versions(request, card_id):
+    return [card_key(card_id)]
+
+
+@price_api(_card_versions)
+def card_latest_price(request, card_id):
+    latest = (
+        PokemonPrice.objects.filter(card_id=card_id)
+        .order_by('-date_fetched')
+        .values('name', 'price', 'source', 'date_fetched')
+        .first()
+    )
+    if latest is None:
+        return None
+    return {'card_id': card_id, **latest}
+
+
+@price_api(_card_versions)
+def card_price_stats(request, card_id):
+    days = _days(request)
+    stats = PokemonPrice.objects.filter(
+        card_id=card_id, date_fetched__gte=timezone.now() - timedelta(days=days)
+    ).aggregate(
+        count=Count('id'), min_price=Min('price'), max_price=Max('price'), avg_price=Avg('price'),
+        first_seen=Min('date_fetched'), last_seen=Max('date_fetched'),
+    )
+    if not stats['count']:
+        return None
+    if stats['avg_price'] is not None:
+        stats['avg_price'] = Decimal(stats['avg_price']).quantize(Decimal('0.01'))
+    return {'card_id': card_id, 'days': days, **stats}
+
+
+@price_api(_card_versions)
+def card_price_history(request, card_id):
+    # From the hourly/daily rollups, which outlive the raw rows
+    days, period = _days(request), _period(request)
+    source = request.GET.get('source', 'eBay')
+    history = list(
+        price_history(card_id, source, period, timezone.now() - timedelta(days=days))
+        .values('bucket_start', 'count', 'min_price', 'max_price', 'median_price')
+    )
+    return {'card_id': card_id, 'source': source, 'period': period, 'days': days, 'history': history}
+
+
+def _wishlist_versions(request, user_id):
+    # The user's wishlist plus every card on it; the card list itself is cached
+    # per wishlist version so a revalidation doesn't touch the database
+    cache = price_cache()
+    wishlist_version = versions([wishlist_key(user_id)])[wishlist_key(user_id)]
+    cards_key = f'wishlist-cards:{user_id}:{wishlist_version}'
+    card_ids = cache.get(cards_key)
+    if card_ids is None:
+        card_ids = list(WishlistItem.objects.filter(discord_user_id=user_id).values_list('card_id', flat=True))
+        cache.set(cards_key, card_ids, API_CACHE_TIMEOUT)
+    return [wishlist_key(user_id)] + [card_key(card_id) for card_id in card_ids]
+
+
+@private
+@price_api(_wishlist_versions)
+def wishlist_prices(request, user_id):
+    latest = PokemonPrice.objects.filter(card_id=OuterRef('card_id')).order_by('-date_fetched')
+    items = list(
+        WishlistItem.objects.filter(discord_user_id=user_id)
+        .annotate(
+            latest_price=Subquery(latest.values('price')[:1]),
+            latest_seen=Subquery(latest.values('date_fetched')[:1]),
+            latest_listing=Subquery(latest.values('name')[:1]),
+        )
+        .order_by('id')
+        .values('pokemon_name', 'set_name', 'card_id', 'max_price', 'latest_price', 'latest_seen', 'latest_listing')
+    )
+    for item in items:
+        item['below_max_price'] = (
+            item['latest_price'] is not None and item['max_price'] is not None
+            and item['latest_price'] <= item['max_price']
+        )
+    return {'discord_user_id': user_id, 'items': items}
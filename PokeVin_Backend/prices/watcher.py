@@ -0,0 +1,262 @@
+import asyncio
+import random
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .listing_parser import canonical_listing_url
+from .models import WatchedListing
+from .resilience import CIRCUIT_OPEN, REMOVED, failure_kind
+from .scraper import scrape_listing, save_to_db
+
+# Re-scrapes watched listings on their own adaptive schedules. The
+# (active, next_check_at) index on WatchedListing is the priority queue, so the
+# schedule survives restarts and can be shared with a separate worker process.
+
+LEASE_SECONDS = 300  # A picked listing isn't handed out again while it's being scraped
+MAX_FAILURES = 5  # Consecutive failures before a listing stops being watched
+MAX_IDLE_SECONDS = 30  # Look for newly due listings at least this often
+
+
+def watch_setting(name, default):
+    return getattr(settings, f'SCRAPER_WATCH_{name}', default)
+
+
+def next_interval(listing, new_price, now):
+    """Adaptive interval: shrink when the price moves, grow when it doesn't,
+    and never sleep through the end of an auction."""
+    min_interval = watch_setting('MIN_INTERVAL', 300)
+    max_interval = watch_setting('MAX_INTERVAL', 6 * 3600)
+    threshold = watch_setting('CHANGE_THRESHOLD', 0.01)
+
+    change = 0.0
+    if listing.last_price:
+        change = abs(float(new_price - listing.last_price)) / float(listing.last_price)
+    volatility = 0.3 * change + 0.7 * listing.volatility
+
+    interval = listing.interval_seconds
+    if change >= threshold:
+        interval *= 0.5
+    elif volatility < threshold:
+        interval *= 1.25
+
+    if listing.ends_at:
+        # Check about four times as often as the time left, so the last
+        # minutes of an auction get the closest look
+        time_left = (listing.ends_at - now).total_seconds()
+        if time_left > 0:
+            interval = min(interval, time_left / 4)
+
+    return int(min(max(interval, min_interval), max_interval)), volatility
+
+
+def with_jitter(seconds):
+    # Spreads checks out so listings added together don't stay in lockstep
+    jitter = watch_setting('JITTER', 0.1)
+    return seconds * random.uniform(1 - jitter, 1 + jitter)
+
+
+@sync_to_async
+def add_watch(url, added_by=None, ends_at=None):
+    # Canonical, so the same listing linked with different tracking parameters is one watch
+    listing, created = WatchedListing.objects.update_or_create(
+        url=canonical_listing_url(url),
+        defaults={
+            'active': True,
+            'failures': 0,
+            'ends_at': ends_at,
+            'next_check_at': timezone.now(),
+            'interval_seconds': watch_setting('DEFAULT_INTERVAL', 3600),
+        },
+        create_defaults={
+            'added_by': added_by,
+            'next_check_at': timezone.now(),
+            'ends_at': ends_at,
+            'interval_seconds': watch_setting('DEFAULT_INTERVAL', 3600),
+        },
+    )
+    return listing, created
+
+
+@sync_to_async
+def remove_watch(url):
+    return WatchedListing.objects.filter(url__in={url, canonical_listing_url(url)}, active=True).update(active=False) > 0
+
+
+@sync_to_async
+def lease_due_listings(limit):
+    # Pop up to `limit` due listings off the queue, pushing them back by the lease
+    now = timezone.now()
+    with transaction.atomic():
+        due = list(
+            WatchedListing.objects
+            .filter(active=True, next_check_at__lte=now)
+            .order_by('next_check_at')[:limit]
+        )
+        if due:
+            WatchedListing.objects.filter(pk__in=[listing.pk for listing in due]).update(
+                next_check_at=now + timedelta(seconds=LEASE_SECONDS)
+            )
+    return due
+
+
+@sync_to_async
+def seconds_until_next_due():
+    next_check_at = (
+        WatchedListing.objects.filter(active=True)
+        .order_by('next_check_at')
+        .values_list('next_check_at', flat=True)
+        .first()
+    )
+    if next_check_at is None:
+        return None
+    return max(0.0, (next_check_at - timezone.now()).total_seconds())
+
+
+@sync_to_async
+def record_success(listing, name, price):
+    now = timezone.now()
+    interval, volatility = next_interval(listing, price, now)
+    listing.name = name[:255]
+    listing.last_price = price
+    listing.volatility = volatility
+    listing.interval_seconds = interval
+    listing.last_checked_at = now
+    listing.failures = 0
+    listing.next_check_at = now + timedelta(seconds=with_jitter(interval))
+    # Never `active` unless it changes here: an !unwatch during the scrape must stick
+    fields = ['name', 'last_price', 'volatility', 'interval_seconds', 'last_checked_at', 'failures', 'next_check_at']
+    if listing.ends_at and listing.ends_at <= now:
+        listing.active = False  # That was the final price
+        fields.append('active')
+    listing.save(update_fields=fields)
+
+
+@sync_to_async
+def record_failure(listing, kind=None):
+    now = timezone.now()
+    listing.last_checked_at = now
+    if kind == CIRCUIT_OPEN:
+        # eBay was failing for everyone, not this listing: try again later
+        # without counting it against the listing
+        listing.next_check_at = now + timedelta(seconds=with_jitter(listing.interval_seconds))
+        listing.save(update_fields=['last_checked_at', 'next_check_at'])
+        return
+    listing.failures += 1
+    # Back off exponentially, a dead listing shouldn't eat the budget
+    backoff = min(listing.interval_seconds * 2 ** listing.failures, watch_setting('MAX_INTERVAL', 6 * 3600))
+    listing.next_check_at = now + timedelta(seconds=with_jitter(backoff))
+    fields = ['last_checked_at', 'failures', 'next_check_at']
+    # A removed listing is never coming back
+    if listing.failures >= MAX_FAILURES or kind == REMOVED:
+        listing.active = False
+        fields.append('active')
+    listing.save(update_fields=fields)
+
+
+class WatchScheduler:
+    """Runs due checks under a global per-minute scrape budget.
+
+    `on_result(listing, name, price, old_price)` is awaited after every
+    successful check.
+    """
+
+    def __init__(self, budget_per_minute=None, concurrency=None, on_result=None):
+        self.budget_per_minute = budget_per_minute or watch_setting('BUDGET_PER_MINUTE', 30)
+        self.concurrency = concurrency or watch_setting('CONCURRENCY', 2)
+        self.on_result = on_result
+        self._tokens = float(self.budget_per_minute)
+        self._refilled_at = time.monotonic()
+        self._running = False
+        self._wakeup = None
+        self._tasks = set()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.budget_per_minute),
+            self._tokens + (now - self._refilled_at) * self.budget_per_minute / 60,
+        )
+        self._refilled_at = now
+
+    def wake(self):
+        # Called after adding a watch so it gets its first check right away
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        self._running = True
+        self._wakeup = asyncio.Event()
+        print(f"Watch scheduler running ({self.budget_per_minute} scrapes/min)")
+
+        while self._running:
+            # Cleared before looking, so a wake-up that lands mid-iteration isn't lost
+            self._wakeup.clear()
+            self._refill()
+            free = min(int(self._tokens), self.concurrency - len(self._tasks))
+            due = await lease_due_listings(free) if free > 0 else []
+
+            for listing in due:
+                self._tokens -= 1
+                task = asyncio.create_task(self._check(listing))
+                self._tasks.add(task)
+                task.add_done_callback(self._check_done)
+
+            await self._sleep(due)
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _check_done(self, task):
+        self._tasks.discard(task)
+        self.wake()  # A slot is free again
+
+    async def _sleep(self, just_started):
+        if just_started:
+            wait = 0  # There may be more due listings waiting for budget
+        elif self._tokens < 1:
+            wait = (1 - self._tokens) * 60 / self.budget_per_minute
+        else:
+            next_due = await seconds_until_next_due()
+            wait = MAX_IDLE_SECONDS if next_due is None else min(next_due, MAX_IDLE_SECONDS)
+
+        if len(self._tasks) >= self.concurrency:
+            wait = MAX_IDLE_SECONDS  # A finishing check wakes us up
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _check(self, listing):
+        try:
+            await self._check_listing(listing)
+        except Exception as e:
+            # Saving the outcome or on_result failed: nobody awaits this task,
+            # so say so here; the lease runs out and the listing is checked again
+            print(f"Error checking watched listing {listing.url}: {e}")
+
+    async def _check_listing(self, listing):
+        old_price = listing.last_price
+        try:
+            # Always a fresh scrape, the schedule is what decides how stale a price may get
+            name, price = await scrape_listing(listing.url, use_cache=False)
+            await save_to_db(name, price)
+        except Exception as e:
+            print(f"Error re-scraping watched listing {listing.url}: {e}")
+            await record_failure(listing, failure_kind(e))
+            return
+
+        await record_success(listing, name, price)
+        if self.on_result is not None:
+            await self.on_result(listing, name, price, old_price)
+
+    def stop(self):
+        self._running = False
+        self.wake()
+
+
+watch_scheduler = WatchScheduler()
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import socket
+
+from django.conf import settings
+from django.db import OperationalError, connections
+
+from .browser_pool import browser_pool
+from .http_client import http_client
+from .jobs import complete_job, fail_job, lease_jobs, prune_jobs
+from .metrics import metrics, publish, publish_periodically
+from .resilience import CIRCUIT_OPEN, RETRYABLE, failure_kind
+from .scraper import scrape_listing, save_to_db
+from .writer import price_writer
+
+
+def use_sqlite_tuning():
+    """Give this process's database connection the SQLITE_TUNING options
+    whether or not they're on: several workers lease jobs at once, and
+    without WAL and IMMEDIATE transactions the lease's read-then-update
+    transactions fail with "database is locked" instead of waiting."""
+    connection = connections['default']
+    if connection.vendor == 'sqlite':
+        connection.close()  # The options apply from the next connection
+        connection.settings_dict['OPTIONS'] = {
+            **connection.settings_dict.get('OPTIONS', {}), **settings.SQLITE_TUNING_OPTIONS,
+        }
+
+
+class ScrapeWorker:
+    """One worker process: leases jobs from the queue and scrapes up to
+    `concurrency` of them at a time with its own browser pool.
+
+    Every job's price is saved like any other scrape; the bot reports the
+    result once the job is marked done. Network errors, timeouts and open
+    circuits send the job back to the queue with a backoff, anything else
+    fails it.
+    """
+
+    def __init__(self, name=None, concurrency=None, poll_interval=None):
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency or getattr(settings, 'SCRAPE_WORKER_CONCURRENCY', None) or browser_pool.size
+        self.poll_interval = poll_interval or getattr(settings, 'SCRAPE_WORKER_POLL_INTERVAL', 1.0)
+        self.done = 0
+        self.failed = 0
+        self.db_retry_delay = getattr(settings, 'SCRAPE_WORKER_DB_RETRY_DELAY', 1.0)
+        self.db_max_retry_delay = getattr(settings, 'SCRAPE_WORKER_DB_MAX_RETRY_DELAY', 30.0)
+        self._running = False
+        self._wakeup = None
+        self._tasks = set()
+
+    async def run(self):
+        self._running = True
+        self._wakeup = asyncio.Event()
+        publisher = asyncio.create_task(publish_periodically(f'scrape_worker-{self.name}'))
+        await prune_jobs()
+        print(f"Scrape worker {self.name} running ({self.concurrency} at a time)")
+        db_failures = 0
+        try:
+            while self._running:
+                self._wakeup.clear()
+                try:
+                    jobs = await lease_jobs(self.name, self.concurrency - len(self._tasks))
+                except OperationalError as e:
+                    # Locked for longer than the busy timeout: back off and lease again
+                    delay = min(self.db_retry_delay * 2 ** db_failures, self.db_max_retry_delay)
+                    db_failures += 1
+                    print(f"Scrape worker {self.name} couldn't lease jobs ({e}), retrying in {delay:.0f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                db_failures = 0
+                for job in jobs:
+                    task = asyncio.create_task(self._run_job(job))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._job_done)
+                if jobs and len(self._tasks) < self.concurrency:
+                    continue  # There may be more waiting
+                try:
+                    # A finishing job frees a slot and wakes us early
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            publisher.cancel()
+            await browser_pool.stop()
+            await http_client.close()
+            await price_writer.close()
+            publish(f'scrape_worker-{self.name}')
+
+    def _job_done(self, task):
+        self._tasks.discard(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run_job(self, job):
+        try:
+            name, price = await scrape_listing(job.url)
+            await save_to_db(name, price)
+        except Exception as e:
+            kind = failure_kind(e)
+            retry = kind in RETRYABLE or kind == CIRCUIT_OPEN
+            print(f"Job {job.pk} ({job.url}) failed, attempt {job.attempts}/{job.max_attempts}: {e}")
+            await fail_job(job, e, kind, retry, getattr(e, 'retry_after', None))
+            metrics.inc('pokevin_scrape_jobs_total', outcome=kind or 'error')
+            self.failed += 1
+            return
+        await complete_job(job, name, price)
+        metrics.inc('pokevin_scrape_jobs_total', outcome='success')
+        self.done += 1
+
+    def stop(self):
+        # Finish the jobs in hand, lease no more
+        self._running = False
+        if self._wakeup is not None:
+            self._wakeup.set()
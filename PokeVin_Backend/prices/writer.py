@@ -0,0 +1,99 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .history import record_observations
+from .metrics import metrics
+
+
+class PriceWriter:
+    """Write-behind buffer for scraped prices.
+
+    `add()` returns immediately; observations are written in one transaction
+    per batch, whenever `batch_size` are waiting or `flush_interval` seconds
+    have passed. Call `close()` before the event loop ends to flush the rest.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_buffer=None):
+        self.batch_size = batch_size or getattr(settings, 'PRICE_WRITE_BATCH_SIZE', 200)
+        self.flush_interval = flush_interval or getattr(settings, 'PRICE_WRITE_FLUSH_INTERVAL', 1.0)
+        # If the DB stays unavailable, drop the oldest prices rather than grow forever
+        self.max_buffer = max_buffer or self.batch_size * 50
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self._buffer = []
+        self._task = None
+        self._wakeup = None
+        self._lock = None
+        self._loop = None
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def _start(self):
+        # asyncio primitives belong to one loop; management commands each run their own
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = loop.create_task(self._run())
+
+    def add(self, name, price, source='eBay', card_id=''):
+        self._start()
+        self._buffer.append((name, price, source, card_id))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if self._lock is None:
+            return
+        async with self._lock:
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:self.batch_size]
+                try:
+                    with metrics.stage('db_write'):
+                        await sync_to_async(record_observations)(batch)
+                except Exception as e:
+                    print(f"Error saving {len(batch)} prices, will retry: {e}")
+                    self._buffer[:0] = batch
+                    overflow = len(self._buffer) - self.max_buffer
+                    if overflow > 0:
+                        del self._buffer[:overflow]
+                        self.dropped += overflow
+                    return
+                self.written += len(batch)
+                self.batches += 1
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+price_writer = PriceWriter()